@@ -0,0 +1,485 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 Vinay Sajip.
+# Licensed to the Python Software Foundation under a contributor agreement.
+# See LICENSE.txt and CONTRIBUTORS.txt.
+#
+"""
+Locators for use in asyncio applications.
+
+The locators here are counterparts of :class:`SimpleScrapingLocator` and
+:class:`PyPIJSONLocator` whose ``get_project()`` and ``locate()`` methods
+are coroutines. Network I/O is done using asyncio streams, so no threads are
+tied up while waiting for responses.
+
+This module requires Python 3.5 or later.
+"""
+import asyncio
+import base64
+import json
+import logging
+import os
+import socket
+import weakref
+
+from .compat import (urljoin, urlparse, url2pathname, quote, unquote,
+                     HTTPError)
+from .locators import (SimpleScrapingLocator, PyPIJSONLocator, Page, _Crawl,
+                       PartialResult, CHARSET, HTML_CONTENT_TYPE, _MISSING)
+from .util import ensure_slash, parse_credentials, HostScheduler
+from . import DistlibException
+
+logger = logging.getLogger(__name__)
+
+MAX_REDIRECTS = 5
+
+
+class HTTPResponse(object):
+    """
+    The parts of an HTTP response which the locators need.
+    """
+    def __init__(self, url, status, headers, body):
+        self.url = url
+        self.status = status
+        self.headers = headers  # keys are lower-cased
+        self.body = body
+
+
+async def _read_body(reader, headers):
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        parts = []
+        while True:
+            line = await reader.readline()
+            size = int(line.split(b';', 1)[0].strip(), 16)
+            if size == 0:
+                # skip any trailers
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                break
+            parts.append(await reader.readexactly(size))
+            await reader.readline()     # the CRLF after the chunk
+        result = b''.join(parts)
+    elif 'content-length' in headers:
+        result = await reader.readexactly(int(headers['content-length']))
+    else:
+        result = await reader.read()
+    return result
+
+
+async def _request(url, headers, ssl_context):
+    parsed = urlparse(url)
+    scheme, netloc, path, params, query, _ = parsed
+    if scheme not in ('http', 'https'):
+        raise DistlibException('unsupported URL scheme: %r' % url)
+    host = parsed.hostname
+    # The Host header mustn't include any credentials, and IPv6 addresses
+    # need their brackets
+    host_header = '[%s]' % host if ':' in host else host
+    port = parsed.port
+    if port:
+        host_header += ':%d' % port
+    else:
+        port = 443 if scheme == 'https' else 80
+    username, password, _ = parse_credentials(netloc)
+    if username is not None and 'Authorization' not in headers:
+        credentials = '%s:%s' % (unquote(username), unquote(password or ''))
+        credentials = base64.b64encode(credentials.encode('utf-8'))
+        headers = dict(headers,
+                       Authorization='Basic %s' % credentials.decode('ascii'))
+    if scheme == 'https':
+        kwargs = {'ssl': ssl_context or True, 'server_hostname': host}
+    else:
+        kwargs = {}
+    reader, writer = await asyncio.open_connection(host, port, **kwargs)
+    try:
+        selector = path or '/'
+        if params:
+            selector += ';' + params
+        if query:
+            selector += '?' + query
+        lines = ['GET %s HTTP/1.1' % selector, 'Host: %s' % host_header,
+                 'Connection: close']
+        for k, v in headers.items():
+            lines.append('%s: %s' % (k, v))
+        lines.extend(['', ''])
+        writer.write('\r\n'.join(lines).encode('latin-1'))
+        status_line = await reader.readline()
+        parts = status_line.decode('latin-1').split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+            raise DistlibException('bad status line from %s: %r' %
+                                   (url, status_line))
+        status = int(parts[1])
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            k, _, v = line.decode('latin-1').partition(':')
+            response_headers[k.strip().lower()] = v.strip()
+        if status in (204, 304) or 100 <= status < 200:
+            body = b''
+        else:
+            body = await _read_body(reader, response_headers)
+    finally:
+        writer.close()
+    return HTTPResponse(url, status, response_headers, body)
+
+
+async def http_get(url, headers=None, timeout=None, ssl_context=None):
+    """
+    Make an HTTP GET request, following any redirections.
+
+    :param url: The URL to get.
+    :param headers: A dictionary of request headers.
+    :param timeout: The timeout, in seconds, for each request.
+    :param ssl_context: The SSL context to use for HTTPS requests.
+    :return: An :class:`HTTPResponse` whose ``url`` attribute is the final
+             URL, after any redirections.
+    """
+    headers = dict(headers or {})
+    headers.setdefault('Accept-Encoding', 'identity')
+    for i in range(MAX_REDIRECTS + 1):
+        result = await asyncio.wait_for(_request(url, headers, ssl_context),
+                                        timeout)
+        location = result.headers.get('location')
+        if result.status not in (301, 302, 303, 307, 308) or not location:
+            break
+        url = urljoin(url, location)
+    else:
+        raise DistlibException('too many redirections: %s' % url)
+    return result
+
+
+class AsyncLocatorMixin(object):
+    """
+    Implements coroutine versions of the :class:`Locator` methods which
+    do I/O, in terms of a coroutine ``_get_project()``.
+    """
+
+    #: The maximum number of concurrent requests made to any one host.
+    max_per_host = 5
+
+    ssl_context = None
+
+    def _get_semaphore(self, host):
+        # A semaphore can only be used in one event loop, so each loop the
+        # locator is used in has semaphores of its own. No locking is needed
+        # for a loop's semaphores, as they're only used in its thread.
+        loops = self.__dict__.setdefault('_semaphores',
+                                         weakref.WeakKeyDictionary())
+        semaphores = loops.setdefault(asyncio.get_event_loop(), {})
+        if host not in semaphores:
+            semaphores[host] = asyncio.Semaphore(self.max_per_host)
+        return semaphores[host]
+
+    async def http_get(self, url, headers=None):
+        """
+        Get an URL, limiting the number of concurrent requests to its host.
+        The locator's :class:`~distlib.util.HostScheduler` is used to limit
+        the rate of requests and to retry them after transient errors.
+        """
+        host = urlparse(url).hostname
+        scheduler = self.scheduler
+        attempt = 0
+        while True:
+            delay = scheduler.reserve(host)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            result = None
+            try:
+                async with self._get_semaphore(host):
+                    result = await http_get(url, headers, self.timeout,
+                                            self.ssl_context)
+            except asyncio.TimeoutError:
+                error = socket.timeout('timed out: %s' % url)
+            except OSError as e:
+                error = e
+            except BaseException:
+                # e.g. a malformed response, or cancellation, which says
+                # nothing about whether the host is working
+                scheduler.end_trial(host)
+                raise
+            else:
+                if result.status not in scheduler.retry_codes:
+                    scheduler.record_success(host)
+                    return result
+                hdrs = {}
+                if 'retry-after' in result.headers:
+                    hdrs['Retry-After'] = result.headers['retry-after']
+                error = HTTPError(url, result.status,
+                                  'HTTP status %s' % result.status, hdrs, None)
+            delay = scheduler.retry_delay(attempt, error)
+            if delay is None or not scheduler.is_available(host):
+                scheduler.record_failure(host)
+                if result is None:
+                    raise error
+                return result
+            attempt += 1
+            logger.debug('Retrying %s in %.2f seconds: %s', url, delay, error)
+            await asyncio.sleep(delay)
+
+    async def get_project(self, name):
+        """
+        For a given project, get a dictionary mapping available versions to
+        Distribution instances.
+
+        This awaits _get_project to do all the work, and just implements a
+        caching layer on top.
+        """
+        return await self._fetch_project(name, None)
+
+    async def _fetch_project(self, name, matcher):
+        """
+        Get a project, using the cache where possible. The matcher for the
+        requirement being located (or None) is passed to _get_project,
+        rather than being set for the thread as the synchronous locators do,
+        as several coroutines may be locating distributions in one thread.
+        """
+        result = self._get_cached(name)
+        if result is _MISSING:
+            result = await self._get_project(name, matcher)
+            if (self._may_cache(matcher) and
+                not isinstance(result, PartialResult)):
+                self._set_cached(name, result)
+        return result
+
+    async def locate(self, requirement, prereleases=False):
+        """
+        Find the most recent distribution which matches the given
+        requirement. See :meth:`Locator.locate`.
+
+        If the distribution's metadata is got from its archive, this is done
+        in the event loop's default executor, as it uses blocking I/O.
+        """
+        r, matcher = self._parse_requirement(requirement)
+        versions = await self._fetch_project(r.name, matcher)
+        result = self._select_version(r, matcher, versions, prereleases)
+        if result and self._get_metadata_fetcher(result) is not None:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, self._fetch_metadata, result)
+        return result
+
+
+class AsyncSimpleScrapingLocator(AsyncLocatorMixin, SimpleScrapingLocator):
+    """
+    An asyncio counterpart of :class:`SimpleScrapingLocator`. Pages for a
+    project are fetched concurrently, subject to a limit on the number of
+    concurrent requests made to any one host.
+    """
+    def __init__(self, url, timeout=None, max_per_host=5, **kwargs):
+        """
+        Initialise an instance.
+        :param url: The root URL to use for scraping.
+        :param timeout: The timeout, in seconds, to be applied to requests.
+                        This defaults to ``None`` (no timeout specified).
+        :param max_per_host: The maximum number of concurrent requests to
+                             make to any one host. This defaults to 5.
+        :param kwargs: Passed to the superclass.
+        """
+        super(AsyncSimpleScrapingLocator, self).__init__(url, timeout,
+                                                         **kwargs)
+        self.max_per_host = max_per_host
+
+    async def _get_project(self, name, matcher=None):
+        url = urljoin(self.base_url, '%s/' % quote(name))
+        crawl = _Crawl(name, self._stop_matcher(matcher))
+        pages = {}
+        logger.debug('Queueing %s', url)
+        pending = set([asyncio.ensure_future(self._fetch(crawl, url, pages))])
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                for link in task.result():
+                    logger.debug('Queueing %s', link)
+                    pending.add(asyncio.ensure_future(
+                        self._fetch(crawl, link, pages)))
+        return crawl.result
+
+    async def _fetch(self, crawl, url, pages):
+        """
+        Get the HTML page for an URL which is part of a crawl, and examine
+        its links for download candidates. Return a list of the links which
+        should be scraped in turn.
+        """
+        result = []
+        try:
+            page = await self.get_page(url, pages)
+            if page is not None:
+                for link, rel in page.links:
+                    if crawl.stopped:
+                        # a version the requirement pins has been found
+                        result = []
+                        break
+                    if crawl.is_new(link):
+                        if (not self._process_download(link, crawl) and
+                            self._should_queue(link, url, rel)):
+                            result.append(link)
+        except Exception as e:
+            logger.exception('Processing failed: %s: %s', url, e)
+        return result
+
+    def _make_page(self, data, content_type, final_url):
+        encoding = 'utf-8'
+        m = CHARSET.search(content_type)
+        if m:
+            encoding = m.group(1)
+        try:
+            data = data.decode(encoding)
+        except UnicodeError:
+            data = data.decode('latin-1')    # fallback
+        return Page(data, final_url)
+
+    async def get_page(self, url, pages=None):
+        """
+        Get the HTML for an URL, possibly from the ``pages`` cache passed in
+        or the persistent page cache, if one was specified. The persistent
+        page cache is read and written in the event loop's default executor,
+        as it uses blocking I/O.
+        """
+        if pages is None:
+            pages = {}
+        scheme, _, path, _, _, _ = urlparse(url)
+        if scheme == 'file':
+            path = url2pathname(path)
+            if os.path.isdir(path):
+                url = urljoin(ensure_slash(url), 'index.html')
+                path = os.path.join(path, 'index.html')
+        if url in pages:
+            return pages[url]
+        result = None
+        host = urlparse(url).hostname
+        if scheme == 'file':
+            try:
+                with open(path, 'rb') as f:
+                    result = self._make_page(f.read(), 'text/html', url)
+            except IOError as e:
+                logger.debug('Unable to read %s: %s', path, e)
+        elif not self.scheduler.is_available(host):
+            logger.debug('Skipping %s due to bad host %s', url, host)
+        else:
+            headers = {'Accept-Encoding': self.accept_encoding}
+            cached = None
+            loop = asyncio.get_event_loop()
+            if self.page_cache is not None:
+                cached = await loop.run_in_executor(None, self.page_cache.get,
+                                                    url)
+                if cached:
+                    if cached.get('etag'):
+                        headers['If-None-Match'] = cached['etag']
+                    if cached.get('last_modified'):
+                        headers['If-Modified-Since'] = cached['last_modified']
+            try:
+                logger.debug('Fetching %s', url)
+                resp = await self.http_get(url, headers)
+                logger.debug('Fetched %s', url)
+                content_type = resp.headers.get('content-type', '')
+                if resp.status == 304 and cached:
+                    logger.debug('Not modified: %s', url)
+                    result = Page(cached['data'], cached['final_url'])
+                elif resp.status == 200:
+                    if HTML_CONTENT_TYPE.match(content_type):
+                        encoding = resp.headers.get('content-encoding')
+                        data = b''.join(self._decode_content([resp.body],
+                                                             encoding))
+                        result = self._make_page(data, content_type, resp.url)
+                        etag = resp.headers.get('etag')
+                        last_modified = resp.headers.get('last-modified')
+                        if (self.page_cache is not None and
+                            (etag or last_modified)):
+                            await loop.run_in_executor(
+                                None, self.page_cache.put, url, resp.url,
+                                result.data, etag, last_modified)
+                elif resp.status != 404:
+                    logger.error('Fetch failed: %s: HTTP status %s', url,
+                                 resp.status)
+            except Exception as e:
+                logger.exception('Fetch failed: %s: %s', url, e)
+        pages[url] = result     # even if None (failure)
+        if result is not None:
+            pages[result.url] = result
+        return result
+
+    async def get_distribution_names(self):
+        """
+        Return all the distribution names known to this locator.
+        """
+        result = set()
+        page = await self.get_page(self.base_url)
+        if not page:
+            raise DistlibException('Unable to get %s' % self.base_url)
+        for match in self._distname_re.finditer(page.data):
+            result.add(match.group(1))
+        return result
+
+
+class AsyncPyPIJSONLocator(AsyncLocatorMixin, PyPIJSONLocator):
+    """
+    An asyncio counterpart of :class:`PyPIJSONLocator`.
+    """
+    def __init__(self, url, timeout=None, max_per_host=5, scheduler=None,
+                 **kwargs):
+        """
+        Initialise an instance.
+        :param url: The base URL of the JSON interface.
+        :param timeout: The timeout, in seconds, to be applied to requests.
+                        This defaults to ``None`` (no timeout specified).
+        :param max_per_host: The maximum number of concurrent requests to
+                             make to any one host. This defaults to 5.
+        :param scheduler: The :class:`~distlib.util.HostScheduler` to use.
+                          If not specified, one with default settings is
+                          used.
+        :param kwargs: Passed to the superclass.
+        """
+        super(AsyncPyPIJSONLocator, self).__init__(url, **kwargs)
+        self.timeout = timeout
+        self.max_per_host = max_per_host
+        if scheduler is None:
+            scheduler = HostScheduler()
+        self.scheduler = scheduler
+
+    async def _get_json(self, url):
+        """
+        Get and decode the JSON at an URL, returning ``None`` if it wasn't
+        found.
+        """
+        result = None
+        resp = await self.http_get(url)
+        if resp.status == 200:
+            result = json.loads(resp.body.decode('utf-8'))
+        elif resp.status != 404:
+            logger.error('JSON fetch failed: %s: HTTP status %s', url,
+                         resp.status)
+        return result
+
+    async def _get_release(self, name, version):
+        url = urljoin(self.base_url, '%s/%s/json' % (quote(name),
+                                                     quote(version)))
+        result = {}
+        try:
+            d = await self._get_json(url)
+            if d:
+                result = self._process_project_data(d)
+        except Exception as e:
+            logger.exception('JSON fetch failed: %s', e)
+        return result
+
+    async def _get_project(self, name, matcher=None):
+        result = {}
+        url = urljoin(self.base_url, '%s/json' % quote(name))
+        try:
+            d = await self._get_json(url)
+            if d:
+                result = self._process_project_data(d)
+                if self.all_versions:
+                    # fetched concurrently, subject to max_per_host
+                    versions = self._get_release_versions(d, result, matcher)
+                    releases = await asyncio.gather(
+                        *[self._get_release(name, v) for v in versions])
+                    for release in releases:
+                        result.update(release)
+        except Exception as e:
+            logger.exception('JSON fetch failed: %s', e)
+        return result
@@ -14,8 +14,9 @@ from threading import Thread
 
 from distlib import DistlibException
 from distlib.compat import (HTTPBasicAuthHandler, Request, HTTPPasswordMgr,
-                            urlparse, build_opener)
-from distlib.util import cached_property, zip_dir
+                            urlparse, build_opener, HTTPHandler)
+from distlib.util import (cached_property, zip_dir, ConnectionPool,
+                          PooledHTTPHandler, PooledHTTPSHandler, HostScheduler)
 
 logger = logging.getLogger(__name__)
 
@@ -30,14 +31,29 @@ class PackageIndex(object):
 
     boundary = b'----------ThIs_Is_tHe_distlib_index_bouNdaRY_$'
 
-    def __init__(self, url=None):
+    def __init__(self, url=None, connection_pool=None, scheduler=None):
         """
         Initialise an instance.
 
         :param url: The URL of the index. If not specified, the URL for PyPI is
                     used.
+        :param connection_pool: A :class:`~distlib.util.ConnectionPool` to get
+                                HTTP connections from. If not specified, the
+                                index uses a pool of its own, which is closed
+                                by :meth:`close`.
+        :param scheduler: The :class:`~distlib.util.HostScheduler` used to
+                          rate-limit and retry downloads. This can be shared
+                          with locators. If not specified, one with default
+                          settings is used.
         """
         self.url = url or DEFAULT_INDEX
+        self._owns_pool = connection_pool is None
+        if connection_pool is None:
+            connection_pool = ConnectionPool()
+        self.connection_pool = connection_pool
+        if scheduler is None:
+            scheduler = HostScheduler()
+        self.scheduler = scheduler
         self.read_configuration()
         scheme, netloc, path, params, query, frag = urlparse(self.url)
         if params or query or frag or scheme not in ('http', 'https'):
@@ -362,47 +378,65 @@ class PackageIndex(object):
                        ``'md5'``) and ``value`` is the expected value.
         :param reporthook: The same as for :func:`urlretrieve` in the
                            standard library.
+
+        The download is made using this instance's scheduler, so it's subject
+        to its host's rate limit, and is retried from the start if it fails
+        with a transient error.
         """
         if digest is None:
-            digester = None
+            hasher = None
             logger.debug('No digest specified')
         else:
             if isinstance(digest, (list, tuple)):
                 hasher, digest = digest
             else:
                 hasher = 'md5'
-            digester = getattr(hashlib, hasher)()
             logger.debug('Digest specified: %s' % digest)
+
         # The following code is equivalent to urlretrieve.
         # We need to do it this way so that we can compute the
         # digest of the file as we go.
-        with open(destfile, 'wb') as dfp:
-            # addinfourl is not a context manager on 2.x
-            # so we have to use try/finally
-            sfp = self.send_request(Request(url))
-            try:
-                headers = sfp.info()
-                blocksize = 8192
-                size = -1
-                read = 0
-                blocknum = 0
-                if "content-length" in headers:
-                    size = int(headers["Content-Length"])
-                if reporthook:
-                    reporthook(blocknum, blocksize, size)
-                while True:
-                    block = sfp.read(blocksize)
-                    if not block:
-                        break
-                    read += len(block)
-                    dfp.write(block)
-                    if digester:
-                        digester.update(block)
-                    blocknum += 1
+        def download():
+            if hasher is None:
+                digester = None
+            else:
+                digester = getattr(hashlib, hasher)()
+            with open(destfile, 'wb') as dfp:
+                # addinfourl is not a context manager on 2.x
+                # so we have to use try/finally
+                sfp = self.send_request(Request(url))
+                try:
+                    headers = sfp.info()
+                    blocksize = 8192
+                    size = -1
+                    read = 0
+                    blocknum = 0
+                    if "content-length" in headers:
+                        size = int(headers["Content-Length"])
                     if reporthook:
                         reporthook(blocknum, blocksize, size)
-            finally:
-                sfp.close()
+                    while True:
+                        block = sfp.read(blocksize)
+                        if not block:
+                            break
+                        read += len(block)
+                        dfp.write(block)
+                        if digester:
+                            digester.update(block)
+                        blocknum += 1
+                        if reporthook:
+                            reporthook(blocknum, blocksize, size)
+                finally:
+                    sfp.close()
+            return size, read, digester
+
+        host = urlparse(url)[1].split(':', 1)[0]
+        if not self.scheduler.is_available(host):
+            raise DistlibException('not downloading %s: too many failures '
+                                   'for %s' % (url, host))
+        # If the download fails with a transient error, it's retried from
+        # the start.
+        size, read, digester = self.scheduler.call(host, download)
 
         # check that we got the whole file, if we can
         if size >= 0 and read < size:
@@ -431,9 +465,20 @@ class PackageIndex(object):
             handlers.append(self.password_handler)
         if self.ssl_verifier:
             handlers.append(self.ssl_verifier)
+        else:
+            handlers.append(PooledHTTPSHandler(self.connection_pool))
+        if not isinstance(self.ssl_verifier, HTTPHandler):
+            handlers.append(PooledHTTPHandler(self.connection_pool))
         opener = build_opener(*handlers)
         return opener.open(req)
 
+    def close(self):
+        """
+        Close any kept-alive HTTP connections held by this instance.
+        """
+        if self._owns_pool:
+            self.connection_pool.close()
+
     def encode_request(self, fields, files):
         """
         Encode fields and files for posting to an HTTP server.
@@ -5,26 +5,42 @@
 # See LICENSE.txt and CONTRIBUTORS.txt.
 #
 
-import gzip
-from io import BytesIO
+import bisect
+import codecs
+import hashlib
+import itertools
 import json
 import logging
+import mmap
 import os
 import posixpath
 import re
+import struct
+try:
+    import sqlite3
+except ImportError:  # pragma: no cover
+    sqlite3 = None
+import sys
+import tarfile
 import threading
+import time
 import zlib
 
 from . import DistlibException
 from .compat import (urljoin, urlparse, urlunparse, url2pathname, pathname2url,
-                     queue, quote, unescape, string_types, build_opener,
+                     quote, unescape, string_types, build_opener, queue,
+                     xmlrpclib, OrderedDict, ZipFile, StringIO,
                      HTTPRedirectHandler as BaseRedirectHandler,
                      Request, HTTPError, URLError)
 from .database import Distribution, DistributionPath, make_dist
-from .metadata import Metadata
+from .metadata import Metadata, METADATA_FILENAME
+from .markers import Evaluator
 from .util import (cached_property, parse_credentials, ensure_slash,
                    split_filename, get_project_data, parse_requirement,
-                   parse_name_and_version, ServerProxy)
+                   parse_name_and_version, ServerProxy, get_cache_base,
+                   Future, WorkerPool, ConnectionPool, PooledHTTPHandler,
+                   PooledHTTPSHandler, HostScheduler, LRUCache,
+                   extract_by_key)
 from .version import get_scheme, UnsupportedVersionError
 from .wheel import Wheel, is_compatible
 
@@ -33,8 +49,12 @@ logger = logging.getLogger(__name__)
 HASHER_HASH = re.compile('^(\w+)=([a-f0-9]+)')
 CHARSET = re.compile(r';\s*charset\s*=\s*(.*)\s*$', re.I)
 HTML_CONTENT_TYPE = re.compile('text/html|application/x(ht)?ml')
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
 DEFAULT_INDEX = 'http://python.org/pypi'
 
+# Marks a cache miss, as None can be a cached value
+_MISSING = object()
+
 def get_all_distribution_names(url=None):
     """
     Return all distribution names known by an index.
@@ -93,23 +113,105 @@ class Locator(object):
 
     downloadable_extensions = source_extensions + ('.whl',)
 
-    def __init__(self, scheme='default'):
+    # The number of threads used by get_projects() and locate_many() to get
+    # projects concurrently. Locators which do network I/O set this higher.
+    batch_workers = 1
+
+    # An identifier for the data the locator finds, such as the id of a
+    # snapshot of an index, which changes whenever the data does. See
+    # get_fingerprint().
+    fingerprint = None
+
+    def __init__(self, scheme='default', connection_pool=None, cache=None,
+                 store=None, fetch_metadata=None):
         """
         Initialise an instance.
         :param scheme: Because locators look for most recent versions, they
                        need to know the version scheme to use. This specifies
                        the current PEP-recommended scheme - use ``'legacy'``
                        if you need to support existing distributions on PyPI.
+        :param connection_pool: A :class:`~distlib.util.ConnectionPool` to
+                                get HTTP connections from. If not specified,
+                                the locator uses a pool of its own, which is
+                                closed by :meth:`close`.
+        :param cache: The mapping used to cache the results of
+                      :meth:`get_project` - for example, an
+                      :class:`~distlib.util.LRUCache` to bound its size and
+                      have results expire. If not specified, a dictionary is
+                      used, which holds results until :meth:`clear_cache` is
+                      called.
+        :param store: If specified, this is a :class:`ResultStore` in which
+                      results are also kept, so that they can be shared with
+                      other locators and processes. If ``True``, a store in
+                      the default location is used.
+        :param fetch_metadata: If specified, this is a
+                               :class:`MetadataFetcher` used to get the
+                               metadata (and so the dependencies) of each
+                               distribution :meth:`locate` returns from its
+                               archive. If ``True``, a fetcher which uses this
+                               locator's connections is used.
         """
-        self._cache = {}
+        if cache is None:
+            cache = {}
+        self._cache = cache
+        if store is True:
+            store = ResultStore()
+        self.store = store
         self.scheme = scheme
+        self._owns_pool = connection_pool is None
+        if connection_pool is None:
+            connection_pool = ConnectionPool()
+        self.connection_pool = connection_pool
         # Because of bugs in some of the handlers on some of the platforms,
-        # we use our own opener rather than just using urlopen.
-        self.opener = build_opener(RedirectHandler())
+        # we use our own opener rather than just using urlopen. The opener
+        # keeps connections alive, so that requests to the same host don't
+        # each need a new connection.
+        self.opener = build_opener(RedirectHandler(),
+                                   PooledHTTPHandler(connection_pool),
+                                   PooledHTTPSHandler(connection_pool))
+        if fetch_metadata is True:
+            fetch_metadata = MetadataFetcher(self.opener)
+        self.metadata_fetcher = fetch_metadata
         # If get_project() is called from locate(), the matcher instance
         # is set from the requirement passed to locate(). See issue #18 for
-        # why this can be useful to know.
-        self.matcher = None
+        # why this can be useful to know. It's held per-thread, so that
+        # projects can be got concurrently.
+        self._local = threading.local()
+        self._batch_pool = None
+        self._batch_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Release any resources (such as threads) held by the locator.
+        """
+        with self._batch_lock:
+            pool, self._batch_pool = self._batch_pool, None
+        if pool is not None:
+            pool.close()
+        if self._owns_pool:
+            self.connection_pool.close()
+
+    def _get_matcher(self):
+        return getattr(self._local, 'matcher', None)
+
+    def _set_matcher(self, value):
+        self._local.matcher = value
+
+    matcher = property(_get_matcher, _set_matcher)
+
+    @property
+    def cache(self):
+        """
+        The mapping used to cache project results (``None`` if caching is
+        disabled).
+        """
+        return self._cache
 
     def clear_cache(self):
         self._cache.clear()
@@ -140,6 +242,41 @@ class Locator(object):
         """
         raise NotImplementedError('Please implement in the subclass')
 
+    def iter_distribution_names(self):
+        """
+        Return an iterator over all the distribution names known to this
+        locator. Locators which can get the names incrementally yield them
+        as they're got, rather than collecting them all first.
+        """
+        return iter(self.get_distribution_names())
+
+    def get_fingerprint(self):
+        """
+        Return a string which identifies the data this locator finds, and
+        changes whenever the results it returns might, or ``None`` if this
+        can't be told. This is the ``fingerprint`` attribute, if set;
+        locators whose data is local compute it otherwise.
+        """
+        return self.fingerprint
+
+    def get_project_fingerprint(self, name):
+        """
+        Return a string which identifies the data this locator finds for a
+        project, and changes whenever :meth:`get_project` might return
+        something different for it, or ``None`` if this can't be told. This
+        is the locator's fingerprint (see :meth:`get_fingerprint`), unless
+        the locator can tell when a single project has changed - for
+        example, using the validators returned by a server.
+        """
+        return self.get_fingerprint()
+
+    def _can_fingerprint_projects(self):
+        """
+        Return whether this locator can compute fingerprints for projects
+        without a fingerprint for all its data.
+        """
+        return False
+
     def get_project(self, name):
         """
         For a given project, get a dictionary mapping available versions to Distribution
@@ -147,13 +284,134 @@ class Locator(object):
 
         This calls _get_project to do all the work, and just implements a caching layer on top.
         """
-        if self._cache is None:
-            result = self._get_project(name)
-        elif name in self._cache:
-            result = self._cache[name]
-        else:
+        result = self._get_cached(name)
+        if result is _MISSING:
             result = self._get_project(name)
+            if (self._may_cache(self.matcher) and
+                not isinstance(result, PartialResult)):
+                self._set_cached(name, result)
+        return result
+
+    def _get_store_key(self):
+        """
+        Return the key identifying this locator's results in a result store.
+        Locators of the same type searching the same place share results.
+        """
+        return '%s %s %s' % (type(self).__name__, self.scheme,
+                             getattr(self, 'base_url', ''))
+
+    def _get_cached(self, name):
+        """
+        Return the cached result for a project, from the cache or else the
+        result store, or _MISSING if there isn't one.
+        """
+        result = _MISSING
+        if self._cache is not None:
+            # Entries may expire, so check and get them in one step
+            result = self._cache.get(name, _MISSING)
+            if result is _MISSING and self.store is not None:
+                stored = self.store.get(self._get_store_key(), name,
+                                        self.scheme)
+                if stored is not None:
+                    for dist in stored.values():
+                        dist.locator = self
+                    result = self._cache[name] = stored
+        return result
+
+    def _set_cached(self, name, result):
+        if self._cache is not None:
             self._cache[name] = result
+            if self.store is not None:
+                self.store.put(self._get_store_key(), name, result)
+
+    def _may_cache(self, matcher):
+        """
+        Return whether the result for a project, got while the specified
+        matcher was in effect, may be cached. Locators which can stop looking
+        for versions once the matcher is satisfied return False if they may
+        have done so, as the result might not list every version.
+        """
+        return True
+
+    def get_projects(self, names):
+        """
+        For each of a number of projects, get a dictionary mapping available
+        versions to Distribution instances. Where the locator supports it,
+        the projects are got concurrently.
+
+        :param names: The names of the projects.
+        :return: A dictionary mapping each name to the dictionary which
+                 :meth:`get_project` would return for it.
+        """
+        return self._fetch_projects(dict((name, None) for name in names))
+
+    def _fetch_projects(self, matchers):
+        """
+        Get several projects, using the cache where possible.
+
+        :param matchers: A dictionary mapping project names to the matcher to
+                         use while getting each project (or None).
+        """
+        result = {}
+        todo = {}
+        for name, matcher in matchers.items():
+            value = self._get_cached(name)
+            if value is _MISSING:
+                todo[name] = matcher
+            else:
+                result[name] = value
+        if todo:
+            fetched = self._get_projects(todo)
+            for name, value in fetched.items():
+                if (self._may_cache(todo[name]) and
+                    not isinstance(value, PartialResult)):
+                    self._set_cached(name, value)
+            result.update(fetched)
+        return result
+
+    def _get_project_matching(self, name, matcher):
+        """
+        Call _get_project with self.matcher set for the current thread.
+        """
+        self.matcher = matcher
+        try:
+            return self._get_project(name)
+        finally:
+            self.matcher = None
+
+    def _get_batch_pool(self):
+        """
+        Return the pool of threads used to get projects concurrently,
+        creating it if necessary.
+        """
+        with self._batch_lock:
+            if self._batch_pool is None:
+                self._batch_pool = WorkerPool(self.batch_workers)
+            return self._batch_pool
+
+    def _get_projects(self, matchers):
+        """
+        Get several projects, bypassing the cache. If ``batch_workers`` is
+        greater than one, the projects are got concurrently using a pool of
+        threads, otherwise they're got one after another.
+
+        :param matchers: A dictionary mapping project names to the matcher to
+                         use while getting each project (or None).
+        :return: A dictionary mapping project names to the results of
+                 _get_project for them.
+        """
+        result = {}
+        if self.batch_workers <= 1 or len(matchers) <= 1:
+            for name, matcher in matchers.items():
+                result[name] = self._get_project_matching(name, matcher)
+        else:
+            pool = self._get_batch_pool()
+            futures = []
+            for name, matcher in matchers.items():
+                f = pool.submit(self._get_project_matching, name, matcher)
+                futures.append((name, f))
+            for name, f in futures:
+                result[name] = f.result()
         return result
 
     def score_url(self, url):
@@ -305,28 +563,28 @@ class Locator(object):
         dist.locator = self
         result[version] = dist
 
-    def locate(self, requirement, prereleases=False):
+    def _parse_requirement(self, requirement):
         """
-        Find the most recent distribution which matches the given
-        requirement.
-
-        :param requirement: A requirement of the form 'foo (1.0)' or perhaps
-                            'foo (>= 1.0, < 2.0, != 1.3)'
-        :param prereleases: If ``True``, allow pre-release versions
-                            to be located. Otherwise, pre-release versions
-                            are not returned.
-        :return: A :class:`Distribution` instance, or ``None`` if no such
-                 distribution could be located.
+        Parse a requirement passed to :meth:`locate`, and return it together
+        with a matcher for it.
         """
-        result = None
         r = parse_requirement(requirement)
         if r is None:
             raise DistlibException('Not a valid requirement: %r' % requirement)
         scheme = get_scheme(self.scheme)
-        self.matcher = matcher = scheme.matcher(r.requirement)
+        matcher = scheme.matcher(r.requirement)
         logger.debug('matcher: %s (%s)', matcher, type(matcher).__name__)
-        versions = self.get_project(r.name)
+        return r, matcher
+
+    def _select_version(self, r, matcher, versions, prereleases):
+        """
+        Select the most recent distribution which matches a requirement from
+        the versions found for a project (as returned by
+        :meth:`get_project`).
+        """
+        result = None
         if versions:
+            scheme = get_scheme(self.scheme)
             # sometimes, versions are invalid
             slist = []
             vcls = matcher.version_class
@@ -350,7 +608,124 @@ class Locator(object):
                 result = versions[slist[-1]]
         if result and r.extras:
             result.extras = r.extras
+        return result
+
+    def _get_metadata_fetcher(self, dist):
+        """
+        Return the metadata fetcher to use to get a distribution's metadata
+        from its archive - the one configured for this locator or the one
+        which found the distribution - or None if there isn't one or this
+        has already been done.
+        """
+        result = None
+        if not getattr(dist, '_metadata_fetched', False):
+            result = self.metadata_fetcher
+            if result is None and dist.locator is not None:
+                result = getattr(dist.locator, 'metadata_fetcher', None)
+        return result
+
+    def _fetch_metadata(self, dist):
+        """
+        Get a distribution's metadata from its archive, if a metadata fetcher
+        is configured for this locator or the one which found the
+        distribution, and this hasn't been done already.
+        """
+        fetcher = self._get_metadata_fetcher(dist)
+        if fetcher is not None:
+            fetcher.update(dist, self.scheme)
+            # Even if it failed, so that it isn't retried every time
+            dist._metadata_fetched = True
+
+    def _get_metadata_pool(self):
+        """
+        Return the pool of threads used to get the metadata of several
+        distributions concurrently, or None if it should be got one
+        distribution after another.
+        """
+        result = None
+        if self.batch_workers > 1:
+            result = self._get_batch_pool()
+        return result
+
+    def _fetch_all_metadata(self, dists):
+        """
+        Get the metadata of several distributions from their archives (see
+        _fetch_metadata), concurrently where the locator supports it.
+        """
+        todo = []
+        seen = set()
+        for dist in dists:
+            if (dist is not None and id(dist) not in seen and
+                self._get_metadata_fetcher(dist) is not None):
+                seen.add(id(dist))
+                todo.append(dist)
+        pool = None
+        if len(todo) > 1:
+            pool = self._get_metadata_pool()
+        if pool is None:
+            for dist in todo:
+                self._fetch_metadata(dist)
+        else:
+            futures = []
+            for dist in todo:
+                futures.append(pool.submit(self._fetch_metadata, dist))
+            for f in futures:
+                f.result()
+
+    def locate(self, requirement, prereleases=False):
+        """
+        Find the most recent distribution which matches the given
+        requirement.
+
+        :param requirement: A requirement of the form 'foo (1.0)' or perhaps
+                            'foo (>= 1.0, < 2.0, != 1.3)'
+        :param prereleases: If ``True``, allow pre-release versions
+                            to be located. Otherwise, pre-release versions
+                            are not returned.
+        :return: A :class:`Distribution` instance, or ``None`` if no such
+                 distribution could be located.
+        """
+        r, matcher = self._parse_requirement(requirement)
+        self.matcher = matcher
+        versions = self.get_project(r.name)
+        result = self._select_version(r, matcher, versions, prereleases)
         self.matcher = None
+        if result:
+            self._fetch_metadata(result)
+        return result
+
+    def locate_many(self, requirements, prereleases=False):
+        """
+        Find the most recent distributions which match each of a number of
+        requirements. The projects needed are got together, concurrently
+        where the locator supports it, rather than one after another.
+
+        :param requirements: The requirements, each as for :meth:`locate`.
+        :param prereleases: As for :meth:`locate`.
+        :return: A dictionary mapping each requirement to a
+                 :class:`Distribution` instance, or ``None`` if no matching
+                 distribution could be located.
+        """
+        parsed = []
+        matchers = {}
+        for requirement in requirements:
+            r, matcher = self._parse_requirement(requirement)
+            parsed.append((requirement, r, matcher))
+            if r.name in matchers:
+                # Different requirements for the same project - we can't
+                # say which matcher to use when getting it
+                matchers[r.name] = None
+            else:
+                matchers[r.name] = matcher
+        projects = self._fetch_projects(matchers)
+        result = {}
+        for requirement, r, matcher in parsed:
+            result[requirement] = self._select_version(r, matcher,
+                                                       projects[r.name],
+                                                       prereleases)
+        # The metadata is got once all the distributions are known, so that
+        # it can be got for them concurrently.
+        self._fetch_all_metadata(result.values())
         return result
 
 
@@ -358,30 +733,114 @@ class PyPIRPCLocator(Locator):
     """
     This locator uses XML-RPC to locate distributions. It therefore
     cannot be used with simple mirrors (that only mirror file content).
+
+    The calls for the releases of a project are batched using XML-RPC
+    multicall. If the server doesn't support multicall, they're made
+    concurrently instead.
     """
-    def __init__(self, url, **kwargs):
+    def __init__(self, url, batch_size=100, num_workers=10, **kwargs):
         """
         Initialise an instance.
 
         :param url: The URL to use for XML-RPC.
+        :param batch_size: The maximum number of calls to make in a single
+                           multicall. If this is 1, multicall isn't used.
+        :param num_workers: The number of calls to make concurrently if
+                            multicall isn't used. If this is 1, the calls are
+                            made one after another.
         :param kwargs: Passed to the superclass constructor.
         """
         super(PyPIRPCLocator, self).__init__(**kwargs)
         self.base_url = url
-        self.client = ServerProxy(url, timeout=3.0)
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        # Set to False if the server turns out not to support multicall
+        self.use_multicall = batch_size > 1
+        self.client = self._local.client = self._make_client()
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _make_client(self):
+        return ServerProxy(self.base_url, timeout=3.0,
+                           pool=self.connection_pool)
+
+    def _get_client(self):
+        # A client's transport holds a single connection, so each thread
+        # needs a client of its own.
+        result = getattr(self._local, 'client', None)
+        if result is None:
+            result = self._local.client = self._make_client()
+        return result
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = WorkerPool(self.num_workers)
+            return self._pool
+
+    def close(self):
+        super(PyPIRPCLocator, self).close()
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+
+    def _call(self, method, args):
+        return getattr(self._get_client(), method)(*args)
+
+    def _call_many(self, calls):
+        """
+        Make a number of XML-RPC calls, using multicall if possible.
+
+        :param calls: A list of (method name, arguments) tuples.
+        :return: A list of the results of the calls, in order.
+        """
+        result = []
+        done = 0
+        while done < len(calls) and self.use_multicall:
+            batch = calls[done:done + self.batch_size]
+            multicall = xmlrpclib.MultiCall(self._get_client())
+            for method, args in batch:
+                getattr(multicall, method)(*args)
+            try:
+                results = multicall()
+            except xmlrpclib.Fault as e:
+                # A failed call in the batch doesn't raise here, so the
+                # multicall itself failed.
+                logger.debug('Multicall not supported by %s: %s',
+                             self.base_url, e)
+                self.use_multicall = False
+                break
+            result.extend(results)  # raises a Fault for any failed call
+            done += len(batch)
+        remaining = calls[done:]
+        if self.num_workers <= 1 or len(remaining) <= 1:
+            for method, args in remaining:
+                result.append(self._call(method, args))
+        else:
+            pool = self._get_pool()
+            futures = [pool.submit(self._call, method, args)
+                       for method, args in remaining]
+            for f in futures:
+                result.append(f.result())
+        return result
 
     def get_distribution_names(self):
         """
         Return all the distribution names known to this locator.
         """
-        return set(self.client.list_packages())
+        return set(self._get_client().list_packages())
 
     def _get_project(self, name):
         result = {}
-        versions = self.client.package_releases(name, True)
+        versions = self._get_client().package_releases(name, True)
+        calls = []
         for v in versions:
-            urls = self.client.release_urls(name, v)
-            data = self.client.release_data(name, v)
+            calls.append(('release_urls', (name, v)))
+            calls.append(('release_data', (name, v)))
+        results = self._call_many(calls)
+        for i, v in enumerate(versions):
+            urls, data = results[2 * i:2 * i + 2]
             metadata = Metadata(scheme=self.scheme)
             metadata.name = data['name']
             metadata.version = data['version']
@@ -399,12 +858,52 @@ class PyPIRPCLocator(Locator):
 
 class PyPIJSONLocator(Locator):
     """
-    This locator uses PyPI's JSON interface. It's very limited in functionality
-    nad probably not worth using.
+    This locator uses PyPI's JSON interface. By default, only the latest
+    release of a project is returned; if ``all_versions`` is set, the JSON for
+    each release is also fetched, concurrently.
     """
-    def __init__(self, url, **kwargs):
+    batch_workers = 10
+
+    # Matches an environment marker which just tests for an extra
+    _extra_marker = re.compile(r"""^extra\s*==\s*['"]([^'"]+)['"]$""")
+
+    def __init__(self, url, all_versions=False, num_workers=10, **kwargs):
+        """
+        Initialise an instance.
+
+        :param url: The base URL of the JSON interface.
+        :param all_versions: If true, all releases of a project are returned,
+                             rather than just the latest one. When called
+                             from :meth:`locate`, only the releases which
+                             the requirement could match are fetched.
+        :param num_workers: The number of releases fetched concurrently.
+        :param kwargs: Passed to the superclass constructor.
+        """
         super(PyPIJSONLocator, self).__init__(**kwargs)
         self.base_url = ensure_slash(url)
+        self.all_versions = all_versions
+        self.num_workers = num_workers
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        # Not the batch pool: projects got using that fetch their releases
+        # using this one, so sharing a pool could deadlock.
+        with self._lock:
+            if self._pool is None:
+                self._pool = WorkerPool(self.num_workers)
+            return self._pool
+
+    def close(self):
+        super(PyPIJSONLocator, self).close()
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+
+    def _may_cache(self, matcher):
+        # Releases the matcher can't match aren't fetched
+        return not (self.all_versions and matcher)
 
     def get_distribution_names(self):
         """
@@ -412,47 +911,131 @@ class PyPIJSONLocator(Locator):
         """
         raise NotImplementedError('Not available from this locator')
 
+    def _get_json(self, url):
+        resp = self.opener.open(url)
+        try:
+            return json.loads(resp.read().decode('utf-8'))
+        finally:
+            resp.close()
+
     def _get_project(self, name):
         result = {}
+        matcher = self.matcher
         url = urljoin(self.base_url, '%s/json' % quote(name))
         try:
-            resp = self.opener.open(url)
-            data = resp.read().decode() # for now
-            d = json.loads(data)
-            md = Metadata(scheme=self.scheme)
-            data = d['info']
-            md.name = data['name']
-            md.version = data['version']
-            md.license = data.get('license')
-            md.keywords = data.get('keywords', [])
-            md.summary = data.get('summary')
-            dist = Distribution(md)
-            urls = d['urls']
-            if urls:
-                info = urls[0]
-                md.source_url = info['url']
-                dist.digest = self._get_digest(info)
-                dist.locator = self
-                result[md.version] = dist
+            d = self._get_json(url)
+            result = self._process_project_data(d)
+            if self.all_versions:
+                versions = self._get_release_versions(d, result, matcher)
+                if versions:
+                    result.update(self._get_releases(name, versions))
         except Exception as e:
             logger.exception('JSON fetch failed: %s', e)
         return result
 
+    def _get_release_versions(self, d, result, matcher=None):
+        """
+        Return the versions of the releases listed in the decoded JSON data
+        for a project which have files, and which aren't in the result
+        already. If a matcher is specified, only versions it matches are
+        returned.
+        """
+        versions = []
+        for version, files in d.get('releases', {}).items():
+            if files and version not in result:
+                if matcher:
+                    try:
+                        if not matcher.match(version):
+                            continue
+                    except UnsupportedVersionError:
+                        continue
+                versions.append(version)
+        return versions
+
+    def _get_release(self, name, version):
+        url = urljoin(self.base_url, '%s/%s/json' % (quote(name),
+                                                     quote(version)))
+        return self._process_project_data(self._get_json(url))
+
+    def _get_releases(self, name, versions):
+        """
+        Fetch the JSON for releases of a project concurrently, returning a
+        dictionary mapping versions to distributions.
+        """
+        result = {}
+        pool = self._get_pool()
+        futures = [pool.submit(self._get_release, name, v) for v in versions]
+        for f in futures:
+            try:
+                result.update(f.result())
+            except Exception as e:
+                logger.exception('JSON fetch failed: %s', e)
+        return result
+
+    def _get_dependencies(self, requires_dist):
+        """
+        Convert the ``requires_dist`` list from the JSON for a release into
+        the form used for :attr:`Metadata.dependencies`.
+        """
+        entries = OrderedDict()
+        extras = []
+        for s in requires_dist:
+            parts = s.split(';', 1)
+            reqt = parts[0].strip()
+            extra = env = None
+            if len(parts) > 1:
+                marker = parts[1].strip()
+                m = self._extra_marker.match(marker)
+                if m:
+                    extra = m.group(1)
+                    if extra not in extras:
+                        extras.append(extra)
+                else:
+                    env = marker
+            entries.setdefault((extra, env), []).append(reqt)
+        run_requires = []
+        for (extra, env), reqts in entries.items():
+            entry = {'requires': reqts}
+            if extra:
+                entry['extra'] = extra
+            if env:
+                entry['environment'] = env
+            run_requires.append(entry)
+        result = {'run_requires': run_requires}
+        if extras:
+            result['extras'] = extras
+        return result
+
+    def _process_project_data(self, d):
+        """
+        Build the result for _get_project from the decoded JSON data for a
+        project or release.
+        """
+        result = {}
+        md = Metadata(scheme=self.scheme)
+        data = d['info']
+        md.name = data['name']
+        md.version = data['version']
+        md.license = data.get('license')
+        md.keywords = data.get('keywords', [])
+        md.summary = data.get('summary')
+        if data.get('requires_dist'):
+            md.dependencies = self._get_dependencies(data['requires_dist'])
+        dist = Distribution(md)
+        urls = d['urls']
+        if urls:
+            info = urls[0]
+            md.source_url = info['url']
+            dist.digest = self._get_digest(info)
+            dist.locator = self
+            result[md.version] = dist
+        return result
+
 
 class Page(object):
     """
     This class represents a scraped HTML page.
     """
-    # The following slightly hairy-looking regex just looks for the contents of
-    # an anchor link, which has an attribute "href" either immediately preceded
-    # or immediately followed by a "rel" attribute. The attribute values can be
-    # declared with double quotes, single quotes or no quotes - which leads to
-    # the length of the expression.
-    _href = re.compile("""
-(rel\s*=\s*(?:"(?P<rel1>[^"]*)"|'(?P<rel2>[^']*)'|(?P<rel3>[^>\s\n]*))\s+)?
-href\s*=\s*(?:"(?P<url1>[^"]*)"|'(?P<url2>[^']*)'|(?P<url3>[^>\s\n]*))
-(\s+rel\s*=\s*(?:"(?P<rel4>[^"]*)"|'(?P<rel5>[^']*)'|(?P<rel6>[^>\s\n]*)))?
-""", re.I | re.S | re.X)
     _base = re.compile(r"""<base\s+href\s*=\s*['"]?([^'">]+)""", re.I | re.S)
 
     def __init__(self, data, url):
@@ -466,7 +1049,10 @@ href\s*=\s*(?:"(?P<url1>[^"]*)"|'(?P<url2>[^']*)'|(?P<url3>[^>\s\n]*))
         if m:
             self.base_url = m.group(1)
 
-    _clean_re = re.compile(r'[^a-z0-9$&+,/:;=?@.#%_\\|-]', re.I)
+    def __sizeof__(self):
+        # Used by sys.getsizeof(), so that caches can bound the memory used
+        # by the pages they hold.
+        return object.__sizeof__(self) + sys.getsizeof(self.data)
 
     @cached_property
     def links(self):
@@ -475,120 +1061,1037 @@ href\s*=\s*(?:"(?P<url1>[^"]*)"|'(?P<url2>[^']*)'|(?P<url3>[^>\s\n]*))
         about their "rel" attribute, for determining which ones to treat as
         downloads and which ones to queue for further scraping.
         """
-        def clean(url):
-            "Tidy up an URL."
-            scheme, netloc, path, params, query, frag = urlparse(url)
-            return urlunparse((scheme, netloc, quote(path),
-                               params, query, frag))
-
-        result = set()
-        for match in self._href.finditer(self.data):
-            d = match.groupdict('')
-            rel = (d['rel1'] or d['rel2'] or d['rel3'] or
-                   d['rel4'] or d['rel5'] or d['rel6'])
-            url = d['url1'] or d['url2'] or d['url3']
-            url = urljoin(self.base_url, url)
-            url = unescape(url)
-            url = self._clean_re.sub(lambda m: '%%%2x' % ord(m.group(0)), url)
-            result.add((url, rel))
+        extractor = LinkExtractor(self.base_url)
+        result = extractor.feed(self.data) + extractor.close()
         # We sort the result, hoping to bring the most recent versions
         # to the front
-        result = sorted(result, key=lambda t: t[0], reverse=True)
+        result.sort(key=lambda t: t[0], reverse=True)
         return result
 
 
-class SimpleScrapingLocator(Locator):
+class LinkExtractor(object):
     """
-    A locator which scrapes HTML pages to locate downloads for a distribution.
-    This runs multiple threads to do the I/O; performance is at least as good
-    as pip's PackageFinder, which works in an analogous fashion.
+    Extract links from an HTML page incrementally, as the page is read, so
+    that they can be acted on before the whole page has arrived. Feed the
+    page's text to :meth:`feed` in pieces, then call :meth:`close`. Each
+    link is returned once only, as a (url, rel) tuple.
     """
+    # The following slightly hairy-looking regex just looks for the contents of
+    # an anchor link, which has an attribute "href" either immediately preceded
+    # or immediately followed by a "rel" attribute. The attribute values can be
+    # declared with double quotes, single quotes or no quotes - which leads to
+    # the length of the expression.
+    _href = re.compile("""
+(rel\s*=\s*(?:"(?P<rel1>[^"]*)"|'(?P<rel2>[^']*)'|(?P<rel3>[^>\s\n]*))\s+)?
+href\s*=\s*(?:"(?P<url1>[^"]*)"|'(?P<url2>[^']*)'|(?P<url3>[^>\s\n]*))
+(\s+rel\s*=\s*(?:"(?P<rel4>[^"]*)"|'(?P<rel5>[^']*)'|(?P<rel6>[^>\s\n]*)))?
+""", re.I | re.S | re.X)
 
-    # These are used to deal with various Content-Encoding schemes.
-    decoders = {
-        'deflate': zlib.decompress,
-        'gzip': lambda b: gzip.GzipFile(fileobj=BytesIO(d)).read(),
-        'none': lambda b: b,
-    }
+    _clean_re = re.compile(r'[^a-z0-9$&+,/:;=?@.#%_\\|-]', re.I)
 
-    def __init__(self, url, timeout=None, num_workers=10, **kwargs):
+    def __init__(self, url):
         """
-        Initialise an instance.
-        :param url: The root URL to use for scraping.
-        :param timeout: The timeout, in seconds, to be applied to requests.
-                        This defaults to ``None`` (no timeout specified).
-        :param num_workers: The number of worker threads you want to do I/O,
-                            This defaults to 10.
-        :param kwargs: Passed to the superclass.
+        Initialise an instance with the URL of the page, which is used to
+        resolve relative links unless the page has a <base> element.
         """
-        super(SimpleScrapingLocator, self).__init__(**kwargs)
-        self.base_url = ensure_slash(url)
-        self.timeout = timeout
-        self._page_cache = {}
+        self.base_url = url
+        self._base_found = False
+        self._buffer = ''
         self._seen = set()
-        self._to_fetch = queue.Queue()
-        self._bad_hosts = set()
-        self.skip_externals = False
-        self.num_workers = num_workers
-        self._lock = threading.RLock()
 
-    def _prepare_threads(self):
+    def feed(self, data):
         """
-        Threads are created only when get_project is called, and terminate
-        before it returns. They are there primarily to parallelise I/O (i.e.
-        fetching web pages).
+        Process the next piece of the page's text.
+
+        :return: A list of the (url, rel) tuples for the links found which
+                 weren't returned before.
         """
-        self._threads = []
-        for i in range(self.num_workers):
-            t = threading.Thread(target=self._fetch)
-            t.setDaemon(True)
-            t.start()
-            self._threads.append(t)
+        # Only the text up to the end of the last complete tag is processed,
+        # so that a link split across pieces isn't missed.
+        data = self._buffer + data
+        i = data.rfind('>') + 1
+        self._buffer = data[i:]
+        return self._extract(data[:i])
 
-    def _wait_threads(self):
+    def close(self):
         """
-        Tell all the threads to terminate (by sending a sentinel value) and
-        wait for them to do so.
+        Process any remaining text, once the whole page has been fed.
+
+        :return: As for :meth:`feed`.
         """
-        # Note that you need two loops, since you can't say which
-        # thread will get each sentinel
-        for t in self._threads:
-            self._to_fetch.put(None)    # sentinel
-        for t in self._threads:
-            t.join()
-        self._threads = []
+        data, self._buffer = self._buffer, ''
+        return self._extract(data)
 
-    def _get_project(self, name):
-        self.result = result = {}
-        self.project_name = name
-        url = urljoin(self.base_url, '%s/' % quote(name))
-        self._seen.clear()
-        self._page_cache.clear()
-        self._prepare_threads()
-        try:
-            logger.debug('Queueing %s', url)
-            self._to_fetch.put(url)
-            self._to_fetch.join()
-        finally:
-            self._wait_threads()
-        del self.result
+    def _extract(self, data):
+        result = []
+        if not data:
+            return result
+        if not self._base_found:
+            m = Page._base.search(data)
+            if m:
+                self._base_found = True
+                self.base_url = m.group(1)
+        seen = self._seen
+        for match in self._href.finditer(data):
+            d = match.groupdict('')
+            rel = (d['rel1'] or d['rel2'] or d['rel3'] or
+                   d['rel4'] or d['rel5'] or d['rel6'])
+            url = d['url1'] or d['url2'] or d['url3']
+            url = urljoin(self.base_url, url)
+            if '&' in url:
+                url = unescape(url)
+            url = self._clean_re.sub(lambda m: '%%%2x' % ord(m.group(0)), url)
+            t = (url, rel)
+            if t not in seen:
+                seen.add(t)
+                result.append(t)
         return result
 
-    platform_dependent = re.compile(r'\b(linux-(i\d86|x86_64|arm\w+)|'
-                                    r'win(32|-amd64)|macosx-?\d+)\b', re.I)
 
-    def _is_platform_dependent(self, url):
-        """
-        Does an URL refer to a platform-specific download?
-        """
-        return self.platform_dependent.search(url)
+def _write_atomically(path, data):
+    """
+    Write bytes to a file via a temporary file and a rename, so that
+    concurrent readers (in this or another process) never see a partially
+    written file.
+    """
+    tmp = _get_temp_path(path)
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    _replace(tmp, path)
+
+
+def _get_temp_path(path):
+    return '%s.%s-%s.tmp' % (path, os.getpid(),
+                             threading.current_thread().ident)
+
+
+def _replace(tmp, path):
+    """
+    Rename a temporary file to its final name, replacing any existing file.
+    """
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        # On Windows, rename fails if the destination exists
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp, path)
+
+
+class PageCache(object):
+    """
+    A persistent cache for scraped pages. For each URL, the page contents are
+    stored together with the final URL (after any redirections) and the
+    ``ETag`` and ``Last-Modified`` validators returned by the server, so that
+    the page can be revalidated using a conditional request rather than
+    fetched again.
+    """
+
+    def __init__(self, base=None):
+        """
+        Initialise an instance.
+
+        :param base: The base directory where the cache should be located. If
+                     not specified, this will be the ``page-cache`` directory
+                     under whatever :func:`get_cache_base` returns.
+        """
+        if base is None:
+            base = os.path.join(get_cache_base(), 'page-cache')
+        # we use 'isdir' instead of 'exists', because we want to
+        # fail if there's a file with that name
+        if not os.path.isdir(base):
+            os.makedirs(base)
+        self.base = os.path.abspath(os.path.normpath(base))
+
+    def url_to_path(self, url):
+        """
+        Return the pathname in the cache used to store the entry for an URL.
+        """
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.base, key[:2], key + '.json')
+
+    def get(self, url):
+        """
+        Get the cache entry for an URL.
+
+        :param url: The URL which was requested.
+        :return: ``None`` if there is no usable entry, otherwise a dictionary
+                 with keys ``url``, ``final_url``, ``data``, ``etag`` and
+                 ``last_modified``.
+        """
+        result = None
+        path = self.url_to_path(url)
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    result = json.loads(f.read().decode('utf-8'))
+                if result.get('url') != url:
+                    # hash collision - very unlikely, but possible
+                    result = None
+            except Exception as e:
+                logger.warning('Unable to read cache entry %s: %s', path, e)
+                result = None
+        return result
+
+    def put(self, url, final_url, data, etag=None, last_modified=None):
+        """
+        Store the contents of a page in the cache.
+
+        :param url: The URL which was requested.
+        :param final_url: The URL the contents came from, after redirections.
+        :param data: The (Unicode) page contents.
+        :param etag: The value of the ``ETag`` response header, if any.
+        :param last_modified: The value of the ``Last-Modified`` response
+                              header, if any.
+        """
+        path = self.url_to_path(url)
+        dirname = os.path.dirname(path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        entry = {
+            'url': url,
+            'final_url': final_url,
+            'data': data,
+            'etag': etag,
+            'last_modified': last_modified,
+        }
+        _write_atomically(path, json.dumps(entry).encode('utf-8'))
+
+    def clear(self):
+        """
+        Clear the cache.
+        """
+        not_removed = []
+        for root, dirs, files in os.walk(self.base):
+            for fn in files:
+                fn = os.path.join(root, fn)
+                try:
+                    os.remove(fn)
+                except Exception:
+                    not_removed.append(fn)
+        return not_removed
+
+
+class ResultStore(object):
+    """
+    A store for the results of :meth:`Locator.get_project`, which can be
+    shared by several locators and processes, so that a project got by one of
+    them needn't be got again by the others. Results are held in an SQLite
+    database, which takes care of locking for concurrent readers and writers.
+    """
+
+    #: The number of seconds to wait for another process to release a lock
+    #: on the database.
+    lock_timeout = 30.0
+
+    def __init__(self, path=None, ttl=None, negative_ttl=None):
+        """
+        Initialise an instance.
+
+        :param path: The pathname of the database. If not specified, this
+                     will be ``locator-results.db`` in the directory returned
+                     by :func:`get_cache_base`.
+        :param ttl: The number of seconds for which a stored result is valid,
+                    or ``None`` if results don't expire.
+        :param negative_ttl: The number of seconds for which a result listing
+                             no versions is valid. If not specified, ``ttl``
+                             is used.
+        """
+        if sqlite3 is None:  # pragma: no cover
+            raise DistlibException('sqlite3 is needed for a result store')
+        if path is None:
+            path = os.path.join(get_cache_base(), 'locator-results.db')
+        self.path = os.path.abspath(path)
+        self.ttl = ttl
+        if negative_ttl is None:
+            negative_ttl = ttl
+        self.negative_ttl = negative_ttl
+        dirname = os.path.dirname(self.path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        conn = self._connect()
+        try:
+            # In WAL mode, readers don't block a writer or vice versa. The
+            # mode is persistent, so this only needs doing once.
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS results ('
+                             'locator TEXT, name TEXT, stored REAL, '
+                             'empty INTEGER, data TEXT, '
+                             'PRIMARY KEY (locator, name))')
+        finally:
+            conn.close()
+
+    def _connect(self):
+        # A connection is made for each operation, rather than kept, so that
+        # instances can be used from any thread and after a fork.
+        return sqlite3.connect(self.path, timeout=self.lock_timeout)
+
+    def get(self, key, name, scheme='default'):
+        """
+        Get a stored result.
+
+        :param key: The key identifying the locator the result is for.
+        :param name: The name of the project.
+        :param scheme: The version scheme to use for the distributions'
+                       metadata.
+        :return: A dictionary mapping versions to :class:`Distribution`
+                 instances, or ``None`` if no valid result is stored.
+        """
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute('SELECT stored, empty, data FROM results '
+                                   'WHERE locator = ? AND name = ?',
+                                   (key, name)).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning('Unable to read from result store %s: %s',
+                           self.path, e)
+            row = None
+        result = None
+        if row is not None:
+            stored, empty, data = row
+            if empty:
+                ttl = self.negative_ttl
+            else:
+                ttl = self.ttl
+            if ttl is None or time.time() < stored + ttl:
+                try:
+                    result = self._decode(data, scheme)
+                except Exception as e:
+                    logger.warning('Unable to use stored result for %s: %s',
+                                   name, e)
+        return result
+
+    def put(self, key, name, result):
+        """
+        Store a result. Results which can't be stored (for example, because
+        they contain installed distributions) are ignored.
+
+        :param key: The key identifying the locator the result is for.
+        :param name: The name of the project.
+        :param result: The dictionary of versions to distributions.
+        """
+        data = self._encode(result)
+        if data is not None:
+            try:
+                conn = self._connect()
+                try:
+                    with conn:
+                        conn.execute('INSERT OR REPLACE INTO results VALUES '
+                                     '(?, ?, ?, ?, ?)',
+                                     (key, name, time.time(), not result,
+                                      data))
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                logger.warning('Unable to write to result store %s: %s',
+                               self.path, e)
+
+    def clear(self):
+        """
+        Remove all stored results.
+        """
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM results')
+        finally:
+            conn.close()
+
+    def _encode(self, result):
+        d = {}
+        for version, dist in result.items():
+            # Installed distributions can't be re-created from their metadata
+            if type(dist) is not Distribution:
+                return None
+            entry = {
+                'metadata': dist.metadata.dictionary,
+                'source_url': dist.source_url,
+                'digest': dist.digest,
+            }
+            if 'exports' in dist.__dict__:
+                entry['exports'] = dist.exports
+            d[version] = entry
+        try:
+            return json.dumps(d, sort_keys=True)
+        except (TypeError, ValueError) as e:
+            logger.debug('Unable to store result: %s', e)
+            return None
+
+    def _decode(self, data, scheme):
+        result = {}
+        for version, entry in json.loads(data).items():
+            md = Metadata(mapping=entry['metadata'], scheme=scheme)
+            md.source_url = entry['source_url']
+            dist = Distribution(md)
+            if entry['digest']:
+                dist.digest = tuple(entry['digest'])
+            if 'exports' in entry:
+                dist.exports = entry['exports']
+            result[version] = dist
+        return result
+
+
+class RangeReader(object):
+    """
+    A read-only, seekable file-like object for a file on a web server, which
+    only gets the parts of the file which are read, using HTTP Range
+    requests. The end of the file is got when the instance is created, so
+    that a zip file's directory can be read without further requests.
+    """
+
+    #: The number of bytes at the end of the file to get initially. This is
+    #: enough for a zip file's end-of-central-directory record, even with
+    #: the longest possible comment, and typically the central directory.
+    tail_size = 65536 + 22
+
+    #: The minimum number of bytes to get in each subsequent request.
+    blocksize = 8192
+
+    def __init__(self, opener, url, timeout=None):
+        """
+        Initialise an instance.
+
+        :param opener: The opener to use for requests.
+        :param url: The URL of the file.
+        :param timeout: The timeout for requests.
+        :raises DistlibException: If the server doesn't support Range
+                                  requests for the URL.
+        """
+        self.opener = opener
+        self.url = url
+        self.timeout = timeout
+        self.pos = 0
+        self.requests = 0
+        self._blocks = []   # (start offset, data) tuples
+        self.size = self._get('bytes=-%d' % self.tail_size)
+
+    def _get(self, spec):
+        """
+        Get a range of the file, remembering its data, and return the size
+        of the file.
+        """
+        req = Request(self.url, headers={'Range': spec,
+                                         'Accept-Encoding': 'identity'})
+        resp = self.opener.open(req, timeout=self.timeout)
+        try:
+            self.requests += 1
+            m = CONTENT_RANGE.match(resp.info().get('Content-Range', ''))
+            if resp.getcode() != 206 or not m:
+                raise DistlibException('Range requests not supported for '
+                                       '%s' % self.url)
+            self._blocks.append((int(m.group(1)), resp.read()))
+        finally:
+            resp.close()
+        return int(m.group(3))
+
+    def _get_cached(self, start, n):
+        for offset, data in self._blocks:
+            if offset <= start and start + n <= offset + len(data):
+                return data[start - offset:start - offset + n]
+        return None
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            n = self.size - self.pos
+        n = max(0, min(n, self.size - self.pos))
+        if not n:
+            return b''
+        result = self._get_cached(self.pos, n)
+        if result is None:
+            end = min(self.size, self.pos + max(n, self.blocksize))
+            self._get('bytes=%d-%d' % (self.pos, end - 1))
+            result = self._get_cached(self.pos, n)
+        self.pos += len(result)
+        return result
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.pos
+        elif whence == 2:
+            offset += self.size
+        if offset < 0:
+            raise IOError('Invalid offset: %d' % offset)
+        self.pos = offset
+        return offset
+
+    def tell(self):
+        return self.pos
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        self._blocks = []
+
+
+class MetadataFetcher(object):
+    """
+    Gets the metadata for distributions from their archives, reading as
+    little of each archive as possible. For a wheel or zip sdist on a web
+    server, only the zip directory and the metadata file are got, using HTTP
+    Range requests. A tar sdist is streamed, and reading stops as soon as its
+    ``PKG-INFO`` has been read.
+    """
+
+    tar_extensions = ('.tar.gz', '.tar.bz2', '.tar', '.tgz', '.tbz')
+
+    def __init__(self, opener=None, timeout=None):
+        """
+        Initialise an instance.
+
+        :param opener: The opener to use for requests. If not specified, one
+                       is built which doesn't keep connections alive.
+        :param timeout: The timeout, in seconds, for requests.
+        """
+        if opener is None:
+            opener = build_opener(RedirectHandler())
+        self.opener = opener
+        self.timeout = timeout
+
+    def _open(self, url, stream=False):
+        """
+        Open an archive at an URL for reading, either as a stream or with
+        random access.
+        """
+        scheme, _, path, _, _, _ = urlparse(url)
+        if scheme == 'file':
+            result = open(url2pathname(path), 'rb')
+        elif stream:
+            req = Request(url, headers={'Accept-Encoding': 'identity'})
+            result = self.opener.open(req, timeout=self.timeout)
+        else:
+            result = RangeReader(self.opener, url, self.timeout)
+        return result
+
+    def _make_metadata(self, data, scheme):
+        data = data.decode('utf-8', 'replace')
+        return Metadata(fileobj=StringIO(data), scheme=scheme)
+
+    def get_metadata(self, url, scheme='default'):
+        """
+        Get the metadata from the archive at an URL.
+
+        :param url: The URL of the archive.
+        :param scheme: The version scheme to use for the metadata.
+        :return: A :class:`Metadata` instance, or ``None`` if the archive
+                 isn't of a supported type or the metadata couldn't be got.
+        """
+        result = None
+        path = urlparse(url)[2]
+        try:
+            if path.endswith('.whl'):
+                # pydist.json is preferred to METADATA
+                result = self._get_zip_metadata(url, scheme, [
+                    lambda parts: (parts[0].endswith('.dist-info') and
+                                   parts[1] == METADATA_FILENAME),
+                    lambda parts: (parts[0].endswith('.dist-info') and
+                                   parts[1] == 'METADATA'),
+                ])
+            elif path.endswith('.zip'):
+                result = self._get_zip_metadata(url, scheme, [
+                    lambda parts: parts[1] == 'PKG-INFO'
+                ])
+            elif path.endswith(self.tar_extensions):
+                result = self._get_tar_metadata(url, scheme)
+        except Exception as e:
+            logger.warning('Unable to get metadata from %s: %s', url, e)
+        return result
+
+    def _get_zip_metadata(self, url, scheme, matchers):
+        """
+        Get the metadata from a zip file. Each of the matchers is called in
+        turn with the parts of the names of the files at the second level
+        of the archive's tree, and the first file matched is used.
+        """
+        f = self._open(url)
+        try:
+            with ZipFile(f) as zf:
+                names = zf.namelist()
+                for matcher in matchers:
+                    for name in names:
+                        parts = name.split('/')
+                        if len(parts) == 2 and matcher(parts):
+                            return self._make_metadata(zf.read(name), scheme)
+        finally:
+            f.close()
+        logger.debug('No metadata found in %s', url)
+        return None
 
-    def _process_download(self, url):
+    def _get_tar_metadata(self, url, scheme):
+        """
+        Get the metadata from a tar sdist, stopping as soon as its PKG-INFO
+        has been read. Nothing is written to disk.
+        """
+        f = self._open(url, stream=True)
+        try:
+            tf = tarfile.open(fileobj=f, mode='r|*')
+            for info in tf:
+                name = info.name
+                if name.startswith('./'):
+                    name = name[2:]
+                parts = name.split('/')
+                if (len(parts) == 2 and parts[1] == 'PKG-INFO' and
+                    info.isfile()):
+                    data = tf.extractfile(info).read()
+                    return self._make_metadata(data, scheme)
+        finally:
+            f.close()
+        logger.debug('No metadata found in %s', url)
+        return None
+
+    def update(self, dist, scheme='default'):
+        """
+        Replace a distribution's metadata, and so its dependencies, with the
+        metadata from its archive. Its source URL is kept.
+
+        :param dist: The distribution to update.
+        :param scheme: The version scheme to use for the metadata.
+        :return: True if the metadata was replaced, else False.
+        """
+        url = dist.source_url
+        md = url and self.get_metadata(url, scheme)
+        if not md:
+            return False
+        md.source_url = url
+        dist.metadata = md
+        return True
+
+
+class PartialResult(dict):
+    """
+    A result from :meth:`Locator.get_project` which may not list every
+    version, because the locator gave up before it had finished looking.
+    Partial results aren't cached.
+    """
+
+
+class _Crawl(object):
+    """
+    The state of a crawl for a single project: the result being built, the
+    links seen so far and the number of pages still to be processed. The
+    crawl's future is completed when there are no more pages to process.
+
+    Pages are either internal (on the index's host) or external. Once a crawl
+    has expired, external pages are no longer fetched.
+    """
+    def __init__(self, name, matcher=None, deadline=None):
+        self.name = name
+        # If specified, the crawl is stopped once a version which this
+        # matcher matches is found.
+        self.matcher = matcher
+        # If specified, the time after which external pages are given up on.
+        self.deadline = deadline
+        self.stopped = False
+        self.expired = False
+        # Whether any pages have been given up on
+        self.partial = False
+        self.result = {}
+        self.lock = threading.Lock()
+        self.future = Future()
+        self._seen = set()
+        self._pending = 0
+        self._internal = 0
+        self._internal_done = threading.Condition(self.lock)
+        self._futures = []
+
+    def is_new(self, link):
+        """
+        Return True if a link hasn't been seen before in this crawl.
+        """
+        with self.lock:
+            result = link not in self._seen
+            if result:
+                self._seen.add(link)
+        return result
+
+    def started(self, internal=True):
+        with self.lock:
+            self._pending += 1
+            if internal:
+                self._internal += 1
+
+    def finished(self, internal=True):
+        with self.lock:
+            self._pending -= 1
+            if internal:
+                self._internal -= 1
+                if not self._internal:
+                    self._internal_done.notify_all()
+            done = not self._pending
+        if done:
+            self.future.set_result(self.result)
+
+    def add_future(self, future, internal=True):
+        """
+        Remember the future for a page fetch, so that it can be cancelled if
+        the crawl is stopped.
+        """
+        with self.lock:
+            self._futures = [t for t in self._futures if not t[0].done()]
+            self._futures.append((future, internal))
+
+    def stop(self):
+        """
+        Stop the crawl: no more pages are queued, and fetches which haven't
+        started yet are cancelled.
+        """
+        with self.lock:
+            self.stopped = True
+            futures, self._futures = self._futures, []
+        for f, internal in futures:
+            if f.cancel():
+                self.finished(internal)
+
+    def expire(self, timeout=None):
+        """
+        Give up on the external pages: no more are queued, and fetches which
+        haven't started yet are cancelled. Once the internal pages have all
+        been processed, the crawl is stopped.
+
+        :param timeout: If specified, the number of seconds to wait for the
+                        internal pages. If they haven't all been processed
+                        by then, the crawl is stopped anyway and the rest
+                        of them are given up on, too.
+        :return: The result so far, as a :class:`PartialResult` if any pages
+                 were given up on.
+        """
+        with self.lock:
+            self.expired = True
+            futures = [t for t in self._futures if not t[1]]
+            self._futures = [t for t in self._futures if t[1]]
+        for f, internal in futures:
+            if f.cancel():
+                self.partial = True
+                self.finished(internal)
+        if timeout is not None:
+            end = time.time() + timeout
+        with self.lock:
+            while self._internal:
+                if timeout is None:
+                    self._internal_done.wait()
+                else:
+                    remaining = end - time.time()
+                    if remaining <= 0:
+                        self.partial = True
+                        break
+                    self._internal_done.wait(remaining)
+            self.stopped = True
+            futures, self._futures = self._futures, []
+            if self._pending or self.partial:
+                result = PartialResult(self.result)
+            else:
+                result = dict(self.result)
+        for f, internal in futures:
+            if f.cancel():
+                self.finished(internal)
+        return result
+
+
+class SimpleScrapingLocator(Locator):
+    """
+    A locator which scrapes HTML pages to locate downloads for a distribution.
+    This runs multiple threads to do the I/O; performance is at least as good
+    as pip's PackageFinder, which works in an analogous fashion.
+
+    The threads are started when first needed and are shared by all
+    get_project calls, which can safely be made concurrently. Call
+    :meth:`close` (or use the locator as a context manager) to shut them down.
+    """
+
+    # These are used to deal with various Content-Encoding schemes.
+    # The content encodings we ask for, and how to decode them. The values
+    # are arguments to zlib.decompressobj(); None means no decoding is
+    # needed.
+    decoders = {
+        'deflate': zlib.MAX_WBITS,
+        'gzip': 16 + zlib.MAX_WBITS,
+        'x-gzip': 16 + zlib.MAX_WBITS,
+        'identity': None,
+        'none': None,
+    }
+
+    accept_encoding = 'gzip, deflate'
+
+    # The size of the blocks in which responses are read and decoded.
+    blocksize = 16384
+
+    def _decode_content(self, blocks, encoding):
+        """
+        Decode the blocks of a response body, as they're read, according to
+        its Content-Encoding. This is a generator which yields the decoded
+        data a block at a time, so that the whole of a compressed body is
+        never held in memory.
+        """
+        wbits = self.decoders[(encoding or 'identity').lower()]
+        if wbits is None:
+            for block in blocks:
+                yield block
+        else:
+            decoder = zlib.decompressobj(wbits)
+            first = True
+            for block in blocks:
+                if first and block:
+                    first = False
+                    try:
+                        data = decoder.decompress(block)
+                    except zlib.error:
+                        if wbits != zlib.MAX_WBITS:
+                            raise
+                        # Some servers send raw deflate data rather than the
+                        # zlib format which the HTTP spec calls for.
+                        decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+                        data = decoder.decompress(block)
+                else:
+                    data = decoder.decompress(block)
+                if data:
+                    yield data
+            data = decoder.flush()
+            if data:
+                yield data
+
+    def __init__(self, url, timeout=None, num_workers=10, page_cache=None,
+                 stop_on_match=False, scheduler=None, memory_cache=None,
+                 external_deadline=None, **kwargs):
+        """
+        Initialise an instance.
+        :param url: The root URL to use for scraping.
+        :param timeout: The timeout, in seconds, to be applied to requests.
+                        This defaults to ``None`` (no timeout specified).
+        :param num_workers: The number of worker threads you want to do I/O,
+                            This defaults to 10.
+        :param page_cache: If specified, this is a :class:`PageCache` instance
+                           used to persist fetched pages between locator
+                           instances and processes. Pages in the cache are
+                           revalidated with conditional requests. If ``True``,
+                           a :class:`PageCache` in the default location is
+                           used. This defaults to ``None`` (no persistent
+                           caching).
+        :param stop_on_match: If true, then when :meth:`locate` is called with
+                              a requirement which pins an exact version,
+                              scraping stops as soon as a download for that
+                              version is found. This defaults to ``False``.
+        :param scheduler: The :class:`~distlib.util.HostScheduler` used to
+                          rate-limit and retry requests, and to stop making
+                          requests to hosts which keep failing. If not
+                          specified, one with default settings is used.
+        :param memory_cache: The mapping used to hold fetched pages (and
+                             failures to fetch them) in memory - for example,
+                             an :class:`~distlib.util.LRUCache`, to bound its
+                             size and have pages expire. If not specified, a
+                             dictionary is used, which is cleared whenever a
+                             project is got while no other project is being
+                             got.
+        :param external_deadline: If specified, the number of seconds after
+                                  a project's crawl starts for which pages
+                                  on hosts other than the index's are
+                                  waited for. After that, the result is
+                                  returned as soon as the index's own pages
+                                  have been processed, as a
+                                  :class:`PartialResult` if any pages were
+                                  given up on. The index's own pages are
+                                  then given up on, too, if they haven't
+                                  been processed within ``timeout``
+                                  seconds, so without a timeout a slow
+                                  index can still hold the result up. This
+                                  defaults to ``None`` (no deadline).
+        :param kwargs: Passed to the superclass.
+        """
+        super(SimpleScrapingLocator, self).__init__(**kwargs)
+        self.base_url = ensure_slash(url)
+        self.timeout = timeout
+        if page_cache is True:
+            page_cache = PageCache()
+        self.page_cache = page_cache
+        self._clear_pages = memory_cache is None
+        if memory_cache is None:
+            memory_cache = {}
+        self._page_cache = memory_cache
+        if scheduler is None:
+            scheduler = HostScheduler()
+        self.scheduler = scheduler
+        self.skip_externals = False
+        self.stop_on_match = stop_on_match
+        self.external_deadline = external_deadline
+        self.num_workers = num_workers
+        self._lock = threading.RLock()
+        self._pool = None
+        self._active = 0
+
+    def _get_pool(self):
+        """
+        Return the pool of worker threads used to fetch pages. This is
+        created when first needed, and shared by all get_project calls until
+        the locator is closed. The threads are there primarily to parallelise
+        I/O (i.e. fetching web pages).
+        """
+        with self._lock:
+            if self._pool is None:
+                self._pool = WorkerPool(self.num_workers)
+            return self._pool
+
+    def close(self):
+        """
+        Shut down the worker threads used to fetch pages. If the locator is
+        used after being closed, new threads are started as needed.
+        """
+        super(SimpleScrapingLocator, self).close()
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+
+    def _get_metadata_pool(self):
+        # The crawls are over by the time metadata is got, so the pool used
+        # to fetch pages can be used for it.
+        return self._get_pool()
+
+    def get_project_fingerprint(self, name):
+        """
+        If a persistent page cache is configured, a project's fingerprint
+        is computed from the ``ETag`` and ``Last-Modified`` validators of its
+        page, which is revalidated if it's cached. Pages linked to from the
+        project's page aren't taken into account.
+        """
+        result = super(SimpleScrapingLocator,
+                       self).get_project_fingerprint(name)
+        if result is None and self.page_cache is not None:
+            url = self._get_page_url(urljoin(self.base_url,
+                                             '%s/' % quote(name)))
+            if self.get_page(url) is not None:
+                entry = self.page_cache.get(url)
+                if entry and (entry.get('etag') or
+                              entry.get('last_modified')):
+                    result = json.dumps([url, entry['final_url'],
+                                         entry.get('etag'),
+                                         entry.get('last_modified')])
+        return result
+
+    def _can_fingerprint_projects(self):
+        return self.page_cache is not None
+
+    def clear_cache(self):
+        super(SimpleScrapingLocator, self).clear_cache()
+        self._page_cache.clear()
+
+    def _stop_matcher(self, matcher):
+        """
+        Return the matcher which stops a crawl, if stop_on_match is set and
+        the specified matcher pins an exact version, else None.
+        """
+        if self.stop_on_match and matcher and matcher.exact_version:
+            return matcher
+        return None
+
+    def _may_cache(self, matcher):
+        return self._stop_matcher(matcher) is None
+
+    def _start_crawl(self, name, matcher=None):
+        """
+        Start a crawl for a project, returning without waiting for it to
+        finish.
+        """
+        url = urljoin(self.base_url, '%s/' % quote(name))
+        deadline = self.external_deadline
+        if deadline is not None:
+            deadline += time.time()
+        crawl = _Crawl(name, self._stop_matcher(matcher), deadline)
+        with self._lock:
+            # Only clear the page cache if no other crawl is using it, and
+            # it isn't managing its entries itself
+            if self._clear_pages and not self._active:
+                self._page_cache.clear()
+            self._active += 1
+        try:
+            logger.debug('Queueing %s', url)
+            self._queue(crawl, url)
+        except Exception:
+            self._finish_crawl(crawl)
+            raise
+        return crawl
+
+    def _finish_crawl(self, crawl):
+        """
+        Wait for a crawl to finish, and return its result.
+        """
+        try:
+            if (crawl.deadline is None or
+                crawl.future.wait(crawl.deadline - time.time())):
+                result = crawl.future.result()
+            else:
+                result = crawl.expire(self.timeout)
+        finally:
+            with self._lock:
+                self._active -= 1
+        return result
+
+    def _get_project(self, name):
+        return self._finish_crawl(self._start_crawl(name, self.matcher))
+
+    def _get_projects(self, matchers):
+        # The crawls for all the projects share the worker pool, so there's
+        # no need for any more threads: just start them all, then wait.
+        crawls = []
+        try:
+            for name, matcher in matchers.items():
+                crawls.append(self._start_crawl(name, matcher))
+        finally:
+            result = {}
+            for crawl in crawls:
+                result[crawl.name] = self._finish_crawl(crawl)
+        return result
+
+    def _is_internal(self, url):
+        """
+        Return whether an URL is on the same host as the index.
+        """
+        return urlparse(url)[1] == urlparse(self.base_url)[1]
+
+    def _queue(self, crawl, url):
+        """
+        Arrange for a page to be fetched and processed as part of a crawl.
+
+        Internal pages (on the index's host) are fetched before any external
+        ones waiting to be fetched, for all crawls, so that a slow external
+        host can't hold up the pages which most downloads are found on.
+        """
+        internal = self._is_internal(url)
+        if crawl.stopped:
+            return
+        if crawl.expired and not internal:
+            crawl.partial = True
+            return
+        crawl.started(internal)
+        if internal:
+            priority = 0
+        else:
+            priority = 1
+        try:
+            future = self._get_pool().submit_priority(priority, self._fetch,
+                                                      crawl, url, internal)
+            crawl.add_future(future, internal)
+        except Exception:
+            crawl.finished(internal)
+            raise
+
+    platform_dependent = re.compile(r'\b(linux-(i\d86|x86_64|arm\w+)|'
+                                    r'win(32|-amd64)|macosx-?\d+)\b', re.I)
+
+    def _is_platform_dependent(self, url):
+        """
+        Does an URL refer to a platform-specific download?
+        """
+        return self.platform_dependent.search(url)
+
+    def _process_download(self, url, crawl):
         """
         See if an URL is a suitable download for a project.
 
-        If it is, register information in the result dictionary (for
-        _get_project) about the specific version it's for.
+        If it is, register information in the result dictionary of the crawl
+        (for _get_project) about the specific version it's for.
 
         Note that the return value isn't actually used other than as a boolean
         value.
@@ -596,11 +2099,21 @@ class SimpleScrapingLocator(Locator):
         if self._is_platform_dependent(url):
             info = None
         else:
-            info = self.convert_url_to_download_info(url, self.project_name)
+            info = self.convert_url_to_download_info(url, crawl.name)
         logger.debug('process_download: %s -> %s', url, info)
         if info:
-            with self._lock:    # needed because self.result is shared
-                self._update_version_data(self.result, info)
+            version = info['version']
+            with crawl.lock:    # needed because crawl.result is shared
+                self._update_version_data(crawl.result, info)
+            if crawl.matcher is not None and not crawl.stopped:
+                try:
+                    matched = crawl.matcher.match(version)
+                except UnsupportedVersionError:
+                    matched = False
+                if matched:
+                    logger.debug('Found %s for %s, stopping crawl', version,
+                                 crawl.matcher)
+                    crawl.stop()
         return info
 
     def _should_queue(self, link, referrer, rel):
@@ -632,112 +2145,328 @@ class SimpleScrapingLocator(Locator):
                      referrer, result)
         return result
 
-    def _fetch(self):
+    def _fetch(self, crawl, url, internal=True):
+        """
+        Get the HTML page for an URL which is part of a crawl, and examine its
+        links for download candidates and candidates for further scraping.
+
+        This is run in a worker thread.
+        """
+        def process_link(link, rel):
+            if crawl.is_new(link):
+                if (not self._process_download(link, crawl) and
+                    self._should_queue(link, url, rel)):
+                    logger.debug('Queueing %s from %s', link, url)
+                    self._queue(crawl, link)
+
+        try:
+            # Links are processed as they're read
+            if not crawl.stopped:
+                self.get_page(url, process_link)
+        except Exception as e:
+            logger.exception('Processing failed: %s: %s', url, e)
+        finally:
+            # always do this, to avoid hangs :-)
+            crawl.finished(internal)
+
+    def _decode_text(self, blocks, encoding):
+        """
+        Decode blocks of bytes to text as they're read, falling back to
+        Latin-1 if they can't be decoded using the specified encoding.
+        """
+        try:
+            decoder = codecs.getincrementaldecoder(encoding)()
+        except LookupError:
+            decoder = codecs.getincrementaldecoder('latin-1')()
+        final = False
+        for block in itertools.chain(blocks, [None]):
+            if block is None:
+                block, final = b'', True
+            try:
+                text = decoder.decode(block, final)
+            except UnicodeError:
+                # Decode the rest of the page as Latin-1, starting with any
+                # bytes the decoder was holding back
+                pending = decoder.getstate()[0]
+                decoder = codecs.getincrementaldecoder('latin-1')()
+                text = decoder.decode(pending + block, final)
+            if text:
+                yield text
+
+    def _iter_text(self, resp):
+        """
+        Read and decode an HTML response, yielding its text in pieces as the
+        blocks arrive.
+        """
+        headers = resp.info()
+        encoding = 'utf-8'
+        m = CHARSET.search(headers.get('Content-Type', ''))
+        if m:
+            encoding = m.group(1)
+        blocks = iter(lambda: resp.read(self.blocksize), b'')
+        # fails if the content encoding isn't known
+        blocks = self._decode_content(blocks,
+                                      headers.get('Content-Encoding'))
+        return self._decode_text(blocks, encoding)
+
+    def _read_page(self, resp, url, callback=None):
         """
-        Get a URL to fetch from the work queue, get the HTML page, examine its
-        links for download candidates and candidates for further scraping.
+        Read and decode an HTML response, extracting its links as the blocks
+        arrive. If a callback is specified, it's called with each link's URL
+        and "rel" attribute as soon as the link has been read.
 
-        This is a handy method to run in a thread.
+        :return: A tuple of the page's text and a list of its links.
         """
-        while True:
-            url = self._to_fetch.get()
-            try:
-                if url:
-                    page = self.get_page(url)
-                    if page is None:    # e.g. after an error
-                        continue
-                    for link, rel in page.links:
-                        if link not in self._seen:
-                            self._seen.add(link)
-                            if (not self._process_download(link) and
-                                self._should_queue(link, url, rel)):
-                                logger.debug('Queueing %s from %s', link, url)
-                                self._to_fetch.put(link)
-            finally:
-                # always do this, to avoid hangs :-)
-                self._to_fetch.task_done()
-            if not url:
-                #logger.debug('Sentinel seen, quitting.')
-                break
+        extractor = LinkExtractor(url)
+        parts = []
+        links = []
+        for text in self._iter_text(resp):
+            parts.append(text)
+            found = extractor.feed(text)
+            links.extend(found)
+            if callback:
+                for link, rel in found:
+                    callback(link, rel)
+        found = extractor.close()
+        links.extend(found)
+        if callback:
+            for link, rel in found:
+                callback(link, rel)
+        return ''.join(parts), links
 
-    def get_page(self, url):
+    def get_page(self, url, callback=None):
         """
         Get the HTML for an URL, possibly from an in-memory cache.
 
-        XXX TODO Note: this cache is never actually cleared. It's assumed that
-        the data won't get stale over the lifetime of a locator instance (not
-        necessarily true for the default_locator).
-        """
-        # http://peak.telecommunity.com/DevCenter/EasyInstall#package-index-api
-        scheme, netloc, path, _, _, _ = urlparse(url)
-        if scheme == 'file' and os.path.isdir(url2pathname(path)):
-            url = urljoin(ensure_slash(url), 'index.html')
+        If a callback is specified, it's called with the URL and "rel"
+        attribute of each link on the page. When the page is fetched, this
+        happens while it's being read, so that links can be processed before
+        the whole page has arrived.
 
-        if url in self._page_cache:
-            result = self._page_cache[url]
+        If a persistent page cache is configured and holds an entry for the
+        URL, a conditional request is made and the cached page is reused if
+        the server reports that it hasn't been modified.
+
+        Pages are also held in memory, in the locator's ``memory_cache``.
+        Unless a cache which bounds its size and expires entries is provided,
+        this is cleared when a project is got while no other project is
+        being got.
+        """
+        url = self._get_page_url(url)
+        result = self._page_cache.get(url, _MISSING)
+        if result is not _MISSING:
             logger.debug('Returning %s from cache: %s', url, result)
         else:
-            host = netloc.split(':', 1)[0]
             result = None
-            if host in self._bad_hosts:
-                logger.debug('Skipping %s due to bad host %s', url, host)
-            else:
-                req = Request(url, headers={'Accept-encoding': 'identity'})
-                try:
-                    logger.debug('Fetching %s', url)
-                    resp = self.opener.open(req, timeout=self.timeout)
-                    logger.debug('Fetched %s', url)
-                    headers = resp.info()
-                    content_type = headers.get('Content-Type', '')
-                    if HTML_CONTENT_TYPE.match(content_type):
-                        final_url = resp.geturl()
-                        data = resp.read()
-                        encoding = headers.get('Content-Encoding')
-                        if encoding:
-                            decoder = self.decoders[encoding]   # fail if not found
-                            data = decoder(data)
-                        encoding = 'utf-8'
-                        m = CHARSET.search(content_type)
-                        if m:
-                            encoding = m.group(1)
-                        try:
-                            data = data.decode(encoding)
-                        except UnicodeError:
-                            data = data.decode('latin-1')    # fallback
+
+            def read(resp, final_url):
+                return self._read_page(resp, final_url, callback)
+
+            try:
+                fetched = self._open_page(url, read)
+                if fetched is not None:
+                    headers, final_url, value = fetched
+                    if headers is None:
+                        # not modified: the cached text was returned
+                        result = Page(value, final_url)
+                    elif value is not None:
+                        data, links = value
+                        callback = None     # links already processed
                         result = Page(data, final_url)
+                        result.links = sorted(links, key=lambda t: t[0],
+                                              reverse=True)
+                        self._put_page(url, final_url, data, headers)
+                    if result is not None:
                         self._page_cache[final_url] = result
-                except HTTPError as e:
-                    if e.code != 404:
-                        logger.exception('Fetch failed: %s: %s', url, e)
-                except URLError as e:
-                    logger.exception('Fetch failed: %s: %s', url, e)
-                    with self._lock:
-                        self._bad_hosts.add(host)
-                except Exception as e:
+            except HTTPError as e:
+                if e.code != 404:
                     logger.exception('Fetch failed: %s: %s', url, e)
-                finally:
-                    self._page_cache[url] = result   # even if None (failure)
+            except Exception as e:
+                logger.exception('Fetch failed: %s: %s', url, e)
+            finally:
+                self._page_cache[url] = result   # even if None (failure)
+        if callback and result is not None:
+            for link, rel in result.links:
+                callback(link, rel)
+        return result
+
+    def _get_page_url(self, url):
+        """
+        Return the URL to request for a page: for a local directory, this is
+        its index.html.
+        """
+        # http://peak.telecommunity.com/DevCenter/EasyInstall#package-index-api
+        scheme, _, path, _, _, _ = urlparse(url)
+        if scheme == 'file' and os.path.isdir(url2pathname(path)):
+            url = urljoin(ensure_slash(url), 'index.html')
+        return url
+
+    def _open_page(self, url, process):
+        """
+        Request a page. Unless it's a local file, the request is subject to
+        the scheduler's circuit breaker and rate limit for the host, and is
+        retried after transient errors. If the persistent page cache holds an
+        entry for the URL, a conditional request is made.
+
+        :param url: The URL of the page, as returned by _get_page_url().
+        :param process: A callable which is passed an HTML response and its
+                        final URL, as part of the same attempt as the request
+                        (so that errors reading the response are retried
+                        too).
+        :return: ``None`` if the host is unavailable, otherwise a tuple of
+                 the response headers, the final URL and the result of
+                 ``process`` (``None`` if the response isn't HTML). If the
+                 page hasn't been modified since it was cached, the headers
+                 are ``None`` and the cached text is returned instead.
+        :raises HTTPError: If the server returns an error. The error is
+                           closed, so that its connection can be reused.
+        """
+        scheme, netloc, _, _, _, _ = urlparse(url)
+        host = netloc.split(':', 1)[0]
+        if scheme != 'file' and not self.scheduler.is_available(host):
+            logger.debug('Skipping %s due to bad host %s', url, host)
+            return None
+        headers = {'Accept-encoding': self.accept_encoding}
+        cached = None
+        if self.page_cache is not None and scheme != 'file':
+            cached = self.page_cache.get(url)
+            if cached:
+                if cached.get('etag'):
+                    headers['If-None-Match'] = cached['etag']
+                if cached.get('last_modified'):
+                    headers['If-Modified-Since'] = cached['last_modified']
+        req = Request(url, headers=headers)
+
+        def fetch():
+            logger.debug('Fetching %s', url)
+            resp = self.opener.open(req, timeout=self.timeout)
+            logger.debug('Fetched %s', url)
+            headers = resp.info()
+            content_type = headers.get('Content-Type', '')
+            if not HTML_CONTENT_TYPE.match(content_type):
+                resp.close()
+                return headers, None, None
+            final_url = resp.geturl()
+            return headers, final_url, process(resp, final_url)
+
+        try:
+            if scheme == 'file':
+                result = fetch()
+            else:
+                # rate-limited, and retried on transient errors
+                result = self.scheduler.call(host, fetch)
+        except HTTPError as e:
+            e.close()   # so that its connection can be reused
+            if e.code != 304 or not cached:
+                raise
+            logger.debug('Not modified: %s', url)
+            result = None, cached['final_url'], cached['data']
         return result
 
+    def _put_page(self, url, final_url, data, headers):
+        """
+        Put a fetched page in the persistent page cache, if there is one and
+        the response headers allow the page to be revalidated.
+        """
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if (self.page_cache is not None and
+            not url.startswith('file:') and (etag or last_modified)):
+            self.page_cache.put(url, final_url, data, etag, last_modified)
+
     _distname_re = re.compile('<a href=[^>]*>([^<]+)<')
 
     def get_distribution_names(self):
         """
         Return all the distribution names known to this locator.
         """
-        result = set()
-        page = self.get_page(self.base_url)
-        if not page:
-            raise DistlibException('Unable to get %s' % self.base_url)
-        for match in self._distname_re.finditer(page.data):
-            result.add(match.group(1))
-        return result
+        return set(self.iter_distribution_names())
+
+    def iter_distribution_names(self):
+        """
+        Return an iterator over all the distribution names known to this
+        locator. The names are yielded as the index's root page is read,
+        which isn't kept, so that even a very large root page doesn't need
+        to be held in memory. The page is requested as by :meth:`get_page`,
+        so that it can be revalidated if a persistent page cache is
+        configured.
+        """
+        url = self._get_page_url(self.base_url)
+        page = self._page_cache.get(url)
+        if page is not None:
+            return self._iter_names([page.data])
+        try:
+            fetched = self._open_page(url, lambda resp, final_url: resp)
+        except Exception as e:
+            raise DistlibException('Unable to get %s: %s' % (url, e))
+        if fetched is None:
+            raise DistlibException('Unable to get %s: host unavailable' % url)
+        headers, final_url, resp = fetched
+        if headers is None:
+            # not modified: the cached text was returned
+            return self._iter_names([resp])
+        if resp is None:
+            raise DistlibException('Unable to get %s: unexpected content '
+                                   'type %r' % (url,
+                                                headers.get('Content-Type',
+                                                            '')))
+        texts = self._iter_text(resp)
+        if self.page_cache is not None:
+            texts = self._iter_put_page(texts, url, final_url, headers)
+        return self._iter_names(texts, resp)
+
+    def _iter_put_page(self, texts, url, final_url, headers):
+        """
+        Yield pieces of a page's text, and once the whole page has been read,
+        put it in the persistent page cache (see _put_page).
+        """
+        parts = []
+        for text in texts:
+            parts.append(text)
+            yield text
+        self._put_page(url, final_url, ''.join(parts), headers)
+
+    def _iter_names(self, texts, resp=None):
+        """
+        Yield the distribution names in pieces of a root page's text. Only
+        the text which might hold the start of a name not yet found is kept
+        between pieces.
+        """
+        try:
+            buf = ''
+            for text in texts:
+                buf += text
+                end = 0
+                for match in self._distname_re.finditer(buf):
+                    yield match.group(1)
+                    end = match.end()
+                # A name not yet found must be in a link which starts at the
+                # last '<', as the pattern contains no other '<'.
+                i = buf.rfind('<', end)
+                if i < 0:
+                    buf = ''
+                else:
+                    buf = buf[i:]
+        finally:
+            if resp is not None:
+                resp.close()
 
 class DirectoryLocator(Locator):
     """
     This class locates distributions in a directory tree.
+
+    The tree is scanned once, to build an index of the archives in it by
+    project name, and is only scanned again if a directory in it changes
+    (as indicated by its modification time). The directories are checked
+    for changes on every lookup, unless a ``check_interval`` is specified,
+    in which case they're checked at most once every ``check_interval``
+    seconds. The index can optionally be saved to a file, so that it can be
+    reused by other instances (and processes).
     """
 
+    # The version of the persisted index format
+    index_version = 1
+
     def __init__(self, path, **kwargs):
         """
         Initialise an instance.
@@ -747,13 +2476,37 @@ class DirectoryLocator(Locator):
                        * recursive - if True (the default), subdirectories are
                          recursed into. If False, only the top-level directory
                          is searched,
+                       * index_path - if specified, the path of a file in
+                         which the index of the tree is saved, and from which
+                         it is loaded if still valid,
+                       * check_interval - the minimum number of seconds
+                         between checks of the tree for changes (0 by
+                         default, so that it's checked on every lookup).
+                         Large trees may be worth checking less often. If
+                         None, the tree is only checked when the index is
+                         first needed, or after :meth:`clear_cache` is
+                         called.
         """
         self.recursive = kwargs.pop('recursive', True)
+        self.index_path = kwargs.pop('index_path', None)
+        self.check_interval = kwargs.pop('check_interval', 0)
         super(DirectoryLocator, self).__init__(**kwargs)
         path = os.path.abspath(path)
         if not os.path.isdir(path):
             raise DistlibException('Not a directory: %r' % path)
         self.base_dir = path
+        self._index = None
+        # When the index was last checked against the tree
+        self._checked = None
+        self._index_lock = threading.Lock()
+
+    def clear_cache(self):
+        super(DirectoryLocator, self).clear_cache()
+        with self._index_lock:
+            self._checked = None
+
+    def _get_store_key(self):
+        return '%s %s %s' % (type(self).__name__, self.scheme, self.base_dir)
 
     def should_include(self, filename, parent):
         """
@@ -763,20 +2516,159 @@ class DirectoryLocator(Locator):
         """
         return filename.endswith(self.downloadable_extensions)
 
-    def _get_project(self, name):
-        result = {}
-        for root, dirs, files in os.walk(self.base_dir):
-            for fn in files:
+    @staticmethod
+    def _normalise(name):
+        # Project names are compared case-insensitively, and distribute
+        # replaces '-' by '_' in project names.
+        return name.lower().replace('_', '-')
+
+    def _index_keys(self, filename):
+        """
+        Return the normalised project names under which an archive is
+        indexed. As well as the name determined from the filename, any
+        prefix of the filename which ends at a word boundary could be a
+        project name, so those are included too.
+        """
+        if filename.endswith('.whl'):
+            try:
+                result = set([self._normalise(Wheel(filename).name)])
+            except Exception:
+                logger.warning('invalid path for wheel: %s', filename)
+                result = set()
+        else:
+            stem = filename
+            for ext in self.downloadable_extensions:
+                if filename.endswith(ext):
+                    stem = filename[:-len(ext)]
+                    break
+            result = set()
+            for m in re.finditer(r'\w\b', stem):
+                result.add(self._normalise(stem[:m.end()]))
+            t = self.split_filename(stem, None)
+            if t:
+                result.add(self._normalise(t[0]))
+        return result
+
+    def _build_index(self):
+        """
+        Scan the directory tree, returning an index of the archives in it.
+        """
+        dirs = {}
+        files = {}
+        for root, dirnames, filenames in os.walk(self.base_dir):
+            dirs[root] = [os.stat(root).st_mtime,
+                          self._digest_dir(root, dirnames, filenames)]
+            for fn in filenames:
                 if self.should_include(fn, root):
-                    fn = os.path.join(root, fn)
+                    path = os.path.join(root, fn)
                     url = urlunparse(('file', '',
-                                      pathname2url(os.path.abspath(fn)),
+                                      pathname2url(os.path.abspath(path)),
                                       '', '', ''))
-                    info = self.convert_url_to_download_info(url, name)
-                    if info:
-                        self._update_version_data(result, info)
+                    for key in self._index_keys(fn):
+                        files.setdefault(key, []).append(url)
             if not self.recursive:
                 break
+        return {
+            'version': self.index_version,
+            'base_dir': self.base_dir,
+            'recursive': self.recursive,
+            'dirs': dirs,
+            'files': files,
+        }
+
+    def _digest_dir(self, path, dirnames, filenames):
+        """
+        Return a digest of the contents of a directory which are relevant
+        to the index: its subdirectories and the archives in it.
+        """
+        names = [fn for fn in filenames if self.should_include(fn, path)]
+        if self.recursive:
+            names.extend([d + '/' for d in dirnames])
+        names.sort()
+        return hashlib.sha1('\n'.join(names).encode('utf-8')).hexdigest()
+
+    def _is_valid(self, index):
+        """
+        Return whether an index is still valid: none of the directories it
+        was built from have changed.
+        """
+        if (index.get('version') != self.index_version or
+            index.get('base_dir') != self.base_dir or
+            index.get('recursive') != self.recursive):
+            return False
+        for path, entry in index['dirs'].items():
+            try:
+                mtime = os.stat(path).st_mtime
+                if mtime != entry[0]:
+                    # The directory has changed, but perhaps not in a way
+                    # that matters (e.g. the index file was written to it).
+                    dirnames = []
+                    filenames = []
+                    for fn in os.listdir(path):
+                        if os.path.isdir(os.path.join(path, fn)):
+                            dirnames.append(fn)
+                        else:
+                            filenames.append(fn)
+                    if self._digest_dir(path, dirnames,
+                                        filenames) != entry[1]:
+                        return False
+                    entry[0] = mtime
+            except OSError:     # removed
+                return False
+        return True
+
+    def _load_index(self):
+        result = None
+        if self.index_path and os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'rb') as f:
+                    result = json.loads(f.read().decode('utf-8'))
+            except Exception as e:
+                logger.warning('Unable to load index %s: %s',
+                               self.index_path, e)
+        return result
+
+    def _save_index(self, index):
+        path = self.index_path
+        dirname = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        _write_atomically(path, json.dumps(index).encode('utf-8'))
+
+    def _get_index(self):
+        """
+        Return the index of the directory tree, building it if there isn't
+        a valid one already.
+        """
+        with self._index_lock:
+            index = self._index
+            now = time.time()
+            if index is not None and self._checked is not None:
+                interval = self.check_interval
+                if interval is None or now - self._checked < interval:
+                    return index
+            if index is None or not self._is_valid(index):
+                index = self._load_index()
+                if index is None or not self._is_valid(index):
+                    logger.debug('Indexing %s', self.base_dir)
+                    index = self._build_index()
+                    if self.index_path:
+                        try:
+                            self._save_index(index)
+                        except (IOError, OSError) as e:
+                            logger.warning('Unable to save index %s: %s',
+                                           self.index_path, e)
+                self._index = index
+            self._checked = now
+        return index
+
+    def _get_project(self, name):
+        result = {}
+        urls = self._get_index()['files'].get(self._normalise(name), ())
+        for url in urls:
+            info = self.convert_url_to_download_info(url, name)
+            if info:
+                self._update_version_data(result, info)
         return result
 
     def get_distribution_names(self):
@@ -784,18 +2676,25 @@ class DirectoryLocator(Locator):
         Return all the distribution names known to this locator.
         """
         result = set()
-        for root, dirs, files in os.walk(self.base_dir):
-            for fn in files:
-                if self.should_include(fn, root):
-                    fn = os.path.join(root, fn)
-                    url = urlunparse(('file', '',
-                                      pathname2url(os.path.abspath(fn)),
-                                      '', '', ''))
-                    info = self.convert_url_to_download_info(url, None)
-                    if info:
-                        result.add(info['name'])
-            if not self.recursive:
-                break
+        urls = set()
+        for value in self._get_index()['files'].values():
+            urls.update(value)
+        for url in urls:
+            info = self.convert_url_to_download_info(url, None)
+            if info:
+                result.add(info['name'])
+        return result
+
+    def get_fingerprint(self):
+        result = super(DirectoryLocator, self).get_fingerprint()
+        if result is None:
+            # The digests of the directories change whenever the archives
+            # in them do
+            index = self._get_index()
+            digests = sorted((path, entry[1])
+                             for path, entry in index['dirs'].items())
+            data = json.dumps([self.base_dir, self.recursive, digests])
+            result = hashlib.sha256(data.encode('utf-8')).hexdigest()
         return result
 
 class JSONLocator(Locator):
@@ -805,18 +2704,34 @@ class JSONLocator(Locator):
     require archive downloads before dependencies can be determined! As you
     might imagine, that can be slow.
     """
+    batch_workers = 10
+
     def get_distribution_names(self):
         """
         Return all the distribution names known to this locator.
         """
         raise NotImplementedError('Not available from this locator')
 
+    def _get_project_data(self, name):
+        """
+        Get the data for a project, in the form returned by
+        :func:`~distlib.util.get_project_data`.
+        """
+        return get_project_data(name)
+
+    def _is_wanted(self, info):
+        """
+        Return whether a distribution listed in a project's data should be
+        included in the result for the project.
+        """
+        return info['ptype'] == 'sdist' and info['pyversion'] == 'source'
+
     def _get_project(self, name):
         result = {}
-        data = get_project_data(name)
+        data = self._get_project_data(name)
         if data:
             for info in data.get('files', []):
-                if info['ptype'] != 'sdist' or info['pyversion'] != 'source':
+                if not self._is_wanted(info):
                     continue
                 # We don't store summary in project metadata as it makes
                 # the data bigger for no benefit during dependency
@@ -827,14 +2742,256 @@ class JSONLocator(Locator):
                                  scheme=self.scheme)
                 md = dist.metadata
                 md.source_url = info['url']
-                # TODO SHA256 digest
-                if 'digest' in info and info['digest']:
-                    dist.digest = ('md5', info['digest'])
+                digest = info.get('digest')
+                if digest:
+                    # A bare digest is an MD5 one; otherwise, it's an
+                    # (algorithm, digest) pair.
+                    if isinstance(digest, string_types):
+                        dist.digest = ('md5', digest)
+                    else:
+                        dist.digest = tuple(digest)
                 md.dependencies = info.get('requirements', {})
                 dist.exports = info.get('exports', {})
+                dist.locator = self
                 result[dist.version] = dist
         return result
 
+SNAPSHOT_MAGIC = b'DLSNAP1\n'
+
+# Each index record holds the offset and length of a project's name in the
+# names area, and the offset and length of its compressed data.
+_SNAPSHOT_RECORD = struct.Struct('>QIQI')
+# The trailer holds the offset of the names area, the offset of the index
+# and the number of index records.
+_SNAPSHOT_TRAILER = struct.Struct('>QQI')
+
+
+def _snapshot_key(name):
+    return name.lower().encode('utf-8')
+
+
+def _get_snapshot_data(name, result, scheme):
+    """
+    Return the data for a project in a snapshot, in the form used by
+    :class:`JSONLocator`.
+    """
+    try:
+        versions = sorted(result, key=scheme.key)
+    except UnsupportedVersionError:
+        versions = sorted(result)
+    files = []
+    for version in versions:
+        dist = result[version]
+        url = dist.source_url
+        if not url:
+            continue
+        info = {
+            'version': version,
+            'url': url,
+            'requirements': extract_by_key(dist.metadata.dictionary,
+                                           Metadata.DEPENDENCY_KEYS),
+        }
+        path = urlparse(url)[2]
+        if path.endswith('.whl'):
+            info['ptype'] = 'bdist_wheel'
+            try:
+                wheel = Wheel(posixpath.basename(path))
+                info['pyversion'] = '.'.join(wheel.pyver)
+            except DistlibException:
+                info['pyversion'] = ''
+        else:
+            info['ptype'] = 'sdist'
+            info['pyversion'] = 'source'
+        if dist.digest:
+            info['digest'] = list(dist.digest)
+        if 'exports' in dist.__dict__:
+            info['exports'] = dist.exports
+        files.append(info)
+    data = {'name': name, 'files': files}
+    if versions:
+        data['summary'] = result[versions[-1]].metadata.summary
+    return data
+
+
+def _write_snapshot(f, locator, names, batch_size):
+    """
+    Write a snapshot of the named projects to a file, and return the number
+    of projects written.
+    """
+    scheme = get_scheme(locator.scheme)
+    index = []
+    f.write(SNAPSHOT_MAGIC)
+    offset = len(SNAPSHOT_MAGIC)
+    for i in range(0, len(names), batch_size):
+        batch = names[i:i + batch_size]
+        projects = locator.get_projects(batch)
+        for name in batch:
+            result = projects.get(name)
+            if not result:
+                continue
+            data = _get_snapshot_data(name, result, scheme)
+            data = json.dumps(data, sort_keys=True, separators=(',', ':'))
+            data = zlib.compress(data.encode('utf-8'), 9)
+            f.write(data)
+            index.append((name, offset, len(data)))
+            offset += len(data)
+    names_offset = offset
+    records = []
+    for name, data_offset, data_length in index:
+        key = name.encode('utf-8')
+        f.write(key)
+        records.append(_SNAPSHOT_RECORD.pack(offset, len(key),
+                                             data_offset, data_length))
+        offset += len(key)
+    f.write(b''.join(records))
+    f.write(_SNAPSHOT_TRAILER.pack(names_offset, offset, len(index)))
+    f.write(SNAPSHOT_MAGIC)
+    return len(index)
+
+
+def build_snapshot(locator, path, names=None, batch_size=100):
+    """
+    Write a snapshot of what a locator finds for a number of projects to a
+    file, from which a :class:`SnapshotLocator` can serve them without any
+    network access. The snapshot is written in a deterministic order, so
+    snapshots of the same results are identical.
+
+    :param locator: The locator to get the projects from.
+    :param path: The pathname of the snapshot file.
+    :param names: The names of the projects to include. If not specified,
+                  the names returned by the locator's
+                  :meth:`~Locator.get_distribution_names` are used.
+    :param batch_size: The number of projects to get from the locator at a
+                       time, using :meth:`~Locator.get_projects`.
+    :return: The number of projects in the snapshot.
+    """
+    if names is None:
+        names = locator.get_distribution_names()
+    # Names are looked up case-insensitively, so the index is sorted on
+    # (and just holds one of each of) the lower-cased names.
+    keyed = {}
+    for name in names:
+        keyed.setdefault(_snapshot_key(name), name)
+    names = [keyed[k] for k in sorted(keyed)]
+    tmp = _get_temp_path(path)
+    try:
+        with open(tmp, 'wb') as f:
+            result = _write_snapshot(f, locator, names, batch_size)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    _replace(tmp, path)
+    return result
+
+
+class SnapshotLocator(JSONLocator):
+    """
+    This locator serves projects from a snapshot written by
+    :func:`build_snapshot`, without any network access. The snapshot is
+    memory-mapped, and a project is found by a binary search of its index,
+    so only the data for the projects looked up is read and decoded.
+    """
+    def __init__(self, path, **kwargs):
+        """
+        Initialise an instance.
+
+        :param path: The pathname of the snapshot file.
+        :param kwargs: Passed to the superclass constructor.
+        """
+        super(SnapshotLocator, self).__init__(**kwargs)
+        self.path = os.path.abspath(path)
+        with open(self.path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        n = len(SNAPSHOT_MAGIC)
+        size = len(self._map)
+        tail = size - n - _SNAPSHOT_TRAILER.size
+        if (tail < n or self._map[:n] != SNAPSHOT_MAGIC or
+            self._map[size - n:] != SNAPSHOT_MAGIC):
+            self._map.close()
+            raise DistlibException('Not a valid snapshot: %s' % self.path)
+        (self._names_offset, self._index_offset,
+         self._count) = _SNAPSHOT_TRAILER.unpack_from(self._map, tail)
+
+    def close(self):
+        """
+        Release any resources (such as threads) held by the locator.
+        """
+        super(SnapshotLocator, self).close()
+        self._map.close()
+
+    def _get_store_key(self):
+        return '%s %s %s' % (type(self).__name__, self.scheme, self.path)
+
+    def _get_record(self, i):
+        offset = self._index_offset + i * _SNAPSHOT_RECORD.size
+        name_offset, name_length, data_offset, data_length = \
+            _SNAPSHOT_RECORD.unpack_from(self._map, offset)
+        name = self._map[name_offset:name_offset + name_length]
+        return name.decode('utf-8'), data_offset, data_length
+
+    def _find(self, name):
+        """
+        Return the index record for a project, or None if the project isn't
+        in the snapshot.
+        """
+        key = _snapshot_key(name)
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            record = self._get_record(mid)
+            k = _snapshot_key(record[0])
+            if k == key:
+                return record
+            if k < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def _get_project_data(self, name):
+        result = {}
+        record = self._find(name)
+        if record is not None:
+            _, offset, length = record
+            data = zlib.decompress(self._map[offset:offset + length])
+            result = json.loads(data.decode('utf-8'))
+        return result
+
+    def _is_wanted(self, info):
+        # The snapshot holds just the distributions which were found when it
+        # was built, so they're all wanted.
+        return True
+
+    def get_fingerprint(self):
+        result = super(SnapshotLocator, self).get_fingerprint()
+        if result is None:
+            result = self._digest
+        return result
+
+    @cached_property
+    def _digest(self):
+        hasher = hashlib.sha256()
+        blocksize = 1024 * 1024
+        for i in range(0, len(self._map), blocksize):
+            hasher.update(self._map[i:i + blocksize])
+        return hasher.hexdigest()
+
+    def get_distribution_names(self):
+        """
+        Return all the distribution names known to this locator.
+        """
+        return set(self.iter_distribution_names())
+
+    def iter_distribution_names(self):
+        """
+        Return an iterator over all the distribution names known to this
+        locator, in the order of the snapshot's index.
+        """
+        for i in range(self._count):
+            yield self._get_record(i)[0]
+
+
 class DistPathLocator(Locator):
     """
     This locator finds installed distributions in a path. It can be useful for
@@ -858,6 +3015,15 @@ class DistPathLocator(Locator):
             result = { dist.version: dist }
         return result
 
+    def get_fingerprint(self):
+        result = super(DistPathLocator, self).get_fingerprint()
+        if result is None:
+            dists = sorted(d.name_and_version
+                           for d in self.distpath.get_distributions())
+            data = json.dumps(dists).encode('utf-8')
+            result = hashlib.sha256(data).hexdigest()
+        return result
+
 
 class AggregatingLocator(Locator):
     """
@@ -874,76 +3040,417 @@ class AggregatingLocator(Locator):
                          search from any of the locators is returned. If True,
                          the results from all locators are merged (this can be
                          slow).
+                       * parallel - if True (the default), the locators are
+                         searched concurrently, though results are still
+                         used in the order in which the locators were
+                         specified. If False, they're searched one after
+                         another.
         """
         self.merge = kwargs.pop('merge', False)
+        self.parallel = kwargs.pop('parallel', True)
         self.locators = locators
         super(AggregatingLocator, self).__init__(**kwargs)
+        # one thread per locator, for searching them concurrently
+        self.batch_workers = len(locators)
+
+    def clear_cache(self):
+        super(AggregatingLocator, self).clear_cache()
+        for locator in self.locators:
+            locator.clear_cache()
+
+    def close(self):
+        super(AggregatingLocator, self).close()
+        for locator in self.locators:
+            locator.close()
+
+    def _set_scheme(self, value):
+        self._scheme = value
+        for locator in self.locators:
+            locator.scheme = value
+
+    scheme = property(Locator.scheme.fget, _set_scheme)
+
+    def _may_cache(self, matcher):
+        for locator in self.locators:
+            if not locator._may_cache(matcher):
+                return False
+        return True
+
+    def get_fingerprint(self):
+        result = super(AggregatingLocator, self).get_fingerprint()
+        if result is None:
+            parts = [str(self.merge)]
+            for locator in self.locators:
+                fingerprint = locator.get_fingerprint()
+                if fingerprint is None:
+                    return None
+                parts.append(fingerprint)
+            data = ' '.join(parts).encode('utf-8')
+            result = hashlib.sha256(data).hexdigest()
+        return result
+
+    def get_project_fingerprint(self, name):
+        result = super(AggregatingLocator, self).get_project_fingerprint(name)
+        if result is None:
+            parts = [str(self.merge)]
+            for locator in self.locators:
+                fingerprint = locator.get_project_fingerprint(name)
+                if fingerprint is None:
+                    return None
+                parts.append(fingerprint)
+            data = ' '.join(parts).encode('utf-8')
+            result = hashlib.sha256(data).hexdigest()
+        return result
+
+    def _can_fingerprint_projects(self):
+        for locator in self.locators:
+            if (locator.get_fingerprint() is None and
+                not locator._can_fingerprint_projects()):
+                return False
+        return True
+
+    def _get_store_key(self):
+        keys = [locator._get_store_key() for locator in self.locators]
+        return '%s %s %s (%s)' % (type(self).__name__, self.scheme,
+                                  self.merge, ', '.join(keys))
+
+    def _is_found(self, d, matcher):
+        """
+        Decide whether a result from one of the locators is good enough to
+        return when merge=False.
+        """
+        # See issue #18. If any dists are found and we're looking
+        # for specific constraints, we only return something if
+        # a match is found. For example, if a DirectoryLocator
+        # returns just foo (1.0) while we're looking for
+        # foo (>= 2.0), we'll pretend there was nothing there so
+        # that subsequent locators can be queried. Otherwise we
+        # would just return foo (1.0) which would then lead to a
+        # failure to find foo (>= 2.0), because other locators
+        # weren't searched. Note that this only matters when
+        # merge=False.
+        if matcher is None:
+            found = True
+        else:
+            found = False
+            for k in d:
+                if matcher.match(k):
+                    found = True
+                    break
+        return found
+
+    def _get_project(self, name):
+        # The locators get the matcher, so that they can use it too
+        return self._get_projects({name: self.matcher})[name]
+
+    def _get_projects(self, matchers):
+        if self.parallel and len(self.locators) > 1:
+            result = self._get_projects_concurrently(matchers)
+        else:
+            result = self._get_projects_serially(matchers)
+        return result
+
+    def _get_projects_concurrently(self, matchers):
+        # Ask all the locators at once. Results are merged as they arrive,
+        # but the outcome is the same as if the locators had been asked in
+        # turn: in merge mode, a version found by more than one locator comes
+        # from the last of them, and otherwise, a locator's result is only
+        # used once all the locators before it have failed to find a match.
+        pool = self._get_batch_pool()
+        futures = []
+        for i, locator in enumerate(self.locators):
+            f = pool.submit(locator._fetch_projects, matchers)
+            f.index = i
+            futures.append(f)
+        result = dict((name, {}) for name in matchers)
+        if self.merge:
+            # For each project, the index of the locator each version came
+            # from
+            sources = dict((name, {}) for name in matchers)
+            partial = set()
+            done = queue.Queue()
+            for f in futures:
+                f.add_done_callback(done.put)
+            for _ in futures:
+                f = done.get()
+                for name, d in f.result().items():
+                    if isinstance(d, PartialResult):
+                        partial.add(name)
+                    source = sources[name]
+                    for version, dist in d.items():
+                        if source.get(version, -1) < f.index:
+                            source[version] = f.index
+                            result[name][version] = dist
+            self._mark_partial(result, partial)
+        else:
+            todo = dict(matchers)
+            for f in futures:
+                if not todo:
+                    # Don't wait for the remaining locators
+                    break
+                for name, d in f.result().items():
+                    if name in todo and d and self._is_found(d, todo[name]):
+                        result[name] = d
+                        del todo[name]
+        return result
+
+    def _get_projects_serially(self, matchers):
+        # Ask each locator for all the projects still needed in one go, so
+        # that each of them can get the projects concurrently.
+        result = dict((name, {}) for name in matchers)
+        partial = set()
+        todo = dict(matchers)
+        for locator in self.locators:
+            if not todo:
+                break
+            projects = locator._fetch_projects(todo)
+            for name, d in projects.items():
+                if self.merge and isinstance(d, PartialResult):
+                    partial.add(name)
+                if d:
+                    if self.merge:
+                        result[name].update(d)
+                    elif self._is_found(d, todo[name]):
+                        result[name] = d
+                        del todo[name]
+        self._mark_partial(result, partial)
+        return result
+
+    def _mark_partial(self, result, names):
+        """
+        Make the merged results for the named projects partial, because the
+        result from one of the locators was.
+        """
+        for name in names:
+            result[name] = PartialResult(result[name])
+
+    def get_distribution_names(self):
+        """
+        Return all the distribution names known to this locator.
+        """
+        return set(self.iter_distribution_names())
+
+    def iter_distribution_names(self):
+        """
+        Return an iterator over all the distribution names known to this
+        locator. The names from each of the aggregated locators are yielded
+        in turn as they're got, skipping any which have already been yielded.
+        Locators which don't support getting names are skipped.
+        """
+        seen = set()
+        for locator in self.locators:
+            try:
+                names = locator.iter_distribution_names()
+            except NotImplementedError:
+                continue
+            for name in names:
+                if name not in seen:
+                    seen.add(name)
+                    yield name
+
+
+# We use a legacy scheme simply because most of the dists on PyPI use legacy
+# versions which don't conform to PEP 426 / PEP 440.
+#
+# As the default locator can be used for the lifetime of a process, its caches
+# are bounded and their entries expire, so that memory use is limited and
+# results don't get stale.
+default_locator = AggregatingLocator(
+                    JSONLocator(cache=LRUCache(max_entries=1000, ttl=3600,
+                                               negative_ttl=300)),
+                    SimpleScrapingLocator('https://pypi.python.org/simple/',
+                                          timeout=3.0,
+                                          cache=LRUCache(max_entries=1000,
+                                                         ttl=3600,
+                                                         negative_ttl=300),
+                                          memory_cache=LRUCache(
+                                            max_bytes=16 * 1024 * 1024,
+                                            ttl=600, negative_ttl=60)),
+                    scheme='legacy',
+                    cache=LRUCache(max_entries=1000, ttl=3600,
+                                   negative_ttl=300))
+
+locate = default_locator.locate
+
+class _Resolution(object):
+    """
+    The state of a search by :meth:`DependencyFinder.resolve` for versions
+    of projects which meet all the requirements: the versions chosen so far,
+    the requirements on each project and the sets of choices learned to be
+    incompatible.
+    """
+    def __init__(self, finder, meta_extras):
+        self.finder = finder
+        self.meta_extras = meta_extras
+        # The key of the requested project, whose version gets meta extras
+        self.root_key = None
+        # The names of the projects, by key
+        self.names = {}
+        # The chosen distributions, by project key
+        self.chosen = {}
+        # The requirements on each project, as (requirement, key) tuples
+        # where the key is of the requiring project (None for the requested
+        # requirement)
+        self.constraints = OrderedDict()
+        # Each set of incompatible choices, as (key, version) tuples, with
+        # the requirements which make them incompatible, indexed by each of
+        # the choices
+        self.nogoods = {}
+        # Keys of the projects with no versions at all
+        self.missing = set()
+        # Matchers and extras, as requirements are looked at again each time
+        # a version which has them is tried
+        self._parsed = {}
+
+    def parse(self, reqt):
+        """
+        Return a matcher for a requirement and the extras it asks for.
+        """
+        result = self._parsed.get(reqt)
+        if result is None:
+            r = parse_requirement(reqt)
+            extras = set((r and r.extras) or ())
+            result = self._parsed[reqt] = (self.finder.get_matcher(reqt),
+                                           extras)
+        return result
+
+    def add_requirement(self, reqt, source):
+        matcher = self.parse(reqt)[0]
+        key = matcher.key
+        self.names.setdefault(key, matcher.name)
+        self.constraints.setdefault(key, []).append((reqt, source))
+        return key
+
+    def get_requirements(self, key, dist):
+        """
+        Return the requirements of a distribution, and the install-time ones.
+        """
+        if key in self.constraints:
+            extras = set()
+            for reqt, source in self.constraints[key]:
+                extras |= self.parse(reqt)[1]
+            dist.extras = sorted(extras) or None
+        if key == self.root_key:
+            install_dists = set([dist])
+        else:
+            install_dists = set()
+        ireqts, all_reqts = self.finder._get_requirements(dist,
+                                                          install_dists,
+                                                          self.meta_extras)
+        return all_reqts, ireqts
+
+    def label(self, key):
+        """
+        Return the name and version of the chosen distribution of a project,
+        to identify it as the source of a requirement.
+        """
+        if key is None:
+            return None
+        return self.chosen[key].name_and_version
+
+    def choose(self, key, dist):
+        """
+        Choose a distribution for a project, adding its requirements.
 
-    def clear_cache(self):
-        super(AggregatingLocator, self).clear_cache()
-        for locator in self.locators:
-            locator.clear_cache()
+        :return: The keys of the projects which requirements were added for.
+        """
+        self.chosen[key] = dist
+        added = []
+        # sorted, so that projects are chosen in a repeatable order
+        for reqt in sorted(self.get_requirements(key, dist)[0]):
+            if self.parse(reqt)[0].key != key:
+                added.append(self.add_requirement(reqt, key))
+        return added
 
-    def _set_scheme(self, value):
-        self._scheme = value
-        for locator in self.locators:
-            locator.scheme = value
+    def unchoose(self, key, added):
+        """
+        Undo a choice made by :meth:`choose`.
+        """
+        for k in reversed(added):
+            c = self.constraints[k]
+            c.pop()
+            if not c:
+                del self.constraints[k]
+        del self.chosen[key]
 
-    scheme = property(Locator.scheme.fget, _set_scheme)
+    def next_key(self):
+        """
+        Return the key of the next project to choose a version for, or None
+        if there aren't any more.
+        """
+        for key in self.constraints:
+            if key not in self.chosen and key not in self.missing:
+                return key
+        return None
 
-    def _get_project(self, name):
-        result = {}
-        for locator in self.locators:
-            d = locator.get_project(name)
-            if d:
-                if self.merge:
-                    result.update(d)
-                else:
-                    # See issue #18. If any dists are found and we're looking
-                    # for specific constraints, we only return something if
-                    # a match is found. For example, if a DirectoryLocator
-                    # returns just foo (1.0) while we're looking for
-                    # foo (>= 2.0), we'll pretend there was nothing there so
-                    # that subsequent locators can be queried. Otherwise we
-                    # would just return foo (1.0) which would then lead to a
-                    # failure to find foo (>= 2.0), because other locators
-                    # weren't searched. Note that this only matters when
-                    # merge=False.
-                    if self.matcher is None:
-                        found = True
-                    else:
-                        found = False
-                        for k in d:
-                            if self.matcher.match(k):
-                                found = True
-                                break
-                    if found:
-                        result = d
-                        break
-        return result
+    def check(self, key, version, dist):
+        """
+        See whether a distribution can be chosen for a project.
 
-    def get_distribution_names(self):
+        :return: None if it can, else a tuple of the set of choices and the
+                 set of requirements which rule it out.
         """
-        Return all the distribution names known to this locator.
+        for reqt, source in self.constraints[key]:
+            if not self.finder.match(self.parse(reqt)[0], version):
+                culprits = set()
+                if source is not None:
+                    culprits.add((source, self.chosen[source].version))
+                return culprits, set([(self.label(source), reqt)])
+        choice = (key, dist.version)
+        for nogood, reasons in self.nogoods.get(choice, ()):
+            others = nogood - set([choice])
+            for k, v in others:
+                if k not in self.chosen or self.chosen[k].version != v:
+                    break
+            else:
+                return set(others), set(reasons)
+        for reqt in self.get_requirements(key, dist)[0]:
+            matcher = self.parse(reqt)[0]
+            k = matcher.key
+            if k != key and k in self.chosen:
+                if not self.finder.match(matcher, self.chosen[k].version):
+                    return (set([(k, self.chosen[k].version)]),
+                            set([(dist.name_and_version, reqt)]))
+        return None
+
+    def get_sources(self, key):
+        """
+        Return the choices whose requirements made a project needed, as
+        (key, version) tuples.
         """
         result = set()
-        for locator in self.locators:
-            try:
-                result |= locator.get_distribution_names()
-            except NotImplementedError:
-                pass
+        for reqt, source in self.constraints.get(key, ()):
+            if source is not None:
+                result.add((source, self.chosen[source].version))
         return result
 
+    def learn(self, culprits, reasons):
+        """
+        Remember that a set of choices can't be made together.
+        """
+        entry = (frozenset(culprits), frozenset(reasons))
+        for choice in culprits:
+            self.nogoods.setdefault(choice, []).append(entry)
+
 
-# We use a legacy scheme simply because most of the dists on PyPI use legacy
-# versions which don't conform to PEP 426 / PEP 440.
-default_locator = AggregatingLocator(
-                    JSONLocator(),
-                    SimpleScrapingLocator('https://pypi.python.org/simple/',
-                                          timeout=3.0),
-                    scheme='legacy')
+def _get_bounds(matcher):
+    """
+    Return the lowest and highest versions which a matcher can match, either
+    of which may be ``None`` if there's no bound. Versions between the
+    bounds may still not match.
+    """
+    lower = upper = None
+    for op, constraint, prefix in matcher.constraints:
+        if prefix:
+            continue
+        if op in ('<', '<=', '=='):
+            if upper is None or constraint < upper:
+                upper = constraint
+        if op in ('>', '>=', '~=', '=='):
+            if lower is None or constraint > lower:
+                lower = constraint
+    return lower, upper
 
-locate = default_locator.locate
 
 NAME_VERSION_RE = re.compile(r'(?P<name>[\w-]+)\s*'
                              r'\(\s*(==\s*)?(?P<ver>[^)]+)\)$')
@@ -953,13 +3460,167 @@ class DependencyFinder(object):
     Locate dependencies for distributions.
     """
 
-    def __init__(self, locator=None):
+    def __init__(self, locator=None, prefetch=True, cache=None):
         """
         Initialise an instance, using the specified locator
         to locate distributions.
+
+        If ``prefetch`` is true (the default), then at each step of
+        :meth:`find`, the providers for the unmet requirements of all the
+        distributions waiting to be processed are located together, using
+        :meth:`Locator.locate_many`, so that the projects are got
+        concurrently where the locator supports it.
+
+        If ``cache`` is specified, it's a :class:`ResolutionCache` in which
+        the results of :meth:`find` and :meth:`resolve` are kept, keyed by
+        their inputs. If ``True``, a cache in the default location is used.
+        The locator must be able to tell when its data changes (see
+        :meth:`Locator.get_fingerprint` and
+        :meth:`Locator.get_project_fingerprint`), or a
+        :class:`DistlibException` is raised.
         """
         self.locator = locator or default_locator
         self.scheme = get_scheme(self.locator.scheme)
+        self.prefetch = prefetch
+        if cache is True:
+            cache = ResolutionCache()
+        if (cache is not None and self.locator.get_fingerprint() is None and
+            not self.locator._can_fingerprint_projects()):
+            raise DistlibException('Results from %s can\'t be cached, as it '
+                                   'can\'t tell when its data changes' %
+                                   type(self.locator).__name__)
+        self.cache = cache
+        # The names of the projects asked of the locator, which a result
+        # depends on
+        self._projects = set()
+        self._clear()
+
+    def _clear(self):
+        """
+        Forget the distributions found.
+        """
+        self.provided = {}
+        self.dists = {}
+        self.dists_by_name = {}
+        self.reqts = {}
+        # The versions provided for each name, in ascending order, and the
+        # distributions which provide them
+        self._providers = {}
+        # Matchers and parsed versions, which are kept for the duration of
+        # a find
+        self._matchers = {}
+        self._versions = {}
+
+    def get_cache_key(self, requirement, meta_extras=None, prereleases=False,
+                      mode='find'):
+        """
+        Return the key identifying a result in a :class:`ResolutionCache`:
+        a hash of the requirement, the meta extras, the environment used to
+        evaluate markers and the locator's fingerprint (see
+        :meth:`Locator.get_fingerprint`). If the locator has no fingerprint,
+        a cached result is only used if the fingerprints of the projects it
+        depends on are unchanged (see
+        :meth:`Locator.get_project_fingerprint`).
+
+        :param mode: The name of the method giving the result.
+        :return: The key.
+        """
+        fingerprint = self.locator.get_fingerprint()
+        if isinstance(requirement, (list, tuple)):
+            requirement = [_get_requirement_key(r) for r in requirement]
+        else:
+            requirement = _get_requirement_key(requirement)
+        data = {
+            'mode': mode,
+            'requirement': requirement,
+            'meta_extras': sorted(meta_extras or []),
+            'prereleases': bool(prereleases),
+            'environment': Evaluator.allowed_values,
+            'scheme': self.locator.scheme,
+            'fingerprint': fingerprint,
+        }
+        data = json.dumps(data, sort_keys=True).encode('utf-8')
+        return hashlib.sha256(data).hexdigest()
+
+    def _get_result(self, mode, method, requirement, meta_extras,
+                    prereleases, *args):
+        """
+        Call a method to get a result, unless it's in the cache, storing it
+        there if it can be.
+        """
+        key = None
+        if self.cache is not None:
+            key = self.get_cache_key(requirement, meta_extras, prereleases,
+                                     mode)
+            entry = self.cache.get_entry(key, self.locator.scheme)
+            if entry is not None and self._is_current(entry[3]):
+                logger.debug('Using cached result for %s', requirement)
+                dists, problems, reqts, _ = entry
+                self._clear()
+                for dist in dists:
+                    self.add_distribution(dist)
+                self.reqts = reqts
+                return dists, problems
+        self._projects = set()
+        result = method(requirement, meta_extras, prereleases, *args)
+        if key is not None and _is_lockable(result[1]):
+            projects = self._get_project_fingerprints()
+            if projects is None:
+                logger.warning('Not caching result for %s, as the locator '
+                               'can\'t tell when its projects change',
+                               requirement)
+            else:
+                self.cache.put(key, result[0], result[1], self.reqts,
+                               projects)
+        return result
+
+    def _get_project_fingerprints(self):
+        """
+        Return a dictionary mapping the names of the projects the last result
+        depends on to their fingerprints, which is empty if the locator has
+        a fingerprint for all its data (as this is part of the cache key),
+        or ``None`` if a project has no fingerprint.
+        """
+        result = {}
+        if self.locator.get_fingerprint() is None:
+            for name in self._projects:
+                fingerprint = self.locator.get_project_fingerprint(name)
+                if fingerprint is None:
+                    logger.debug('No fingerprint for %s', name)
+                    return None
+                result[name] = fingerprint
+        return result
+
+    def _is_current(self, projects):
+        """
+        Return whether the projects a cached result depends on are unchanged,
+        given their fingerprints when the result was cached.
+        """
+        for name, fingerprint in projects.items():
+            if self.locator.get_project_fingerprint(name) != fingerprint:
+                logger.debug('%s has changed', name)
+                return False
+        return True
+
+    def _locate(self, requirement, prereleases):
+        """
+        Locate a distribution for a requirement, noting its project as one
+        which the result depends on.
+        """
+        result = self.locator.locate(requirement, prereleases=prereleases)
+        self._projects.add(self.get_matcher(requirement).name)
+        return result
+
+    def _locate_many(self, requirements, prereleases):
+        """
+        Locate distributions for several requirements together, noting their
+        projects as ones which the result depends on.
+        """
+        result = self.locator.locate_many(requirements,
+                                          prereleases=prereleases)
+        for r in requirements:
+            self._projects.add(self.get_matcher(r).name)
+        return result
 
     def add_distribution(self, dist):
         """
@@ -975,6 +3636,17 @@ class DependencyFinder(object):
             name, version = parse_name_and_version(p)
             logger.debug('Add to provided: %s, %s, %s', name, version, dist)
             self.provided.setdefault(name, set()).add((version, dist))
+            try:
+                version = self.get_version(version)
+            except UnsupportedVersionError:
+                # can't be matched by any requirement, so isn't indexed
+                continue
+            versions, providers = self._providers.setdefault(name, ([], []))
+            i = bisect.bisect_left(versions, version)
+            j = bisect.bisect_right(versions, version, i)
+            if dist not in providers[i:j]:
+                versions.insert(j, version)
+                providers.insert(j, dist)
 
     def remove_distribution(self, dist):
         """
@@ -993,6 +3665,15 @@ class DependencyFinder(object):
             s.remove((version, dist))
             if not s:
                 del self.provided[name]
+            if name in self._providers:
+                versions, providers = self._providers[name]
+                for i, provider in enumerate(providers):
+                    if provider == dist:
+                        del versions[i]
+                        del providers[i]
+                        break
+                if not versions:
+                    del self._providers[name]
 
     def get_matcher(self, reqt):
         """
@@ -1002,13 +3683,47 @@ class DependencyFinder(object):
         :return: A version matcher (an instance of
                  :class:`distlib.version.Matcher`).
         """
+        matcher = self._matchers.get(reqt)
+        if matcher is None:
+            try:
+                matcher = self.scheme.matcher(reqt)
+            except UnsupportedVersionError:
+                # XXX compat-mode if cannot read the version
+                name = reqt.split()[0]
+                matcher = self.scheme.matcher(name)
+            self._matchers[reqt] = matcher
+        return matcher
+
+    def get_version(self, version):
+        """
+        Get a version string parsed using the finder's version scheme.
+        :param version: The version.
+        :type version: str
+        :return: A version (an instance of :class:`distlib.version.Version`).
+        :raises UnsupportedVersionError: If the version can't be parsed.
+        """
+        result = self._versions.get(version)
+        if result is None:
+            result = self.scheme.matcher.version_class(version)
+            self._versions[version] = result
+        return result
+
+    def match(self, matcher, version):
+        """
+        Check whether a version matches a matcher, without parsing it again
+        if it's been parsed before.
+
+        :param version: The version, as a string or an instance of
+                        :class:`distlib.version.Version`.
+        :return: True if it matches, or False if it doesn't or can't be
+                 parsed.
+        """
         try:
-            matcher = self.scheme.matcher(reqt)
+            if isinstance(version, string_types):
+                version = self.get_version(version)
+            return matcher.match(version)
         except UnsupportedVersionError:
-            # XXX compat-mode if cannot read the version
-            name = reqt.split()[0]
-            matcher = self.scheme.matcher(name)
-        return matcher
+            return False
 
     def find_providers(self, reqt):
         """
@@ -1021,16 +3736,23 @@ class DependencyFinder(object):
         matcher = self.get_matcher(reqt)
         name = matcher.key   # case-insensitive
         result = set()
-        provided = self.provided
-        if name in provided:
-            for version, provider in provided[name]:
-                try:
-                    match = matcher.match(version)
-                except UnsupportedVersionError:
-                    match = False
-
-                if match:
-                    result.add(provider)
+        if name in self._providers:
+            versions, providers = self._providers[name]
+            # only look at versions which the constraints allow, most
+            # recent first
+            lower, upper = _get_bounds(matcher)
+            if lower is None:
+                start = 0
+            else:
+                start = bisect.bisect_left(versions, lower)
+            if upper is None:
+                i = len(versions)
+            else:
+                i = bisect.bisect_right(versions, upper, start)
+            while i > start:
+                i -= 1
+                if matcher.match(versions[i]):
+                    result.add(providers[i])
                     break
         return result
 
@@ -1041,27 +3763,40 @@ class DependencyFinder(object):
         (B >= 1.0) while C requires (B >= 1.1).
 
         For successful replacement, ``provider`` must meet all the requirements
-        which ``other`` fulfills.
+        which ``other`` fulfills. If it doesn't, but ``other`` meets all the
+        requirements which ``provider`` was found for, ``other`` is kept and
+        takes those requirements over.
 
         :param provider: The provider we are trying to replace with.
         :param other: The provider we're trying to replace.
-        :param problems: If False is returned, this will contain what
-                         problems prevented replacement. This is currently
-                         a tuple of the literal string 'cantreplace',
-                         ``provider``, ``other``  and the set of requirements
-                         that ``provider`` couldn't fulfill.
+        :param problems: If False is returned and ``other`` can't be kept
+                         instead, this will contain what problems prevented
+                         replacement. This is currently a tuple of the
+                         literal string 'cantreplace', ``provider``,
+                         ``other``  and the set of requirements that
+                         ``provider`` couldn't fulfill.
         :return: True if we can replace ``other`` with ``provider``, else
                  False.
         """
         rlist = self.reqts[other]
         unmatched = set()
+        version = self.get_version(provider.version)
         for s in rlist:
             matcher = self.get_matcher(s)
-            if not matcher.match(provider.version):
+            if not matcher.match(version):
                 unmatched.add(s)
         if unmatched:
             # can't replace other with provider
-            problems.add(('cantreplace', provider, other, unmatched))
+            plist = self.reqts.get(provider)
+            version = self.get_version(other.version)
+            if plist and all(self.get_matcher(s).match(version)
+                             for s in plist):
+                # but other will do instead
+                del self.reqts[provider]
+                rlist |= plist
+            else:
+                problems.add(('cantreplace', provider, other,
+                              frozenset(unmatched)))
             result = False
         else:
             # can replace other with provider
@@ -1073,6 +3808,64 @@ class DependencyFinder(object):
             result = True
         return result
 
+    def _get_meta_extras(self, meta_extras):
+        """
+        Return the set of meta extras to use, expanding ``:*:``.
+        """
+        result = set(meta_extras or [])
+        if ':*:' in result:
+            result.remove(':*:')
+            # :meta: and :run: are implicitly included
+            result |= set([':test:', ':build:', ':dev:'])
+        return result
+
+    def _get_requirements(self, dist, install_dists, meta_extras):
+        """
+        Get the requirements of a distribution which are to be met.
+
+        :return: A tuple of the install-time requirements and all the
+                 requirements.
+        """
+        ireqts = dist.run_requires | dist.meta_requires
+        sreqts = dist.build_requires
+        ereqts = set()
+        if dist in install_dists:
+            for key in ('test', 'build', 'dev'):
+                e = ':%s:' % key
+                if e in meta_extras:
+                    ereqts |= getattr(dist, '%s_requires' % key)
+        return ireqts, ireqts | sreqts | ereqts
+
+    def _prefetch(self, dists, install_dists, meta_extras, prereleases,
+                  located):
+        """
+        Locate the providers for the requirements of some distributions
+        which aren't met by any distribution found so far, all together. The
+        results are added to the ``located`` dictionary, from which
+        :meth:`find` takes them instead of locating them one at a time.
+        Requirements may turn out not to be needed after all; any which
+        can't be located here are left for :meth:`find` to deal with.
+        """
+        needed = set()
+        for dist in dists:
+            for r in self._get_requirements(dist, install_dists,
+                                            meta_extras)[1]:
+                if r not in located and not self.find_providers(r):
+                    needed.add(r)
+        if needed:
+            logger.debug('Prefetching %s', sorted(needed))
+            try:
+                found = self._locate_many(needed, prereleases)
+                # If no provider is found and we didn't consider
+                # prereleases, consider them now.
+                missing = [r for r in needed if found[r] is None]
+                if missing and not prereleases:
+                    found.update(self._locate_many(missing, True))
+            except DistlibException as e:
+                logger.debug('Prefetching failed: %s', e)
+            else:
+                located.update(found)
+
     def find(self, requirement, meta_extras=None, prereleases=False):
         """
         Find a distribution and all distributions it depends on.
@@ -1097,33 +3890,148 @@ class DependencyFinder(object):
         The problems should be a tuple consisting of the string
         ``'unsatisfied'`` and the requirement which couldn't be satisfied
         by any distribution known to the locator.
-        """
-
-        self.provided = {}
-        self.dists = {}
-        self.dists_by_name = {}
-        self.reqts = {}
 
-        meta_extras = set(meta_extras or [])
-        if ':*:' in meta_extras:
-            meta_extras.remove(':*:')
-            # :meta: and :run: are implicitly included
-            meta_extras |= set([':test:', ':build:', ':dev:'])
+        If the finder has a result cache, results are got from it where
+        possible and stored in it.
+        """
+        return self._get_result('find', self._find, requirement, meta_extras,
+                                prereleases)
 
+    def _find(self, requirement, meta_extras, prereleases):
         if isinstance(requirement, Distribution):
-            dist = odist = requirement
-            logger.debug('passed %s as requirement', odist)
+            dist = requirement
+            logger.debug('passed %s as requirement', dist)
         else:
-            dist = odist = self.locator.locate(requirement,
-                                               prereleases=prereleases)
+            dist = self._locate(requirement, prereleases)
             if dist is None:
                 raise DistlibException('Unable to locate %r' % requirement)
-            logger.debug('located %s', odist)
-        dist.requested = True
+            logger.debug('located %s', dist)
+        result = self._find_dists([(None, dist)], meta_extras, prereleases,
+                                  set())
+        logger.debug('find done for %s', dist)
+        return result
+
+    def find_all(self, requirements, meta_extras=None, prereleases=False):
+        """
+        Find the distributions for a number of requirements, and all the
+        distributions they depend on, together.
+
+        :param requirements: The requirements specifying the distributions
+                             to find, each as for :meth:`find`.
+        :param meta_extras: As for :meth:`find`.
+        :param prereleases: As for :meth:`find`.
+
+        Return a set of :class:`Distribution` instances and a set of
+        problems, as for :meth:`find`. Requirements which can't be located
+        are reported as ``'unsatisfied'`` problems, and requirements which
+        conflict with one another as ``'cantreplace'`` problems.
+
+        The ``provenance`` attribute is set to a dictionary mapping each
+        distribution returned to the set of the passed-in requirements which
+        led to it.
+        """
+        requirements = list(requirements)
+        result = self._get_result('find_all', self._find_all, requirements,
+                                  meta_extras, prereleases)
+        self.provenance = self._get_provenance(requirements, result[0],
+                                               meta_extras)
+        return result
+
+    def _find_all(self, requirements, meta_extras, prereleases):
         problems = set()
-        todo = set([dist])
-        install_dists = set([odist])
+        located = {}
+        if self.prefetch:
+            needed = [r for r in requirements
+                      if not isinstance(r, Distribution)]
+            if needed:
+                located = self._locate_many(needed, prereleases)
+        roots = []
+        for r in requirements:
+            if isinstance(r, Distribution):
+                roots.append((None, r))
+                continue
+            if r in located:
+                dist = located[r]
+            else:
+                dist = self._locate(r, prereleases)
+            if dist is None:
+                logger.debug('Cannot satisfy %r', r)
+                problems.add(('unsatisfied', r))
+            else:
+                logger.debug('located %s', dist)
+                roots.append((r, dist))
+        result = self._find_dists(roots, meta_extras, prereleases, problems)
+        logger.debug('find_all done for %s', requirements)
+        return result
+
+    def _get_provenance(self, requirements, dists, meta_extras):
+        """
+        Work out which of some requirements led to each of the distributions
+        found for them, by following the requirements of each distribution
+        to the distributions which provide them.
+        """
+        meta_extras = self._get_meta_extras(meta_extras)
+        install_dists = set(d for d in dists if not d.build_time_dependency)
+        result = dict((d, set()) for d in dists)
+        for root in requirements:
+            if isinstance(root, Distribution):
+                todo = [self.dists_by_name.get(root.key)]
+            else:
+                todo = list(self.find_providers(root))
+            seen = set()
+            while todo:
+                dist = todo.pop()
+                if dist is None or dist in seen:
+                    continue
+                seen.add(dist)
+                result[dist].add(root)
+                for r in self._get_requirements(dist, install_dists,
+                                                meta_extras)[1]:
+                    todo.extend(self.find_providers(r))
+        return result
+
+    def _find_dists(self, roots, meta_extras, prereleases, problems):
+        """
+        Find the distributions needed for some located distributions.
+
+        :param roots: A list of tuples of the requirement each distribution
+                      was located for (``None`` for one passed in) and the
+                      distribution.
+        """
+        self._clear()
+
+        meta_extras = self._get_meta_extras(meta_extras)
+
+        for reqt, dist in roots:
+            if reqt is not None:
+                # An earlier root may already meet this requirement
+                providers = self.find_providers(reqt)
+                if providers:
+                    self.reqts.setdefault(providers.pop(), set()).add(reqt)
+                    continue
+            name = dist.key
+            if name not in self.dists_by_name:
+                self.add_distribution(dist)
+            else:
+                other = self.dists_by_name[name]
+                if (other != dist and
+                    not self.try_to_replace(dist, other, problems)):
+                    continue
+            if reqt is not None:
+                self.reqts.setdefault(dist, set()).add(reqt)
+        todo = set(self.dists.values())
+        for dist in todo:
+            dist.requested = True
+        install_dists = set(todo)
+        # The providers located in advance for requirements, and the
+        # distributions whose requirements haven't been prefetched yet
+        located = {}
+        new = set(todo)
         while todo:
+            if self.prefetch and new:
+                self._prefetch(new, install_dists, meta_extras, prereleases,
+                               located)
+                new = set()
             dist = todo.pop()
             name = dist.key     # case-insensitive
             if name not in self.dists_by_name:
@@ -1131,27 +4039,25 @@ class DependencyFinder(object):
             else:
                 #import pdb; pdb.set_trace()
                 other = self.dists_by_name[name]
-                if other != dist:
-                    self.try_to_replace(dist, other, problems)
-
-            ireqts = dist.run_requires | dist.meta_requires
-            sreqts = dist.build_requires
-            ereqts = set()
-            if dist in install_dists:
-                for key in ('test', 'build', 'dev'):
-                    e = ':%s:' % key
-                    if e in meta_extras:
-                        ereqts |= getattr(dist, '%s_requires' % key)
-            all_reqts = ireqts | sreqts | ereqts
+                if (other != dist and
+                    not self.try_to_replace(dist, other, problems)):
+                    # dist isn't used, so its requirements aren't needed
+                    continue
+
+            ireqts, all_reqts = self._get_requirements(dist, install_dists,
+                                                       meta_extras)
             for r in all_reqts:
                 providers = self.find_providers(r)
                 if not providers:
                     logger.debug('No providers found for %r', r)
-                    provider = self.locator.locate(r, prereleases=prereleases)
-                    # If no provider is found and we didn't consider
-                    # prereleases, consider them now.
-                    if provider is None and not prereleases:
-                        provider = self.locator.locate(r, prereleases=True)
+                    if r in located:
+                        provider = located[r]
+                    else:
+                        provider = self._locate(r, prereleases)
+                        # If no provider is found and we didn't consider
+                        # prereleases, consider them now.
+                        if provider is None and not prereleases:
+                            provider = self._locate(r, True)
                     if provider is None:
                         logger.debug('Cannot satisfy %r', r)
                         problems.add(('unsatisfied', r))
@@ -1159,16 +4065,18 @@ class DependencyFinder(object):
                         n, v = provider.key, provider.version
                         if (n, v) not in self.dists:
                             todo.add(provider)
+                            new.add(provider)
                         providers.add(provider)
                         if r in ireqts and dist in install_dists:
                             install_dists.add(provider)
                             logger.debug('Adding %s to install_dists',
                                          provider.name_and_version)
                 for p in providers:
+                    # record r, so that p isn't replaced by a distribution
+                    # which doesn't meet it
+                    self.reqts.setdefault(p, set()).add(r)
                     name = p.key
-                    if name not in self.dists_by_name:
-                        self.reqts.setdefault(p, set()).add(r)
-                    else:
+                    if name in self.dists_by_name:
                         other = self.dists_by_name[name]
                         if other != p:
                             # see if other can be replaced by p
@@ -1180,5 +4088,429 @@ class DependencyFinder(object):
             if dist.build_time_dependency:
                 logger.debug('%s is a build-time dependency only.',
                              dist.name_and_version)
-        logger.debug('find done for %s', odist)
         return dists, problems
+
+    def _get_candidates(self, name, prereleases):
+        """
+        Get the versions which might be chosen for a project when resolving,
+        as (version, distribution) tuples, most preferred first: the most
+        recent releases first, followed by any pre-releases (which come
+        first, with the releases, if ``prereleases`` is true).
+        """
+        releases = []
+        others = []
+        self._projects.add(name)
+        for version, dist in self.locator.get_project(name).items():
+            try:
+                v = self.get_version(version)
+            except UnsupportedVersionError:
+                logger.debug('Ignoring %s (%s): unsupported version', name,
+                             version)
+                continue
+            if prereleases or not v.is_prerelease:
+                releases.append((v, dist))
+            else:
+                others.append((v, dist))
+        releases.sort(key=lambda t: t[0], reverse=True)
+        others.sort(key=lambda t: t[0], reverse=True)
+        return releases + others
+
+    def resolve(self, requirement, meta_extras=None, prereleases=False,
+                max_steps=10000):
+        """
+        Find a distribution and all distributions it depends on, searching
+        for a combination of versions which meets all the requirements.
+
+        Unlike :meth:`find`, which picks the most recent version which
+        matches each requirement as it comes across it, and can only try to
+        replace it later, this backtracks to earlier choices when there's a
+        conflict. Each conflict is learned as a set of choices which can't be
+        made together, so that no combination known to be bad is tried
+        again, and the search goes straight back to the most recent choice
+        responsible for it.
+
+        :param requirement: As for :meth:`find`.
+        :param meta_extras: As for :meth:`find`, except that the meta extras
+                            only apply to the requested distribution.
+        :param prereleases: If ``True``, allow pre-release versions to be
+                            chosen in preference to earlier releases -
+                            otherwise, pre-releases are only tried once all
+                            the releases of a project have been.
+        :param max_steps: The maximum number of versions to try before
+                          giving up, or ``None`` for no limit.
+
+        Return a set of :class:`Distribution` instances and a set of
+        problems, as for :meth:`find`. If there's no combination of versions
+        which meets the requirements, the set of distributions is empty, and
+        the problems hold a tuple of the string ``'conflict'`` and a set of
+        the requirements which conflict. Each of these is a tuple of the
+        name and version of the distribution with the requirement (``None``
+        for ``requirement`` itself) and the requirement. If ``max_steps``
+        versions are tried without finding a combination, the problems hold
+        a tuple of the string ``'toomanysteps'`` and ``max_steps``.
+
+        If the finder has a result cache, results are got from it where
+        possible and stored in it.
+        """
+        return self._get_result('resolve', self._resolve, requirement,
+                                meta_extras, prereleases, max_steps)
+
+    def _resolve(self, requirement, meta_extras, prereleases, max_steps):
+        self._clear()
+
+        meta_extras = self._get_meta_extras(meta_extras)
+
+        state = _Resolution(self, meta_extras)
+        if isinstance(requirement, Distribution):
+            root = requirement
+            state.root_key = root.key
+            state.names[root.key] = root.name
+            state.choose(root.key, root)
+        else:
+            root = None
+            state.root_key = state.add_requirement(requirement, None)
+
+        problems = set()
+        # The choices made, most recent last. Each holds a project's key, its
+        # candidates and how many have been tried, the choices and
+        # requirements which ruled out the ones which couldn't be chosen,
+        # and the keys of the projects which the chosen one added
+        # requirements for.
+        stack = []
+        frame = None
+        steps = 0
+        while True:
+            if frame is None:
+                key = state.next_key()
+                if key is None:
+                    break
+                candidates = self._get_candidates(state.names[key],
+                                                  prereleases)
+                if not candidates:
+                    if key == state.root_key:
+                        raise DistlibException('Unable to locate %r' %
+                                               requirement)
+                    logger.debug('No versions found for %s',
+                                 state.names[key])
+                    state.missing.add(key)
+                    continue
+                frame = {'key': key, 'candidates': candidates, 'tried': 0,
+                         'culprits': set(), 'reasons': set(), 'added': None}
+                stack.append(frame)
+            key = frame['key']
+            candidates = frame['candidates']
+            while frame['added'] is None and frame['tried'] < len(candidates):
+                version, dist = candidates[frame['tried']]
+                frame['tried'] += 1
+                steps += 1
+                if max_steps is not None and steps > max_steps:
+                    logger.debug('Giving up on %s after %d steps',
+                                 requirement, max_steps)
+                    problems.add(('toomanysteps', max_steps))
+                    return set(), problems
+                ruled_out = state.check(key, version, dist)
+                if ruled_out is None:
+                    frame['added'] = state.choose(key, dist)
+                else:
+                    frame['culprits'] |= ruled_out[0]
+                    frame['reasons'] |= ruled_out[1]
+            if frame['added'] is not None:
+                frame = None
+                continue
+            # No version of the project can be chosen. Learn that the
+            # choices responsible can't be made together, and go back to the
+            # most recent of them, undoing the choices made since. The
+            # choices which made the project needed are responsible too, as
+            # without them it wouldn't need a version at all.
+            culprits = frame['culprits'] | state.get_sources(key)
+            reasons = frame['reasons']
+            stack.pop()
+            if culprits:
+                state.learn(culprits, reasons)
+            frame = None
+            while stack:
+                f = stack.pop()
+                state.unchoose(f['key'], f['added'])
+                choice = (f['key'],
+                          f['candidates'][f['tried'] - 1][1].version)
+                f['added'] = None
+                if choice in culprits:
+                    f['culprits'] |= culprits - set([choice])
+                    f['reasons'] |= reasons
+                    stack.append(f)
+                    frame = f
+                    break
+            if frame is None:
+                logger.debug('Unable to resolve %s', requirement)
+                problems.add(('conflict', frozenset(reasons)))
+                return set(), problems
+
+        # Record the result as find() does
+        for key, dist in state.chosen.items():
+            self.add_distribution(dist)
+        for key, c in state.constraints.items():
+            for reqt, source in c:
+                if key in state.chosen:
+                    self.reqts.setdefault(state.chosen[key], set()).add(reqt)
+                else:
+                    logger.debug('Cannot satisfy %r', reqt)
+                    problems.add(('unsatisfied', reqt))
+        odist = state.chosen[state.root_key]
+        odist.requested = True
+        # The install-time dependencies are those reached from the requested
+        # distribution through install-time requirements
+        install_dists = set([odist])
+        todo = [state.root_key]
+        while todo:
+            key = todo.pop()
+            for reqt in state.get_requirements(key, state.chosen[key])[1]:
+                k = state.parse(reqt)[0].key
+                if k in state.chosen and state.chosen[k] not in install_dists:
+                    install_dists.add(state.chosen[k])
+                    todo.append(k)
+        dists = set(self.dists.values())
+        for dist in dists:
+            dist.build_time_dependency = dist not in install_dists
+        logger.debug('resolve done for %s', odist)
+        return dists, problems
+
+
+def _get_requirement_key(requirement):
+    """
+    Return a requirement in a form which can be used in a cache key.
+    """
+    if isinstance(requirement, Distribution):
+        requirement = {
+            'metadata': requirement.metadata.dictionary,
+            'extras': requirement.extras,
+        }
+    return requirement
+
+
+LOCK_VERSION = 1
+
+
+def _is_lockable(problems):
+    """
+    Return whether a result with the specified problems can be recorded:
+    that is, whether they're all unsatisfied requirements.
+    """
+    for problem in problems:
+        if problem[0] != 'unsatisfied':
+            return False
+    return True
+
+
+def _encode_result(dists, problems, reqts=None):
+    if not _is_lockable(problems):
+        raise DistlibException('Only unsatisfied requirements can be '
+                               'recorded as problems')
+    entries = []
+    for dist in sorted(dists, key=lambda d: (d.key, d.version)):
+        entry = {
+            'name': dist.name,
+            'version': dist.version,
+            'source_url': dist.source_url,
+            'digest': dist.digest and list(dist.digest),
+            'extras': dist.extras and list(dist.extras),
+            'requested': bool(dist.requested),
+            'build_time_dependency': bool(dist.build_time_dependency),
+            'metadata': dist.metadata.dictionary,
+            'requirements': sorted((reqts or {}).get(dist, ())),
+        }
+        entries.append(entry)
+    return {
+        'lock_version': LOCK_VERSION,
+        'distributions': entries,
+        'unsatisfied': sorted(p[1] for p in problems),
+    }
+
+
+def _decode_result(data, scheme):
+    if data.get('lock_version') != LOCK_VERSION:
+        raise DistlibException('Unsupported lock version: %r' %
+                               data.get('lock_version'))
+    dists = set()
+    reqts = {}
+    for entry in data['distributions']:
+        md = Metadata(mapping=entry['metadata'], scheme=scheme)
+        md.source_url = entry['source_url']
+        dist = Distribution(md)
+        if entry['digest']:
+            dist.digest = tuple(entry['digest'])
+        dist.extras = entry['extras']
+        dist.requested = entry['requested']
+        dist.build_time_dependency = entry['build_time_dependency']
+        dists.add(dist)
+        if entry.get('requirements'):
+            reqts[dist] = set(entry['requirements'])
+    problems = set(('unsatisfied', r) for r in data['unsatisfied'])
+    return dists, problems, reqts
+
+
+def _read_lock(path, scheme):
+    """
+    Read a lock file, returning the distributions, the problems and the
+    requirements which each distribution meets.
+    """
+    with open(path, 'rb') as f:
+        data = json.loads(f.read().decode('utf-8'))
+    return _decode_result(data, scheme)
+
+
+def save_lock(path, dists, problems=(), reqts=None):
+    """
+    Save the result of :meth:`DependencyFinder.find` or
+    :meth:`DependencyFinder.resolve` to a lock file, from which it can be
+    loaded using :func:`load_lock`.
+
+    :param path: The pathname of the lock file.
+    :param dists: The distributions found.
+    :param problems: The problems found. Only unsatisfied requirements can
+                     be recorded.
+    :param reqts: If specified, a dictionary mapping distributions to the
+                  requirements they meet, like the finder's ``reqts``
+                  attribute, to be recorded with them.
+    """
+    data = json.dumps(_encode_result(dists, problems, reqts), indent=2,
+                      sort_keys=True)
+    _write_atomically(path, data.encode('utf-8'))
+
+
+def load_lock(path, scheme='default'):
+    """
+    Load a result saved using :func:`save_lock`.
+
+    :param path: The pathname of the lock file.
+    :param scheme: The version scheme to use for the distributions'
+                   metadata.
+    :return: A tuple of the set of distributions and the set of problems.
+    """
+    return _read_lock(path, scheme)[:2]
+
+
+def verify_lock(dists, locator):
+    """
+    Check that the versions of distributions in a result (for example, one
+    loaded using :func:`load_lock`) can still be found by a locator, with the
+    same digests where these are known.
+
+    :param dists: The distributions to check.
+    :param locator: The locator to look for them with.
+    :return: A set of the distributions which couldn't be found.
+    """
+    result = set()
+    for dist in dists:
+        found = locator.get_project(dist.name).get(dist.version)
+        if found is None:
+            logger.debug('%s is no longer available', dist.name_and_version)
+            result.add(dist)
+        elif dist.digest and found.digest and dist.digest != found.digest:
+            logger.debug('%s has a different digest', dist.name_and_version)
+            result.add(dist)
+    return result
+
+
+class ResolutionCache(object):
+    """
+    A persistent cache for the results of :meth:`DependencyFinder.find` and
+    :meth:`DependencyFinder.resolve`, keyed by a hash of their inputs (see
+    :meth:`DependencyFinder.get_cache_key`). Each result is held in a file
+    in the format used by :func:`save_lock`.
+    """
+
+    def __init__(self, base=None):
+        """
+        Initialise an instance.
+
+        :param base: The base directory where the cache should be located. If
+                     not specified, this will be the ``resolutions``
+                     directory under whatever :func:`get_cache_base`
+                     returns.
+        """
+        if base is None:
+            base = os.path.join(get_cache_base(), 'resolutions')
+        if not os.path.isdir(base):
+            os.makedirs(base)
+        self.base = os.path.abspath(os.path.normpath(base))
+
+    def key_to_path(self, key):
+        """
+        Return the pathname in the cache used to store the result for a key.
+        """
+        return os.path.join(self.base, key + '.json')
+
+    def get(self, key, scheme='default'):
+        """
+        Get a cached result.
+
+        :param key: The key for the result.
+        :param scheme: The version scheme to use for the distributions'
+                       metadata.
+        :return: ``None`` if there is no usable result, otherwise a tuple of
+                 the set of distributions and the set of problems.
+        """
+        result = self.get_entry(key, scheme)
+        if result is not None:
+            result = result[:2]
+        return result
+
+    def get_entry(self, key, scheme='default'):
+        """
+        Get a cached result, together with what was stored with it.
+
+        :param key: The key for the result.
+        :param scheme: The version scheme to use for the distributions'
+                       metadata.
+        :return: ``None`` if there is no usable result, otherwise a tuple of
+                 the set of distributions, the set of problems, a dictionary
+                 mapping each distribution to the requirements it meets and
+                 a dictionary mapping the names of projects to their
+                 fingerprints (see :meth:`put`).
+        """
+        result = None
+        path = self.key_to_path(key)
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    data = json.loads(f.read().decode('utf-8'))
+                dists, problems, reqts = _decode_result(data, scheme)
+                result = dists, problems, reqts, data.get('projects', {})
+            except Exception as e:
+                logger.warning('Unable to read cached result %s: %s', path, e)
+        return result
+
+    def put(self, key, dists, problems, reqts=None, projects=None):
+        """
+        Store a result in the cache.
+
+        :param key: The key for the result.
+        :param dists: The distributions found.
+        :param problems: The problems found, which must all be unsatisfied
+                         requirements.
+        :param reqts: As for :func:`save_lock`.
+        :param projects: If specified, a dictionary mapping the names of
+                         the projects the result depends on to their
+                         fingerprints (see
+                         :meth:`Locator.get_project_fingerprint`), so that
+                         it can be checked that they haven't changed before
+                         the result is used.
+        """
+        data = _encode_result(dists, problems, reqts)
+        if projects:
+            data['projects'] = projects
+        data = json.dumps(data, indent=2, sort_keys=True)
+        _write_atomically(self.key_to_path(key), data.encode('utf-8'))
+
+    def clear(self):
+        """
+        Clear the cache.
+        """
+        not_removed = []
+        for fn in os.listdir(self.base):
+            fn = os.path.join(self.base, fn)
+            try:
+                os.remove(fn)
+            except Exception:
+                not_removed.append(fn)
+        return not_removed
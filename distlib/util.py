@@ -8,10 +8,12 @@ import contextlib
 import csv
 from glob import iglob as std_iglob
 import io
+import itertools
 import json
 import logging
 import os
 import py_compile
+import random
 import re
 import shutil
 import socket
@@ -28,7 +30,8 @@ from .compat import (string_types, text_type, shutil, raw_input, StringIO,
                      cache_from_source, urlopen, httplib, xmlrpclib, splittype,
                      HTTPHandler, HTTPSHandler as BaseHTTPSHandler,
                      BaseConfigurator, valid_ident, Container, configparser,
-                     URLError, match_hostname, CertificateError, ZipFile)
+                     URLError, HTTPError, match_hostname, CertificateError,
+                     ZipFile, queue, OrderedDict)
 
 logger = logging.getLogger(__name__)
 
@@ -1179,6 +1182,223 @@ def _iglob(path_glob):
 
 
 
+#
+# A simple thread pool. We can't use concurrent.futures, as it's not
+# available on 2.x.
+#
+
+class Future(object):
+    """
+    The eventual result of a callable submitted to a :class:`WorkerPool`.
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._result = None
+        self._exception = None
+        self._cancelled = False
+        self._running = False
+        self._callbacks = []
+
+    def _complete(self):
+        self._event.set()
+        for fn in self._callbacks:
+            try:
+                fn(self)
+            except Exception:
+                logger.exception('Exception in future callback')
+
+    def cancel(self):
+        """
+        Cancel the call, if it hasn't already started.
+
+        :return: True if the call was cancelled, else False.
+        """
+        with self._lock:
+            if self._event.is_set():
+                return self._cancelled
+            if self._running:
+                return False
+            self._cancelled = True
+        self._complete()
+        return True
+
+    def cancelled(self):
+        return self._cancelled
+
+    def running(self):
+        return self._running and not self._event.is_set()
+
+    def set_running(self):
+        """
+        Mark the call as started, so that it can no longer be cancelled.
+
+        :return: False if the call was cancelled (and so shouldn't be
+                 made), else True.
+        """
+        with self._lock:
+            if self._cancelled:
+                return False
+            self._running = True
+        return True
+
+    def done(self):
+        return self._event.is_set()
+
+    def set_result(self, result):
+        with self._lock:
+            if self._event.is_set():    # e.g. cancelled
+                return
+            self._result = result
+        self._complete()
+
+    def set_exception(self, exception):
+        with self._lock:
+            if self._event.is_set():    # e.g. cancelled
+                return
+            self._exception = exception
+        self._complete()
+
+    def add_done_callback(self, fn):
+        """
+        Arrange for a callable to be called with this instance as its only
+        argument when the call completes (immediately, if it already has).
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def wait(self, timeout=None):
+        """
+        Wait for the call to complete.
+
+        :return: True if the call completed, else False (if the timeout
+                 expired first).
+        """
+        return self._event.wait(timeout) or self._event.is_set()
+
+    def exception(self, timeout=None):
+        """
+        Wait for the call to complete and return any exception it raised.
+        """
+        self._event.wait(timeout)
+        if not self._event.is_set():
+            raise DistlibException('timed out waiting for result')
+        if self._cancelled:
+            raise DistlibException('call was cancelled')
+        return self._exception
+
+    def result(self, timeout=None):
+        """
+        Wait for the call to complete and return its result, re-raising any
+        exception it raised.
+        """
+        exc = self.exception(timeout)
+        if exc is not None:
+            raise exc
+        return self._result
+
+
+class WorkerPool(object):
+    """
+    A pool of worker threads which run submitted callables. Threads are
+    started lazily, when the first callable is submitted, and live until
+    the pool is closed. Callables are run in order of priority, and in the
+    order they were submitted for the same priority.
+    """
+    # Used as the priority of the sentinels which stop the threads, so that
+    # they come after everything submitted before the pool was closed.
+    _last = float('inf')
+
+    def __init__(self, num_workers=10):
+        """
+        Initialise an instance.
+
+        :param num_workers: The number of worker threads to use.
+        """
+        self.num_workers = num_workers
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()[2]
+            if item is None:    # sentinel
+                break
+            future, fn, args, kwargs = item
+            if not future.set_running():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Arrange for ``fn(*args, **kwargs)`` to be called in a worker thread.
+
+        :return: A :class:`Future` for the result of the call.
+        """
+        return self.submit_priority(0, fn, *args, **kwargs)
+
+    def submit_priority(self, priority, fn, *args, **kwargs):
+        """
+        Arrange for ``fn(*args, **kwargs)`` to be called in a worker thread,
+        before any callables waiting to be run which were submitted with a
+        higher priority value. :meth:`submit` uses a priority of 0.
+
+        :return: A :class:`Future` for the result of the call.
+        """
+        with self._lock:
+            if self._closed:
+                raise DistlibException('worker pool has been closed')
+            if not self._threads:
+                for i in range(self.num_workers):
+                    t = threading.Thread(target=self._worker)
+                    t.daemon = True
+                    t.start()
+                    self._threads.append(t)
+            seq = next(self._counter)
+        result = Future()
+        self._queue.put((priority, seq, (result, fn, args, kwargs)))
+        return result
+
+    def close(self, wait=True):
+        """
+        Shut down the pool. Callables already submitted are run before the
+        worker threads terminate.
+
+        :param wait: If True, wait for the worker threads to terminate.
+        """
+        with self._lock:
+            self._closed = True
+            threads, self._threads = self._threads, []
+        # Note that you need two loops, since you can't say which
+        # thread will get each sentinel
+        for t in threads:
+            with self._lock:
+                seq = next(self._counter)
+            self._queue.put((self._last, seq, None))    # sentinel
+        if wait:
+            current = threading.current_thread()
+            for t in threads:
+                if t is not current:
+                    t.join()
+
+
 #
 # HTTPSConnection which verifies certificates/matches domains
 #
@@ -1226,10 +1446,13 @@ class HTTPSConnection(httplib.HTTPSConnection):
                 raise
 
 class HTTPSHandler(BaseHTTPSHandler):
-    def __init__(self, ca_certs, check_domain=True):
+    def __init__(self, ca_certs, check_domain=True, pool=None):
         BaseHTTPSHandler.__init__(self)
         self.ca_certs = ca_certs
         self.check_domain = check_domain
+        # If a ConnectionPool is specified, connections are kept alive
+        # for reuse
+        self.pool = pool
 
     def _conn_maker(self, *args, **kwargs):
         """
@@ -1249,7 +1472,9 @@ class HTTPSHandler(BaseHTTPSHandler):
 
     def https_open(self, req):
         try:
-            return self.do_open(self._conn_maker, req)
+            if self.pool is None:
+                return self.do_open(self._conn_maker, req)
+            return self.pool.open(self._conn_maker, req)
         except URLError as e:
             if 'certificate verify failed' in str(e.reason):
                 raise CertificateError('Unable to verify server certificate '
@@ -1271,6 +1496,669 @@ class HTTPSOnlyHandler(HTTPSHandler, HTTPHandler):
         raise URLError('Unexpected HTTP request on what should be a secure '
                        'connection: %s' % req)
 
+#
+# HTTP keep-alive support. The standard library's handlers use a new
+# connection for every request; the handlers below get their connections from
+# a ConnectionPool, which keeps them open for reuse.
+#
+
+# The exceptions which may indicate that a kept-alive connection was closed by
+# the server while it was idle.
+_CONNECTION_ERRORS = (socket.error, httplib.BadStatusLine)
+
+# The methods of requests which can safely be sent again on a new connection
+# if a reused one turns out to be stale: the server may have acted on a
+# request of any other method before closing the connection.
+_IDEMPOTENT_METHODS = ('GET', 'HEAD')
+
+
+def _is_stale_connection_error(e):
+    """
+    Return whether an error from a request on a reused connection shows that
+    the connection was closed before any response arrived, as it is when the
+    server closes an idle connection. A timeout doesn't, as retrying would
+    make the caller wait longer than it asked to.
+    """
+    if isinstance(e, socket.timeout):
+        result = False
+    elif isinstance(e, socket.error):
+        # on Python 3, this includes RemoteDisconnected, raised when the
+        # connection is closed without a status line being sent
+        result = True
+    else:
+        # Python 2 raises BadStatusLine with this message in that case; any
+        # other BadStatusLine means that a response did arrive
+        result = 'No status line received' in str(e)
+    return result
+
+
+class PooledResponse(object):
+    """
+    A response for a request made using a pooled connection. This offers the
+    same interface as the response objects returned by ``urlopen``. The
+    connection is returned to its pool once the response has been read in
+    full.
+    """
+    def __init__(self, response, url, release):
+        self._response = response
+        self._release = release
+        self.url = url
+        self.code = self.status = response.status
+        self.msg = response.reason
+        self.headers = response.msg
+        if response.length == 0:
+            # e.g. 304 or 204 responses - so release straight away
+            response.read()
+        self._check_done()
+
+    def _check_done(self, data=None):
+        r = self._response
+        if self._release is not None and (r.isclosed() or
+                                          (data is not None and not data)):
+            release, self._release = self._release, None
+            release(not r.will_close)
+
+    def info(self):
+        return self.headers
+
+    def geturl(self):
+        return self.url
+
+    def getcode(self):
+        return self.code
+
+    def read(self, amt=None):
+        if amt is None:
+            result = self._response.read()
+        else:
+            result = self._response.read(amt)
+        self._check_done(result)
+        return result
+
+    def readline(self, *args):
+        result = self._response.readline(*args)
+        self._check_done(result)
+        return result
+
+    def readlines(self, *args):
+        result = self._response.readlines(*args)
+        self._check_done()
+        return result
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                break
+            yield line
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._check_done()
+        if self._release is not None:
+            # Not fully read, so the connection can't be reused
+            release, self._release = self._release, None
+            self._response.close()
+            release(False)
+
+
+class ConnectionPool(object):
+    """
+    A pool of HTTP and HTTPS connections which are kept alive between
+    requests, so that requests to the same host can reuse an existing
+    connection rather than paying for a new TCP connection (and TLS
+    handshake) each time.
+    """
+    def __init__(self, maxsize=10, idle_timeout=60.0):
+        """
+        Initialise an instance.
+
+        :param maxsize: The maximum number of idle connections kept for any
+                        one host.
+        :param idle_timeout: The number of seconds for which a connection may
+                             be idle before it's discarded rather than reused.
+        """
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key, factory, host, timeout):
+        """
+        Get a connection from the pool, or a new one if no idle connection
+        is available.
+
+        :param key: The key identifying interchangeable connections - for
+                    example, a (scheme, host) tuple.
+        :param factory: A callable which is called with ``host`` and a
+                        ``timeout`` keyword argument to make a new connection.
+        :param host: The host (and optional port) to connect to.
+        :param timeout: The timeout to use for the connection.
+        :return: A tuple of the connection and a flag indicating whether it
+                 was reused.
+        """
+        now = time.time()
+        result = None
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                conn, last_used = idle.pop()
+                if now - last_used <= self.idle_timeout:
+                    result = conn
+                    break
+                conn.close()
+        if result is not None:
+            result.timeout = timeout
+            if result.sock is not None:
+                if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+                    timeout = socket.getdefaulttimeout()
+                result.sock.settimeout(timeout)
+            return result, True
+        return factory(host, timeout=timeout), False
+
+    def release(self, key, conn):
+        """
+        Return a connection to the pool for reuse.
+        """
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.maxsize:
+                idle.append((conn, time.time()))
+                conn = None
+        if conn is not None:
+            conn.close()
+
+    def open(self, factory, req):
+        """
+        Make a request using a pooled connection. This is meant to be called
+        from the ``http_open`` / ``https_open`` method of a handler. If a
+        reused connection turns out to have been closed by the server, a GET
+        or HEAD request is retried using another connection.
+
+        :param factory: As for :meth:`acquire`.
+        :param req: The request to make.
+        :return: A :class:`PooledResponse` instance.
+        """
+        if hasattr(req, 'get_host'):
+            scheme = req.get_type()
+            host = req.get_host()
+            selector = req.get_selector()
+        else:
+            scheme = req.type
+            host = req.host
+            selector = req.selector
+        if not host:
+            raise URLError('no host given')
+        key = (scheme, host)
+        headers = dict(req.unredirected_hdrs)
+        headers.update(dict((k, v) for k, v in req.headers.items()
+                            if k not in headers))
+        headers['Connection'] = 'keep-alive'
+        headers = dict((name.title(), val) for name, val in headers.items())
+        method = req.get_method()
+        while True:
+            conn, reused = self.acquire(key, factory, host, req.timeout)
+            try:
+                conn.request(method, selector, req.data, headers)
+                r = conn.getresponse()
+                break
+            except _CONNECTION_ERRORS as e:
+                conn.close()
+                if (not reused or method not in _IDEMPOTENT_METHODS or
+                    not _is_stale_connection_error(e)):
+                    raise URLError(e)
+                logger.debug('Stale connection to %s, retrying', host)
+            except Exception:
+                conn.close()
+                raise
+
+        def release(reusable):
+            if reusable:
+                self.release(key, conn)
+            else:
+                conn.close()
+
+        return PooledResponse(r, req.get_full_url(), release)
+
+    def close(self):
+        """
+        Close all the idle connections in the pool.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn, _ in conns:
+                conn.close()
+
+
+class PooledHTTPHandler(HTTPHandler):
+    """
+    A handler for HTTP requests which uses a :class:`ConnectionPool`.
+    """
+    def __init__(self, pool):
+        HTTPHandler.__init__(self)
+        self.pool = pool
+
+    def http_open(self, req):
+        if getattr(req, '_tunnel_host', None):  # proxy tunnels aren't pooled
+            return HTTPHandler.http_open(self, req)
+        return self.pool.open(httplib.HTTPConnection, req)
+
+
+class PooledHTTPSHandler(BaseHTTPSHandler):
+    """
+    A handler for HTTPS requests which uses a :class:`ConnectionPool`. Server
+    certificates are verified as by the standard library's handler; use
+    :class:`HTTPSHandler` with a ``pool`` argument to verify against specific
+    CA certificates.
+    """
+    def __init__(self, pool):
+        BaseHTTPSHandler.__init__(self)
+        self.pool = pool
+
+    def _make_connection(self, host, **kwargs):
+        context = getattr(self, '_context', None)
+        if context is not None:
+            kwargs['context'] = context
+        return httplib.HTTPSConnection(host, **kwargs)
+
+    def https_open(self, req):
+        if getattr(req, '_tunnel_host', None):  # proxy tunnels aren't pooled
+            return BaseHTTPSHandler.https_open(self, req)
+        return self.pool.open(self._make_connection, req)
+
+
+#
+# Scheduling of requests to hosts: rate limiting, retries and a circuit
+# breaker for hosts which keep failing.
+#
+
+class _HostState(object):
+    def __init__(self, burst):
+        self.tokens = burst
+        self.last = time.time()
+        self.failures = 0
+        self.opened_at = None   # set when the circuit is open
+        self.trial = False      # True while a half-open trial is running
+
+
+class HostScheduler(object):
+    """
+    Schedules requests to remote hosts. For each host, this
+
+    * limits the rate of requests using a token bucket,
+    * retries calls which fail with transient errors, with exponential
+      backoff between attempts, and
+    * implements a circuit breaker: once calls to a host have failed a number
+      of times in a row, the host is treated as unavailable until a cooldown
+      period has passed, after which a single trial call is allowed through.
+      If that succeeds, the host is available again; otherwise, another
+      cooldown period starts.
+
+    An instance can be shared by several locators and package indexes (and
+    threads), so that they observe the same limits.
+    """
+
+    #: The HTTP status codes which indicate a transient problem.
+    retry_codes = (429, 500, 502, 503, 504)
+
+    def __init__(self, rate=None, burst=1, max_retries=2, backoff=0.5,
+                 max_backoff=30.0, failure_threshold=3, cooldown=30.0):
+        """
+        Initialise an instance.
+
+        :param rate: The maximum number of requests per second to any one
+                     host, or ``None`` for no limit.
+        :param burst: The number of requests to a host which can be made in
+                      quick succession before the rate limit applies.
+        :param max_retries: The maximum number of times a call which fails
+                            with a transient error is retried.
+        :param backoff: The delay, in seconds, before the first retry. The
+                        delay doubles for each subsequent retry.
+        :param max_backoff: The maximum delay before a retry.
+        :param failure_threshold: The number of consecutive failed calls to a
+                                  host after which the host's circuit is
+                                  opened.
+        :param cooldown: The number of seconds for which a host's circuit
+                         stays open before a trial call is allowed.
+        """
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _get_state(self, host):
+        # must be called with the lock held
+        result = self._hosts.get(host)
+        if result is None:
+            result = self._hosts[host] = _HostState(self.burst)
+        return result
+
+    def reserve(self, host):
+        """
+        Reserve the right to make a request to a host.
+
+        :return: The number of seconds to wait before making the request.
+        """
+        if not self.rate:
+            return 0
+        with self._lock:
+            state = self._get_state(host)
+            now = time.time()
+            state.tokens = min(self.burst,
+                               state.tokens + (now - state.last) * self.rate)
+            state.last = now
+            state.tokens -= 1
+            if state.tokens >= 0:
+                result = 0
+            else:
+                result = -state.tokens / self.rate
+        return result
+
+    def acquire(self, host):
+        """
+        Wait until a request to a host can be made under the rate limit.
+        """
+        delay = self.reserve(host)
+        if delay > 0:
+            time.sleep(delay)
+
+    def is_available(self, host):
+        """
+        Return whether requests can currently be made to a host - that is,
+        its circuit isn't open, or has been open long enough for a trial call
+        to be allowed (in which case, the caller gets to make it).
+        """
+        with self._lock:
+            state = self._get_state(host)
+            if state.opened_at is None:
+                result = True
+            elif state.trial:
+                result = False
+            elif time.time() - state.opened_at < self.cooldown:
+                result = False
+            else:
+                state.trial = result = True
+        return result
+
+    def record_success(self, host):
+        """
+        Record that a host responded, closing its circuit.
+        """
+        with self._lock:
+            state = self._get_state(host)
+            state.failures = 0
+            state.opened_at = None
+            state.trial = False
+
+    def record_failure(self, host):
+        """
+        Record that a call to a host failed, opening its circuit if it has
+        failed too many times in a row, or if a trial call failed.
+        """
+        with self._lock:
+            state = self._get_state(host)
+            state.failures += 1
+            if state.trial or state.failures >= self.failure_threshold:
+                if state.opened_at is None:
+                    logger.warning('Too many failures for %s, not using it '
+                                   'for %s seconds', host, self.cooldown)
+                state.opened_at = time.time()
+                state.trial = False
+
+    def end_trial(self, host):
+        """
+        Record that a call to a host ended without showing whether the host
+        is working (for example, because its response couldn't be
+        processed), so that if it was a trial call, another can be made.
+        """
+        with self._lock:
+            self._get_state(host).trial = False
+
+    def is_transient(self, exc):
+        """
+        Return whether an exception indicates a transient error, so that the
+        call which raised it is worth retrying.
+        """
+        if isinstance(exc, HTTPError):
+            result = exc.code in self.retry_codes
+        elif isinstance(exc, URLError):
+            # A failure to resolve the host name won't go away on retrying
+            result = (isinstance(exc.reason, socket.error) and
+                      not isinstance(exc.reason, socket.gaierror))
+        else:
+            result = (isinstance(exc, (socket.error, httplib.HTTPException))
+                      and not isinstance(exc, socket.gaierror))
+        return result
+
+    def is_failure(self, exc):
+        """
+        Return whether an exception indicates a problem with the host, as
+        opposed to e.g. a missing resource.
+        """
+        if isinstance(exc, HTTPError):
+            result = exc.code in self.retry_codes
+        else:
+            result = isinstance(exc, (URLError, socket.error,
+                                      httplib.HTTPException))
+        return result
+
+    def retry_delay(self, attempt, exc):
+        """
+        Return the number of seconds to wait before retrying a call which
+        failed, or ``None`` if it shouldn't be retried.
+
+        :param attempt: The number of retries already made.
+        :param exc: The exception raised by the call.
+        """
+        if attempt >= self.max_retries or not self.is_transient(exc):
+            return None
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        # Add some jitter, so that retries from several threads are spread
+        # out.
+        delay *= 0.5 + random.random() / 2
+        headers = getattr(exc, 'hdrs', None)
+        if headers is not None:
+            retry_after = headers.get('Retry-After')
+            if retry_after and retry_after.strip().isdigit():
+                delay = min(self.max_backoff, max(delay, int(retry_after)))
+        return delay
+
+    def call(self, host, fn, *args, **kwargs):
+        """
+        Call a function which makes a request to a host, subject to the rate
+        limit, retrying it if it fails with a transient error and updating
+        the host's circuit. Callers should check :meth:`is_available` first.
+
+        :return: The function's result. If the call fails, the last
+                 exception it raised is re-raised.
+        """
+        attempt = 0
+        while True:
+            self.acquire(host)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                delay = self.retry_delay(attempt, e)
+                if delay is None or not self.is_available(host):
+                    if self.is_failure(e):
+                        self.record_failure(host)
+                    elif isinstance(e, HTTPError):
+                        self.record_success(host)   # the host responded
+                    else:
+                        self.end_trial(host)
+                    raise
+                if isinstance(e, HTTPError):
+                    e.close()   # so that its connection can be reused
+                attempt += 1
+                logger.debug('Retrying call to %s in %.2f seconds: %s',
+                             host, delay, e)
+                time.sleep(delay)
+            else:
+                self.record_success(host)
+                return result
+
+
+#
+# A bounded cache of recently used entries, with optional expiry
+#
+
+class LRUCache(object):
+    """
+    A mapping which holds a bounded number of entries, discarding the least
+    recently used ones when a limit on the number of entries or their total
+    size is exceeded. Entries can also expire after a time-to-live, with a
+    separate (typically shorter) time-to-live for negative results, such as
+    a project which wasn't found.
+
+    Counts of hits, misses, evictions and expirations are kept, and can be
+    got from :attr:`stats`. An instance can be shared between threads.
+    """
+    def __init__(self, max_entries=None, max_bytes=None, ttl=None,
+                 negative_ttl=None, sizeof=None, is_negative=None):
+        """
+        Initialise an instance.
+
+        :param max_entries: The maximum number of entries held, or ``None``
+                            for no limit.
+        :param max_bytes: The maximum total size of the entries held, or
+                          ``None`` for no limit.
+        :param ttl: The number of seconds for which an entry is valid, or
+                    ``None`` if entries don't expire.
+        :param negative_ttl: The number of seconds for which a negative entry
+                             is valid. If not specified, ``ttl`` is used.
+        :param sizeof: A callable which is passed a key and value and returns
+                       the size of the entry in bytes. If not specified,
+                       :func:`sys.getsizeof` is applied to the value, which
+                       doesn't count the size of any objects the value
+                       refers to.
+        :param is_negative: A callable which is passed a value and returns
+                            whether it's a negative result. If not specified,
+                            values which are false (such as ``None`` or an
+                            empty dictionary) are negative.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        if negative_ttl is None:
+            negative_ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.sizeof = sizeof or (lambda key, value: sys.getsizeof(value))
+        self.is_negative = is_negative or (lambda value: not value)
+        # maps keys to (value, size, expiry time) tuples, least recently
+        # used first
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    @property
+    def stats(self):
+        """
+        A dictionary of statistics: the numbers of hits, misses, evictions
+        and expirations, and the number of entries currently held and their
+        total size.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'entries': len(self._entries),
+                'bytes': self._size,
+            }
+
+    def _remove(self, key):
+        # must be called with the lock held
+        value, size, expires = self._entries.pop(key)
+        self._size -= size
+        return expires
+
+    def get(self, key, default=None):
+        """
+        Return the value for a key, or ``default`` if there's no valid entry
+        for the key.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, size, expires = entry
+            self._remove(key)
+            if expires is not None and time.time() >= expires:
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries[key] = entry  # now the most recently used
+            self.hits += 1
+            return value
+
+    def __getitem__(self, key):
+        missing = object()
+        result = self.get(key, missing)
+        if result is missing:
+            raise KeyError(key)
+        return result
+
+    def __contains__(self, key):
+        # Doesn't count as a use of the entry.
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and (entry[2] is None or
+                                          time.time() < entry[2])
+
+    def __setitem__(self, key, value):
+        size = 0
+        if self.max_bytes is not None:
+            size = self.sizeof(key, value)
+        if self.is_negative(value):
+            ttl = self.negative_ttl
+        else:
+            ttl = self.ttl
+        expires = None
+        if ttl is not None:
+            expires = time.time() + ttl
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires)
+            self._size += size
+            while self._entries and (
+                (self.max_entries is not None and
+                 len(self._entries) > self.max_entries) or
+                (self.max_bytes is not None and self._size > self.max_bytes)):
+                self._remove(next(iter(self._entries)))  # the oldest
+                self.evictions += 1
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def __len__(self):
+        # May include expired entries which haven't been discarded yet.
+        return len(self._entries)
+
+    def clear(self):
+        """
+        Remove all the entries. The statistics are left unchanged.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
 #
 # XML-RPC with timeouts
 #
@@ -1292,9 +2180,53 @@ if _ver_info == (2, 6):
             self._setup(self._connection_class(host, port, **kwargs))
 
 
-class Transport(xmlrpclib.Transport):
-    def __init__(self, timeout, use_datetime=0):
+class PooledTransportMixin(object):
+    """
+    Gets the connections for XML-RPC transports from a ConnectionPool, if
+    one is specified, and returns them to it when the transport is closed.
+    """
+    pool = None
+    _busy = False
+
+    def _pooled_connection(self, host, h, eh, factory):
+        if not self._connection or host != self._connection[0]:
+            self.close()
+            self._extra_headers = eh
+            if self.pool is None:
+                conn = factory(h, timeout=self.timeout)
+            else:
+                conn, _ = self.pool.acquire((self.pool_scheme, h), factory,
+                                            h, self.timeout)
+            self._connection = host, conn
+        return self._connection[1]
+
+    def close(self):
+        host, conn = self._connection
+        if conn:
+            self._connection = (None, None)
+            # A connection closed because a request failed is in an unknown
+            # state, so it's not returned to the pool.
+            if self.pool is None or self._busy:
+                conn.close()
+            else:
+                h = self.get_host_info(host)[0]
+                self.pool.release((self.pool_scheme, h), conn)
+
+    def single_request(self, host, handler, request_body, verbose=0):
+        self._busy = True
+        try:
+            return xmlrpclib.Transport.single_request(self, host, handler,
+                                                      request_body, verbose)
+        finally:
+            self._busy = False
+
+
+class Transport(PooledTransportMixin, xmlrpclib.Transport):
+    pool_scheme = 'http'
+
+    def __init__(self, timeout, use_datetime=0, pool=None):
         self.timeout = timeout
+        self.pool = pool
         xmlrpclib.Transport.__init__(self, use_datetime)
 
     def make_connection(self, host):
@@ -1302,15 +2234,16 @@ class Transport(xmlrpclib.Transport):
         if _ver_info == (2, 6):
             result = HTTP(h, timeout=self.timeout)
         else:
-            if not self._connection or host != self._connection[0]:
-                self._extra_headers = eh
-                self._connection = host, httplib.HTTPConnection(h)
-            result = self._connection[1]
+            result = self._pooled_connection(host, h, eh,
+                                             httplib.HTTPConnection)
         return result
 
-class SafeTransport(xmlrpclib.SafeTransport):
-    def __init__(self, timeout, use_datetime=0):
+class SafeTransport(PooledTransportMixin, xmlrpclib.SafeTransport):
+    pool_scheme = 'https'
+
+    def __init__(self, timeout, use_datetime=0, pool=None):
         self.timeout = timeout
+        self.pool = pool
         xmlrpclib.SafeTransport.__init__(self, use_datetime)
 
     def make_connection(self, host):
@@ -1321,27 +2254,28 @@ class SafeTransport(xmlrpclib.SafeTransport):
         if _ver_info == (2, 6):
             result = HTTPS(host, None, **kwargs)
         else:
-            if not self._connection or host != self._connection[0]:
-                self._extra_headers = eh
-                self._connection = host, httplib.HTTPSConnection(h, None,
-                                                                 **kwargs)
-            result = self._connection[1]
+            def factory(h, **kw):
+                kw.update(kwargs)
+                return httplib.HTTPSConnection(h, None, **kw)
+            result = self._pooled_connection(host, h, eh, factory)
         return result
 
 
 class ServerProxy(xmlrpclib.ServerProxy):
     def __init__(self, uri, **kwargs):
         self.timeout = timeout = kwargs.pop('timeout', None)
-        # The above classes only come into play if a timeout
-        # is specified
-        if timeout is not None:
+        pool = kwargs.pop('pool', None)
+        # The above classes only come into play if a timeout or
+        # connection pool is specified
+        if timeout is not None or pool is not None:
             scheme, _ = splittype(uri)
             use_datetime = kwargs.get('use_datetime', 0)
             if scheme == 'https':
                 tcls = SafeTransport
             else:
                 tcls = Transport
-            kwargs['transport'] = t = tcls(timeout, use_datetime=use_datetime)
+            kwargs['transport'] = t = tcls(timeout, use_datetime=use_datetime,
+                                           pool=pool)
             self.transport = t
         xmlrpclib.ServerProxy.__init__(self, uri, **kwargs)
 
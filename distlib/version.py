@@ -152,6 +152,15 @@ class Matcher(object):
                 return False
         return True
 
+    @property
+    def constraints(self):
+        """
+        The constraints, as a tuple of (operator, version, prefix) tuples.
+        The version is a version instance, or a string if ``prefix`` is true
+        (for a constraint such as ``== 2.*``).
+        """
+        return self._parts
+
     @property
     def exact_version(self):
         result = None
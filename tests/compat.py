@@ -20,6 +20,7 @@ if _ver[0] < 3:
     from SimpleXMLRPCServer import SimpleXMLRPCServer
     from SimpleHTTPServer import SimpleHTTPRequestHandler
     from BaseHTTPServer import HTTPServer
+    from SocketServer import ThreadingMixIn
     text_type = unicode
     from urllib import unquote
     from urllib2 import Request
@@ -28,6 +29,7 @@ else:
     import queue
     from xmlrpc.server import SimpleXMLRPCServer
     from http.server import HTTPServer, SimpleHTTPRequestHandler
+    from socketserver import ThreadingMixIn
     text_type = str
     from urllib.parse import urlparse, unquote
     from urllib.request import Request
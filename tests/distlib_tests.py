@@ -26,3 +26,5 @@ if _ver == (2, 6):
     from test_sysconfig import TestSysConfig, MakefileTests
 from test_util import (UtilTestCase, ProgressTestCase, FileOpsTestCase,
                        GlobTestCase)
+if _ver >= (3, 5):
+    from test_aiolocators import AsyncLocatorTestCase
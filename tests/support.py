@@ -4,6 +4,9 @@
 # See LICENSE.txt and CONTRIBUTORS.txt.
 #
 import codecs
+import gzip
+import hashlib
+from io import BytesIO
 import os
 import logging
 import logging.handlers
@@ -13,10 +16,11 @@ import ssl
 import sys
 import tempfile
 import threading
+import time
 import weakref
 
 from compat import (unittest, HTTPServer as BaseHTTPServer,
-                    SimpleHTTPRequestHandler, urlparse)
+                    SimpleHTTPRequestHandler, urlparse, ThreadingMixIn)
 
 from distlib import logger
 
@@ -251,6 +255,242 @@ class HTTPSServerThread(threading.Thread):
     def stop(self):
         self.server.shutdown()
 
+class ThreadingHTTPServer(ThreadingMixIn, BaseHTTPServer):
+    daemon_threads = True
+
+class HTTPServerThread(threading.Thread):
+
+    def __init__(self, handler_class, threaded=False):
+        self.flag = None
+        if threaded:
+            server_class = ThreadingHTTPServer
+        else:
+            server_class = BaseHTTPServer
+        self.server = server_class(('localhost', 0), handler_class)
+        self.port = self.server.server_port
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+    def start(self, flag=None):
+        self.flag = flag
+        threading.Thread.start(self)
+
+    def run(self):
+        if self.flag:
+            self.flag.set()
+        try:
+            self.server.serve_forever(0.05)
+        finally:
+            self.server.server_close()
+
+    def stop(self):
+        self.server.shutdown()
+
+class IndexRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Serves canned pages for locator tests. Subclasses set ``pages`` to a
+    mapping of path to (content type, body) and get a list of (path, status)
+    tuples for the requests handled in ``requests``.
+    """
+    pages = {}
+    requests = None
+    # If set, responses are delayed by this many seconds, and the maximum
+    # number of requests in progress at any one time is recorded.
+    delay = None
+    in_progress = 0
+    max_in_progress = 0
+    lock = threading.Lock()
+    # If set, bodies are compressed using this Content-Encoding when the
+    # client accepts it. 'raw-deflate' sends deflate data without the zlib
+    # wrapper, as some servers do. The number of compressed responses sent
+    # is recorded.
+    content_encoding = None
+    compressed = 0
+    # The number of requests to answer with "503 Service Unavailable"
+    # before serving pages normally.
+    unavailable = 0
+    # Whether Range requests are supported, and the number of body bytes
+    # sent.
+    ranges = True
+    bytes_sent = 0
+
+    def do_GET(self):
+        if self.delay is None:
+            self.handle_get()
+        else:
+            cls = self.__class__
+            with cls.lock:
+                cls.in_progress += 1
+                cls.max_in_progress = max(cls.max_in_progress,
+                                          cls.in_progress)
+            try:
+                time.sleep(self.delay)
+                self.handle_get()
+            finally:
+                with cls.lock:
+                    cls.in_progress -= 1
+
+    def handle_get(self):
+        path = self.path.split('?', 1)[0]
+        cls = self.__class__
+        with cls.lock:
+            unavailable = cls.unavailable > 0
+            if unavailable:
+                cls.unavailable -= 1
+        if unavailable:
+            self.requests.append((path, 503))
+            self.send_error(503)
+            return
+        if path not in self.pages:
+            self.requests.append((path, 404))
+            self.send_error(404)
+            return
+        content_type, body = self.pages[path]
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self.requests.append((path, 304))
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        if self.ranges and self.headers.get('Range'):
+            self.send_range(path, content_type, body)
+            return
+        self.requests.append((path, 200))
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        encoding = self.content_encoding
+        if encoding == 'raw-deflate':
+            encoding = 'deflate'
+        if encoding and encoding in self.headers.get('Accept-Encoding', ''):
+            if encoding == 'gzip':
+                buf = BytesIO()
+                f = gzip.GzipFile(fileobj=buf, mode='wb')
+                f.write(body)
+                f.close()
+                body = buf.getvalue()
+            elif self.content_encoding == 'deflate':
+                body = zlib.compress(body)
+            else:
+                c = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+                body = c.compress(body) + c.flush()
+            self.send_header('Content-Encoding', encoding)
+            self.__class__.compressed += 1
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+        self.__class__.bytes_sent += len(body)
+
+    def send_range(self, path, content_type, body):
+        size = len(body)
+        start, end = self.headers['Range'].split('=', 1)[1].split('-')
+        if not start:
+            start = max(0, size - int(end))
+            end = size - 1
+        else:
+            start = int(start)
+            end = min(int(end or size - 1), size - 1)
+        body = body[start:end + 1]
+        self.requests.append((path, 206))
+        self.send_response(206)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end,
+                                                              size))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.__class__.bytes_sent += len(body)
+
+    def log_message(self, format, *args):
+        pass
+
+SIMPLE_PAGE = '''<html><body>
+<a href="../../packages/foo-1.0.tar.gz#md5=%s">foo-1.0.tar.gz</a>
+<a href="../../packages/foo-1.1.tar.gz">foo-1.1.tar.gz</a>
+</body></html>''' % ('0' * 32)
+
+class StreamingRequestHandler(IndexRequestHandler):
+    """
+    Serves ``data`` for any GET, sending the first half of it and then
+    waiting for ``event`` to be set (by the client, once it has processed
+    what it's read so far) before sending the rest. Whether the event was
+    set in time is appended to ``results``.
+    """
+    data = ''
+    event = None
+    results = None
+
+    def do_GET(self):
+        body = self.data.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        half = len(body) // 2
+        self.wfile.write(body[:half])
+        self.wfile.flush()
+        streamed = self.event.wait(5.0)
+        self.wfile.write(body[half:])
+        self.__class__.results.append(streamed)
+
+class IndexServerMixin(object):
+    """
+    TestCase-compatible mixin to start local servers for canned index pages,
+    which are stopped when the test is cleaned up.
+    """
+
+    def make_index_server(self, pages, delay=None):
+        """
+        Start a local server for the canned pages, and return the server
+        and the list its handler appends (path, status) tuples to. If a
+        delay is specified, the server handles requests concurrently and
+        its ``handler`` attribute records how many it handled at once.
+        """
+        requests = []
+        class handler(IndexRequestHandler):
+            pass
+
+        handler.pages = pages
+        handler.requests = requests
+        handler.delay = delay
+        server = HTTPServerThread(handler, threaded=delay is not None)
+        server.handler = handler
+        flag = threading.Event()
+        server.start(flag)
+        flag.wait()
+        def cleanup():
+            server.stop()
+            server.join()
+        self.addCleanup(cleanup)
+        return server, requests
+
+    def make_streaming_server(self, data, event):
+        """
+        Start a local server which streams ``data`` in two halves, waiting
+        for ``event`` to be set in between, and return the server and the
+        list of whether the event was set in time for each request.
+        """
+        results = []
+        class handler(StreamingRequestHandler):
+            pass
+
+        handler.data = data
+        handler.event = event
+        handler.results = results
+        server = HTTPServerThread(handler)
+        flag = threading.Event()
+        server.start(flag)
+        flag.wait()
+        def cleanup():
+            server.stop()
+            server.join()
+        self.addCleanup(cleanup)
+        return server, results
+
+
 try:
     import zlib
 except ImportError:
@@ -5,6 +5,7 @@
 # See LICENSE.txt and CONTRIBUTORS.txt.
 #
 import codecs
+import hashlib
 import json
 import logging
 import os
@@ -15,14 +16,14 @@ import sys
 import tempfile
 import threading
 
-from compat import unittest, Request
-from support import HTTPSServerThread
+from compat import unittest, Request, SimpleHTTPRequestHandler
+from support import HTTPSServerThread, HTTPServerThread
 
 from distlib import DistlibException
 from distlib.compat import urlopen, HTTPError, URLError
 from distlib.index import PackageIndex
 from distlib.metadata import Metadata, MetadataMissingError, METADATA_FILENAME
-from distlib.util import zip_dir, HTTPSHandler
+from distlib.util import zip_dir, HTTPSHandler, HostScheduler
 
 logger = logging.getLogger(__name__)
 
@@ -286,5 +287,50 @@ class PackageIndexTestCase(unittest.TestCase):
         self.assertRaises(DistlibException, self.index.download_file, url, fn,
                           digest[:-1] + '8')
 
+    def test_download_retry(self):
+        data = b'0123456789' * 1000
+        digest = hashlib.md5(data).hexdigest()
+        requests = []
+        unavailable = [2]   # the number of requests to fail
+
+        class Handler(SimpleHTTPRequestHandler):
+            def do_GET(self):
+                requests.append(self.path)
+                if unavailable[0] > 0:
+                    unavailable[0] -= 1
+                    self.send_error(503)
+                else:
+                    self.send_response(200)
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServerThread(Handler)
+        server.start()
+        self.addCleanup(server.stop)
+        url = 'http://localhost:%d/foo-1.0.tar.gz' % server.port
+        fd, fn = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, fn)
+        scheduler = HostScheduler(backoff=0.01, failure_threshold=1,
+                                  cooldown=60)
+        index = PackageIndex(self.test_server_url, scheduler=scheduler)
+        index.download_file(url, fn, digest)
+        self.assertEqual(len(requests), 3)
+        with open(fn, 'rb') as f:
+            self.assertEqual(data, f.read())
+        # After too many failures, the host isn't used
+        del requests[:]
+        unavailable[0] = 3
+        self.assertRaises(HTTPError, index.download_file, url, fn, digest)
+        self.assertEqual(len(requests), 3)
+        self.assertRaises(DistlibException, index.download_file, url, fn,
+                          digest)
+        self.assertEqual(len(requests), 3)
+        index.close()
+
 if __name__ == '__main__':  # pragma: no cover
     unittest.main()
@@ -5,19 +5,35 @@
 # See LICENSE.txt and CONTRIBUTORS.txt.
 #
 from __future__ import unicode_literals
+from io import BytesIO
+import json
 import os
+import shutil
 import sys
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
 
-from compat import unittest
+from compat import unittest, SimpleXMLRPCServer, ThreadingMixIn
+from support import IndexServerMixin, SIMPLE_PAGE
 
-from distlib.compat import url2pathname, urlparse, urljoin
+from distlib.compat import url2pathname, urlparse, urljoin, HTTPError
 from distlib.database import DistributionPath, make_graph, make_dist
-from distlib.locators import (SimpleScrapingLocator, PyPIRPCLocator,
+from distlib import DistlibException
+from distlib.locators import (Locator, SimpleScrapingLocator, PyPIRPCLocator,
+                              MetadataFetcher,
                               PyPIJSONLocator, DirectoryLocator,
                               DistPathLocator, AggregatingLocator,
-                              JSONLocator, DistPathLocator,
+                              JSONLocator, DistPathLocator, PageCache,
+                              ResultStore, SnapshotLocator, build_snapshot,
+                              PartialResult, ResolutionCache, save_lock,
+                              load_lock, verify_lock,
+                              Page, LinkExtractor,
                               DependencyFinder, locate,
                               get_all_distribution_names, default_locator)
+from distlib.util import HostScheduler, LRUCache
 
 HERE = os.path.abspath(os.path.dirname(__file__))
 
@@ -25,7 +41,926 @@ PYPI_RPC_HOST = 'http://python.org/pypi'
 
 PYPI_WEB_HOST = os.environ.get('PYPI_WEB_HOST', 'https://pypi.python.org/simple/')
 
-class LocatorTestCase(unittest.TestCase):
+class LocatorTestCase(IndexServerMixin, unittest.TestCase):
+
+    def test_persistent_page_cache(self):
+        pages = {'/simple/foo/': ('text/html', SIMPLE_PAGE)}
+        server, requests = self.make_index_server(pages)
+        url = 'http://localhost:%d/simple/' % server.port
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        cache = PageCache(cache_dir)
+        for i in range(2):
+            # a new locator each time, so there's no in-memory caching
+            locator = SimpleScrapingLocator(url, timeout=5.0,
+                                            page_cache=cache)
+            result = locator.get_project('foo')
+            self.assertEqual(set(result), set(['1.0', '1.1']))
+            self.assertEqual(result['1.0'].digest, ('md5', '0' * 32))
+        self.assertEqual(requests, [('/simple/foo/', 200),
+                                    ('/simple/foo/', 304)])
+        entry = cache.get(url + 'foo/')
+        self.assertEqual(entry['final_url'], url + 'foo/')
+        self.assertTrue(entry['etag'])
+        # A changed page is fetched again and the cache entry updated
+        pages['/simple/foo/'] = ('text/html',
+                                 SIMPLE_PAGE.replace('1.1', '1.2'))
+        locator = SimpleScrapingLocator(url, timeout=5.0, page_cache=cache)
+        result = locator.get_project('foo')
+        self.assertEqual(set(result), set(['1.0', '1.2']))
+        self.assertEqual(requests[-1], ('/simple/foo/', 200))
+        self.assertNotEqual(cache.get(url + 'foo/')['etag'], entry['etag'])
+        # The root page is revalidated too when getting names
+        pages['/simple/'] = ('text/html', '<a href="foo/">foo</a>')
+        for i in range(2):
+            locator = SimpleScrapingLocator(url, timeout=5.0,
+                                            page_cache=cache)
+            self.assertEqual(locator.get_distribution_names(), set(['foo']))
+        self.assertEqual(requests[-2:], [('/simple/', 200),
+                                         ('/simple/', 304)])
+        self.assertEqual(cache.clear(), [])
+        self.assertIsNone(cache.get(url + 'foo/'))
+
+    def test_compressed_pages(self):
+        data = SIMPLE_PAGE + '<!-- %s -->' % ('padding ' * 10000)
+        pages = {'/simple/foo/': ('text/html', data)}
+        server, requests = self.make_index_server(pages)
+        url = 'http://localhost:%d/simple/' % server.port
+        for encoding in ('gzip', 'deflate', 'raw-deflate'):
+            server.handler.content_encoding = encoding
+            locator = SimpleScrapingLocator(url, timeout=5.0)
+            locator.blocksize = 64  # so the body is decoded in pieces
+            result = locator.get_project('foo')
+            self.assertEqual(set(result), set(['1.0', '1.1']))
+            self.assertEqual(locator.get_page(url + 'foo/').data, data)
+            locator.close()
+        self.assertEqual(server.handler.compressed, 3)
+
+    def test_decode_text(self):
+        locator = SimpleScrapingLocator('http://localhost/simple/')
+        blocks = [b'ab\xc3', b'\xa9cd\xc3', b'\xa9\xff', b'ef']
+        text = ''.join(locator._decode_text(iter(blocks), 'utf-8'))
+        # once the text can't be decoded, what hasn't been yielded yet is
+        # decoded as Latin-1, including the bytes held back by the decoder
+        self.assertEqual(text, 'ab\xe9cd\xc3\xa9\xffef')
+        text = ''.join(locator._decode_text(iter(blocks), 'unknown'))
+        self.assertEqual(text, b''.join(blocks).decode('latin-1'))
+
+    def test_streaming_links(self):
+        links = ''.join(['<a href="../../packages/foo-1.%d.tar.gz">x</a>\n' % i
+                         for i in range(50)])
+        data = ('<html><head><base href="http://example.com/a/b/"></head>'
+                '<body>%s<a rel="homepage" href=\'http://example.com/\'>h</a>'
+                '</body></html>' % links)
+        expected = Page(data, 'http://localhost/simple/foo/').links
+        self.assertIn(('http://example.com/packages/foo-1.49.tar.gz', ''),
+                      expected)
+        for size in (1, 7, 100):
+            extractor = LinkExtractor('http://localhost/simple/foo/')
+            result = []
+            for i in range(0, len(data), size):
+                result.extend(extractor.feed(data[i:i + size]))
+            result.extend(extractor.close())
+            self.assertEqual(sorted(result, reverse=True), expected)
+
+        # Links are processed while the page is still being read
+        first_link = threading.Event()
+        server, results = self.make_streaming_server(data, first_link)
+        url = 'http://localhost:%d/simple/' % server.port
+        seen = []
+        def callback(link, rel):
+            seen.append((link, rel))
+            first_link.set()
+        with SimpleScrapingLocator(url, timeout=5.0) as locator:
+            locator.blocksize = 256
+            page = locator.get_page(url + 'foo/', callback)
+        self.assertEqual(results, [True])
+        self.assertEqual(page.links, expected)
+        self.assertEqual(sorted(seen, reverse=True), expected)
+
+    def test_streaming_names(self):
+        names = ['Project-%d' % i for i in range(200)]
+        data = ('<html><body>%s</body></html>' %
+                ''.join(['<a href="%s/">%s</a>\n' % (name.lower(), name)
+                         for name in names]))
+        for size in (1, 7, 100):
+            locator = SimpleScrapingLocator('http://localhost/simple/')
+            pieces = [data[i:i + size] for i in range(0, len(data), size)]
+            self.assertEqual(list(locator._iter_names(pieces)), names)
+
+        # Names are yielded while the page is still being read, and the page
+        # isn't kept
+        first_name = threading.Event()
+        server, results = self.make_streaming_server(data, first_name)
+        url = 'http://localhost:%d/simple/' % server.port
+        with SimpleScrapingLocator(url, timeout=5.0) as locator:
+            locator.blocksize = 256
+            result = []
+            for name in locator.iter_distribution_names():
+                result.append(name)
+                first_name.set()
+            self.assertEqual(result, names)
+            self.assertEqual(results, [True])
+            self.assertEqual(len(locator._page_cache), 0)
+            self.assertEqual(locator.get_distribution_names(), set(names))
+
+        # Names from aggregated locators are merged lazily
+        class NamesLocator(Locator):
+            def __init__(self, names):
+                super(NamesLocator, self).__init__()
+                self.names = names
+                self.got = []
+
+            def iter_distribution_names(self):
+                for name in self.names:
+                    self.got.append(name)
+                    yield name
+
+        loc1 = NamesLocator(['foo', 'bar'])
+        loc2 = NamesLocator(['bar', 'baz', 'quux'])
+        locator = AggregatingLocator(loc1, Locator(), loc2)
+        it = locator.iter_distribution_names()
+        self.assertEqual(next(it), 'foo')
+        self.assertEqual((loc1.got, loc2.got), (['foo'], []))
+        self.assertEqual(list(it), ['bar', 'baz', 'quux'])
+        self.assertEqual(locator.get_distribution_names(),
+                         set(['foo', 'bar', 'baz', 'quux']))
+
+    def test_stop_on_match(self):
+        pages = {}
+        server, requests = self.make_index_server(pages)
+        # Use an address other than localhost, as links to localhost are
+        # never followed.
+        home = 'http://127.0.0.1:%d/home/' % server.port
+        pages['/simple/foo/'] = ('text/html', SIMPLE_PAGE.replace('</body>',
+                                 '<a rel="homepage" href="%s">home</a></body>'
+                                 % home))
+        pages['/home/'] = ('text/html', '<a href="foo-2.0.tar.gz">2.0</a>')
+        url = 'http://localhost:%d/simple/' % server.port
+        with SimpleScrapingLocator(url, timeout=5.0) as locator:
+            dist = locator.locate('foo (== 1.0)')
+            self.assertEqual(dist.version, '1.0')
+            self.assertEqual(requests[-1], ('/home/', 200))
+        del requests[:]
+        with SimpleScrapingLocator(url, timeout=5.0,
+                                   stop_on_match=True) as locator:
+            dist = locator.locate('foo (== 1.0)')
+            self.assertEqual(dist.version, '1.0')
+            self.assertEqual(requests, [('/simple/foo/', 200)])
+            # The result may be incomplete, so it isn't cached
+            dist = locator.locate('foo (>= 1.1)')
+            self.assertEqual(dist.version, '2.0')
+            self.assertEqual(len(requests), 3)
+            self.assertEqual(set(locator.get_project('foo')),
+                             set(['1.0', '1.1', '2.0']))
+            self.assertEqual(len(requests), 3)
+
+    def test_external_deadline(self):
+        pages = {}
+        server, requests = self.make_index_server(pages)
+        # a slow external host
+        home_pages = {'/home/': ('text/html',
+                                 '<a href="foo-2.0.tar.gz">2.0</a>')}
+        home_server, home_requests = self.make_index_server(home_pages,
+                                                            delay=1.0)
+        home = 'http://127.0.0.1:%d/home/' % home_server.port
+        pages['/simple/foo/'] = ('text/html', SIMPLE_PAGE.replace('</body>',
+                                 '<a rel="homepage" href="%s">home</a></body>'
+                                 % home))
+        url = 'http://localhost:%d/simple/' % server.port
+        with SimpleScrapingLocator(url, timeout=5.0) as locator:
+            result = locator.get_project('foo')
+            self.assertEqual(set(result), set(['1.0', '1.1', '2.0']))
+            self.assertNotIsInstance(result, PartialResult)
+        with SimpleScrapingLocator(url, timeout=5.0,
+                                   external_deadline=0.2) as locator:
+            start = time.time()
+            result = locator.get_project('foo')
+            self.assertLess(time.time() - start, 0.9)
+            self.assertIsInstance(result, PartialResult)
+            self.assertEqual(set(result), set(['1.0', '1.1']))
+            # partial results aren't cached
+            self.assertNotIn('foo', locator.cache)
+            # and are partial when aggregated, too
+            aggregator = AggregatingLocator(locator, merge=True)
+            self.assertIsInstance(aggregator.get_project('foo'),
+                                  PartialResult)
+            self.assertNotIn('foo', aggregator.cache)
+            # projects without external pages aren't affected
+            requests_before = len(requests)
+            pages['/simple/bar/'] = ('text/html', SIMPLE_PAGE.replace('foo',
+                                                                      'bar'))
+            result = locator.get_project('bar')
+            self.assertNotIsInstance(result, PartialResult)
+            self.assertEqual(set(result), set(['1.0', '1.1']))
+            self.assertEqual(len(requests), requests_before + 1)
+
+    def test_external_deadline_timeout(self):
+        # once the deadline has passed, a slow index's own pages are only
+        # waited for until the timeout
+        pages = {}
+        server, requests = self.make_index_server(pages, delay=0.4)
+        base = 'http://127.0.0.1:%d' % server.port
+        links = []
+        for i in range(3):
+            path = '/home/foo/%d/' % i
+            pages[path] = ('text/html',
+                           '<a href="foo-2.%d.tar.gz">2.%d</a>' % (i, i))
+            links.append('<a rel="homepage" href="%s%s">home</a>' %
+                         (base, path))
+        pages['/simple/foo/'] = ('text/html', SIMPLE_PAGE.replace('</body>',
+                                 '%s</body>' % ''.join(links)))
+        url = '%s/simple/' % base
+        with SimpleScrapingLocator(url, timeout=0.6, num_workers=1,
+                                   external_deadline=0.1) as locator:
+            start = time.time()
+            result = locator.get_project('foo')
+            self.assertLess(time.time() - start, 1.2)
+            self.assertIsInstance(result, PartialResult)
+            self.assertTrue(set(['1.0', '1.1']) <= set(result))
+            self.assertNotIn('foo', locator.cache)
+
+    def test_scheduler(self):
+        pages = {'/simple/foo/': ('text/html', SIMPLE_PAGE)}
+        server, requests = self.make_index_server(pages)
+        url = 'http://localhost:%d/simple/' % server.port
+        scheduler = HostScheduler(backoff=0.01, failure_threshold=2,
+                                  cooldown=0.5)
+        # transient errors are retried
+        server.handler.unavailable = 2
+        locator = SimpleScrapingLocator(url, timeout=5.0,
+                                        scheduler=scheduler)
+        self.assertEqual(set(locator.get_project('foo')), set(['1.0', '1.1']))
+        self.assertEqual(requests, [('/simple/foo/', 503)] * 2 +
+                                   [('/simple/foo/', 200)])
+        # Once the retries are exhausted often enough, the host isn't used
+        # until the circuit half-opens
+        del requests[:]
+        server.handler.unavailable = 6
+        for i in range(3):
+            locator = SimpleScrapingLocator(url, timeout=5.0,
+                                            scheduler=scheduler)
+            self.assertEqual(locator.get_project('foo'), {})
+        self.assertEqual(len(requests), 6)
+        self.assertRaises(DistlibException, locator.get_distribution_names)
+        self.assertEqual(len(requests), 6)
+        time.sleep(0.6)
+        locator = SimpleScrapingLocator(url, timeout=5.0,
+                                        scheduler=scheduler)
+        self.assertEqual(set(locator.get_project('foo')), set(['1.0', '1.1']))
+        self.assertEqual(requests[-1], ('/simple/foo/', 200))
+
+        # error responses are closed, so their connections can be reused
+        class ClosingOpener(object):
+            # records the error responses which are closed
+            def __init__(self, opener):
+                self.opener = opener
+                self.errors = []
+                self.closed = []
+
+            def open(self, *args, **kwargs):
+                try:
+                    return self.opener.open(*args, **kwargs)
+                except HTTPError as e:
+                    code, close = e.code, e.close
+                    def recording_close():
+                        self.closed.append(code)
+                        close()
+                    e.close = recording_close
+                    self.errors.append(e.code)
+                    raise
+
+        server.handler.unavailable = 1
+        locator = SimpleScrapingLocator(url, timeout=5.0,
+                                        scheduler=scheduler)
+        locator.opener = opener = ClosingOpener(locator.opener)
+        self.assertEqual(set(locator.get_project('foo')), set(['1.0', '1.1']))
+        self.assertEqual(locator.get_project('bar'), {})
+        self.assertEqual(opener.errors, [503, 404])
+        self.assertEqual(opener.closed, opener.errors)
+
+    def test_worker_pool_reuse(self):
+        pages = {}
+        names = ['proj%d' % i for i in range(8)]
+        for name in names:
+            pages['/simple/%s/' % name] = ('text/html',
+                                           SIMPLE_PAGE.replace('foo', name))
+        server, requests = self.make_index_server(pages)
+        url = 'http://localhost:%d/simple/' % server.port
+        before = threading.active_count()
+        with SimpleScrapingLocator(url, timeout=5.0,
+                                   num_workers=4) as locator:
+            results = {}
+            def get(name):
+                results[name] = locator.get_project(name)
+            threads = [threading.Thread(target=get, args=(name,))
+                       for name in names]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            for name in names:
+                self.assertEqual(set(results[name]), set(['1.0', '1.1']))
+                self.assertEqual(results[name]['1.0'].name, name)
+            # the pool is shared, not recreated for each project
+            self.assertEqual(threading.active_count(), before + 4)
+            self.assertEqual(set(locator.get_project('unknown')), set())
+            self.assertEqual(threading.active_count(), before + 4)
+        self.assertEqual(threading.active_count(), before)
+
+    def test_locate_many(self):
+        pages = {}
+        names = ['proj%d' % i for i in range(8)]
+        for name in names:
+            pages['/simple/%s/' % name] = ('text/html',
+                                           SIMPLE_PAGE.replace('foo', name))
+            pages['/pypi/%s/json' % name] = ('application/json', json.dumps({
+                'info': {'name': name, 'version': '1.1', 'summary': name},
+                'urls': [{'url': 'http://example.com/%s-1.1.tar.gz' % name,
+                          'md5_digest': '1' * 32}],
+            }))
+        server, requests = self.make_index_server(pages, delay=0.1)
+        reqts = ['proj%d (< 1.1)' % i for i in range(4)]
+        reqts += names[4:] + ['unknown']
+        expected = {}
+        for r in reqts:
+            expected[r] = None
+            if r != 'unknown':
+                name = r.split()[0]
+                if r == name:
+                    expected[r] = '%s (1.1)' % name
+                else:
+                    expected[r] = '%s (1.0)' % name
+        url = 'http://localhost:%d/simple/' % server.port
+        with SimpleScrapingLocator(url, timeout=5.0) as locator:
+            result = locator.locate_many(reqts)
+            actual = dict((k, v and v.name_and_version)
+                          for k, v in result.items())
+            self.assertEqual(actual, expected)
+            # all the projects were got concurrently
+            self.assertGreater(server.handler.max_in_progress, 1)
+            self.assertEqual(len(requests), len(names) + 1)
+            # and cached
+            result = locator.get_projects(names)
+            self.assertEqual(sorted(result), names)
+            self.assertEqual(len(requests), len(names) + 1)
+
+        class Fetcher(object):
+            # records the threads metadata is got in
+            def __init__(self):
+                self.threads = []
+
+            def update(self, dist, scheme):
+                self.threads.append(threading.current_thread())
+                time.sleep(0.05)
+
+        fetcher = Fetcher()
+        with SimpleScrapingLocator(url, timeout=5.0,
+                                   fetch_metadata=fetcher) as locator:
+            result = locator.locate_many(reqts)
+            self.assertEqual(result['proj0 (< 1.1)'].name_and_version,
+                             'proj0 (1.0)')
+            # the metadata was got once for each distribution, concurrently
+            self.assertEqual(len(fetcher.threads), len(names))
+            self.assertGreater(len(set(fetcher.threads)), 1)
+            self.assertNotIn(threading.current_thread(), fetcher.threads)
+        del requests[:]
+        server.handler.max_in_progress = 0
+        url = 'http://localhost:%d/pypi/' % server.port
+        with PyPIJSONLocator(url) as locator:
+            result = locator.get_projects(names)
+            self.assertEqual(sorted(result), names)
+            for name in names:
+                self.assertEqual(list(result[name]), ['1.1'])
+            self.assertGreater(server.handler.max_in_progress, 1)
+            result = locator.locate_many(['proj0', 'proj1 (< 1.1)'])
+            self.assertEqual(result['proj0'].name_and_version, 'proj0 (1.1)')
+            self.assertIsNone(result['proj1 (< 1.1)'])
+        # When aggregating serially, projects not found by one locator are
+        # got together from the next one.
+        del requests[:]
+        d = os.path.join(HERE, 'fake_archives')
+        url = 'http://localhost:%d/simple/' % server.port
+        with AggregatingLocator(DirectoryLocator(d),
+                                SimpleScrapingLocator(url, timeout=5.0),
+                                scheme='legacy', parallel=False) as locator:
+            result = locator.locate_many(['Flask', 'coverage (> 10.0)',
+                                          'proj0', 'proj1'])
+            self.assertTrue(result['Flask'].source_url.startswith('file:'))
+            self.assertIsNone(result['coverage (> 10.0)'])
+            self.assertEqual(result['proj0'].name_and_version, 'proj0 (1.1)')
+            self.assertEqual(result['proj1'].name_and_version, 'proj1 (1.1)')
+            self.assertEqual(sorted(requests),
+                             [('/simple/coverage/', 404),
+                              ('/simple/proj0/', 200),
+                              ('/simple/proj1/', 200)])
+
+    def test_cache_policy(self):
+        pages = {'/simple/foo/': ('text/html', SIMPLE_PAGE)}
+        server, requests = self.make_index_server(pages)
+        url = 'http://localhost:%d/simple/' % server.port
+        cache = LRUCache(max_entries=10, ttl=60, negative_ttl=0.1)
+        memory_cache = LRUCache(max_bytes=1024 * 1024, ttl=60,
+                                negative_ttl=0.1)
+        with SimpleScrapingLocator(url, timeout=5.0, cache=cache,
+                                   memory_cache=memory_cache) as locator:
+            self.assertIs(locator.cache, cache)
+            self.assertEqual(sorted(locator.get_project('foo')),
+                             ['1.0', '1.1'])
+            self.assertEqual(locator.get_project('bar'), {})
+            self.assertEqual(len(requests), 2)
+            self.assertGreater(memory_cache.stats['bytes'],
+                               len(SIMPLE_PAGE))
+            locator.get_project('foo')
+            locator.get_project('bar')
+            self.assertEqual(len(requests), 2)
+            self.assertEqual(cache.stats['hits'], 2)
+            # the negative result expires first, and its page is got again
+            time.sleep(0.2)
+            locator.get_project('bar')
+            self.assertEqual(len(requests), 3)
+            self.assertEqual(requests[-1], ('/simple/bar/', 404))
+            # pages are kept between projects: foo's page is reused
+            del cache['foo']
+            locator.get_project('foo')
+            self.assertEqual(len(requests), 3)
+            locator.clear_cache()
+            self.assertEqual(len(memory_cache), 0)
+            locator.get_project('foo')
+            self.assertEqual(len(requests), 4)
+
+    def test_result_store(self):
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        path = os.path.join(d, 'results.db')
+        pages = {'/simple/foo/': ('text/html', SIMPLE_PAGE)}
+        server, requests = self.make_index_server(pages)
+        url = 'http://localhost:%d/simple/' % server.port
+        store = ResultStore(path)
+        with SimpleScrapingLocator(url, timeout=5.0, store=store) as locator:
+            expected = locator.get_project('foo')
+            self.assertEqual(locator.get_project('bar'), {})
+        self.assertEqual(len(requests), 2)
+        # Another locator (as if in another process) uses the stored results
+        with SimpleScrapingLocator(url, timeout=5.0,
+                                   store=ResultStore(path)) as locator:
+            actual = locator.get_project('foo')
+            self.assertEqual(locator.get_project('bar'), {})
+        self.assertEqual(len(requests), 2)
+        self.assertEqual(sorted(actual), ['1.0', '1.1'])
+        for version, dist in actual.items():
+            other = expected[version]
+            self.assertIs(dist.locator, locator)
+            self.assertEqual(dist.name_and_version, other.name_and_version)
+            self.assertEqual(dist.source_url, other.source_url)
+            self.assertEqual(dist.digest, other.digest)
+        self.assertEqual(actual['1.0'].digest, ('md5', '0' * 32))
+        # results from elsewhere aren't shared
+        url = 'http://127.0.0.1:%d/simple/' % server.port
+        with SimpleScrapingLocator(url, timeout=5.0, store=store) as locator:
+            locator.get_project('foo')
+        self.assertEqual(len(requests), 3)
+
+        # what JSONLocator produces round-trips
+        dist = make_dist('Foo', '0.1', summary='Foo summary')
+        dist.metadata.source_url = 'http://example.com/Foo-0.1.tar.gz'
+        dist.digest = ('md5', '1' * 32)
+        dist.metadata.dependencies = {
+            'run_requires': [{'requires': ['bar (>= 1.0)']}],
+            'extras': ['tests'],
+        }
+        dist.exports = {'console_scripts': {'foo': 'foo:main'}}
+        store.put('key', 'Foo', {'0.1': dist})
+        result = store.get('key', 'Foo')
+        self.assertEqual(list(result), ['0.1'])
+        actual = result['0.1']
+        self.assertEqual(actual.name_and_version, 'Foo (0.1)')
+        self.assertEqual(actual.metadata.summary, 'Foo summary')
+        self.assertEqual(actual.source_url, dist.source_url)
+        self.assertEqual(actual.digest, dist.digest)
+        self.assertEqual(actual.run_requires, set(['bar (>= 1.0)']))
+        self.assertEqual(actual.metadata.dependencies,
+                         dist.metadata.dependencies)
+        self.assertEqual(actual.exports, dist.exports)
+        self.assertIsNone(store.get('other key', 'Foo'))
+
+        # concurrent readers and writers, each with their own store
+        errors = []
+        def worker(n):
+            try:
+                s = ResultStore(path)
+                for i in range(20):
+                    s.put('key', 'Foo%d' % n, {'0.1': dist})
+                    self.assertIn('0.1', s.get('key', 'Foo'))
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=worker, args=(i,))
+                   for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        for i in range(4):
+            self.assertIsNotNone(store.get('key', 'Foo%d' % i))
+
+        # stored results expire
+        store = ResultStore(path, ttl=0.1)
+        time.sleep(0.15)
+        self.assertIsNone(store.get('key', 'Foo'))
+        store.clear()
+        self.assertIsNone(ResultStore(path).get('key', 'Foo'))
+
+    def test_snapshot(self):
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        dist = make_dist('Foo', '0.1', summary='Foo summary')
+        dist.metadata.source_url = 'http://example.com/Foo-0.1.tar.gz'
+        dist.digest = ('sha256', '1' * 64)
+        dist.metadata.dependencies = {
+            'run_requires': [{'requires': ['bar (>= 1.0)']}],
+            'extras': ['tests'],
+        }
+        dist.exports = {'console_scripts': {'foo': 'foo:main'}}
+        wheel = make_dist('Foo', '0.2', summary='Newer summary')
+        wheel.metadata.source_url = ('http://example.com/'
+                                     'Foo-0.2-py2.py3-none-any.whl')
+        bar = make_dist('bar', '1.0')
+        bar.metadata.source_url = 'http://example.com/bar-1.0.zip'
+        projects = {
+            'Foo': {'0.1': dist, '0.2': wheel},
+            'bar': {'1.0': bar},
+            'baz': {},
+        }
+        calls = []
+
+        class FakeLocator(Locator):
+            def get_distribution_names(self):
+                return set(projects)
+
+            def get_projects(self, names):
+                calls.append(names)
+                return dict((n, projects[n]) for n in names)
+
+        source = FakeLocator()
+        path = os.path.join(d, 'snapshot')
+        self.assertEqual(build_snapshot(source, path, batch_size=2), 2)
+        self.assertEqual(calls, [['bar', 'baz'], ['Foo']])
+        with open(path, 'rb') as f:
+            data = f.read()
+        # snapshots are deterministic
+        other = os.path.join(d, 'other')
+        build_snapshot(source, other, names=['Foo', 'FOO', 'baz', 'bar'])
+        with open(other, 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+        with SnapshotLocator(path) as locator:
+            self.assertEqual(locator.get_distribution_names(),
+                             set(['Foo', 'bar']))
+            self.assertEqual(locator.get_project('baz'), {})
+            self.assertEqual(locator.get_project('quux'), {})
+            result = locator.get_project('foo')
+            self.assertEqual(sorted(result), ['0.1', '0.2'])
+            actual = result['0.1']
+            self.assertIs(actual.locator, locator)
+            self.assertEqual(actual.name_and_version, 'Foo (0.1)')
+            self.assertEqual(actual.metadata.summary, 'Newer summary')
+            self.assertEqual(actual.source_url, dist.source_url)
+            self.assertEqual(actual.digest, dist.digest)
+            self.assertEqual(actual.run_requires, set(['bar (>= 1.0)']))
+            self.assertEqual(actual.metadata.dependencies['extras'],
+                             ['tests'])
+            self.assertEqual(actual.exports, dist.exports)
+            self.assertEqual(result['0.2'].source_url, wheel.source_url)
+            self.assertIsNone(result['0.2'].digest)
+            dist = locator.locate('bar (>= 1.0)')
+            self.assertEqual(dist.source_url, bar.source_url)
+            self.assertEqual(locator.get_project('BAR')['1.0'].source_url,
+                             bar.source_url)
+
+        # a snapshot of what a real locator finds
+        source = DirectoryLocator(os.path.join(HERE, 'fake_archives'))
+        build_snapshot(source, path)
+        with SnapshotLocator(path) as locator:
+            self.assertEqual(locator.get_distribution_names(),
+                             source.get_distribution_names())
+            for name in source.get_distribution_names():
+                expected = source.get_project(name)
+                actual = locator.get_project(name)
+                self.assertEqual(sorted(actual), sorted(expected))
+                for version, dist in actual.items():
+                    self.assertEqual(dist.source_url,
+                                     expected[version].source_url)
+                    self.assertEqual(dist.digest, expected[version].digest)
+
+        with open(path, 'wb') as f:
+            f.write(data[:-1])
+        self.assertRaises(DistlibException, SnapshotLocator, path)
+
+    def test_json_releases(self):
+        def release(version, requires_dist=None):
+            return {
+                'info': {'name': 'foo', 'version': version,
+                         'summary': 'Foo %s' % version,
+                         'requires_dist': requires_dist},
+                'urls': [{'url': 'http://example.com/foo-%s.tar.gz' % version,
+                          'md5_digest': '%032d' % len(version)}],
+            }
+
+        project = release('1.2', ['bar (>= 1.0)'])
+        project['releases'] = {'1.0': [{}], '1.1': [{}], '1.2': [{}],
+                               '2.0.dev1': []}    # no files
+        pages = {'/pypi/foo/json': ('application/json', json.dumps(project))}
+        pages['/pypi/foo/1.0/json'] = ('application/json', json.dumps(
+            release('1.0', ['quux; sys_platform == "win32"'])))
+        pages['/pypi/foo/1.1/json'] = ('application/json', json.dumps(
+            release('1.1', ['bar', 'baz; extra == "tests"'])))
+        server, requests = self.make_index_server(pages, delay=0.1)
+        url = 'http://localhost:%d/pypi/' % server.port
+        with PyPIJSONLocator(url) as locator:
+            self.assertEqual(list(locator.get_project('foo')), ['1.2'])
+            self.assertIsNone(locator.locate('foo (< 1.2)'))
+        del requests[:]
+        with PyPIJSONLocator(url, all_versions=True) as locator:
+            result = locator.get_project('foo')
+            self.assertEqual(sorted(result), ['1.0', '1.1', '1.2'])
+            self.assertEqual(len(requests), 3)
+            self.assertGreater(server.handler.max_in_progress, 1)
+            self.assertEqual(result['1.2'].run_requires,
+                             set(['bar (>= 1.0)']))
+            dist = result['1.1']
+            self.assertEqual(dist.source_url,
+                             'http://example.com/foo-1.1.tar.gz')
+            self.assertEqual(dist.digest, ('md5', '%032d' % 3))
+            self.assertEqual(dist.run_requires, set(['bar']))
+            self.assertEqual(dist.metadata.dependencies['extras'], ['tests'])
+            dist.extras = ['tests']
+            self.assertEqual(dist.run_requires, set(['bar', 'baz']))
+            self.assertEqual(result['1.0'].metadata.dependencies,
+                             {'run_requires': [
+                                {'requires': ['quux'],
+                                 'environment': 'sys_platform == "win32"'}]})
+            # When locating, only the releases which could match are fetched
+            del requests[:]
+            locator.clear_cache()
+            dist = locator.locate('foo (< 1.1)')
+            self.assertEqual(dist.name_and_version, 'foo (1.0)')
+            self.assertEqual(sorted(requests), [('/pypi/foo/1.0/json', 200),
+                                                ('/pypi/foo/json', 200)])
+            # and the incomplete result isn't cached
+            self.assertEqual(len(locator.get_project('foo')), 3)
+
+    def test_wheel_metadata(self):
+        def make_wheel(name, requires):
+            buf = BytesIO()
+            with zipfile.ZipFile(buf, 'w') as zf:
+                metadata = ('Metadata-Version: 1.2\nName: %s\n'
+                            'Version: 1.0\n%s' % (name, ''.join(
+                                ['Requires-Dist: %s\n' % r
+                                 for r in requires])))
+                zf.writestr('%s-1.0.dist-info/METADATA' % name,
+                            metadata.encode('utf-8'))
+                # plenty of incompressible data
+                zf.writestr('%s/data.bin' % name, os.urandom(500000))
+                zf.writestr('%s-1.0.dist-info/WHEEL' % name,
+                            b'Wheel-Version: 1.0\n')
+            return buf.getvalue()
+
+        wheel = make_wheel('foo', ['bar (>= 1.0)'])
+        pages = {
+            '/simple/foo/': ('text/html', '<a href="../../packages/'
+                             'foo-1.0-py2.py3-none-any.whl">foo</a>'),
+            '/simple/bar/': ('text/html', '<a href="../../packages/'
+                             'bar-1.0-py2.py3-none-any.whl">bar</a>'),
+            '/packages/foo-1.0-py2.py3-none-any.whl': (
+                'application/octet-stream', wheel),
+            '/packages/bar-1.0-py2.py3-none-any.whl': (
+                'application/octet-stream', make_wheel('bar', [])),
+        }
+        server, requests = self.make_index_server(pages)
+        url = 'http://localhost:%d/simple/' % server.port
+        with SimpleScrapingLocator(url, timeout=5.0, scheme='legacy',
+                                   fetch_metadata=True) as locator:
+            dist = locator.locate('foo')
+            self.assertEqual(dist.run_requires, set(['bar (>= 1.0)']))
+            self.assertEqual(dist.source_url, 'http://localhost:%d/packages/'
+                             'foo-1.0-py2.py3-none-any.whl' % server.port)
+            # the end of the wheel, then its metadata
+            self.assertEqual(requests[-2:], [
+                ('/packages/foo-1.0-py2.py3-none-any.whl', 206),
+                ('/packages/foo-1.0-py2.py3-none-any.whl', 206)])
+            self.assertLess(server.handler.bytes_sent, len(wheel) / 4)
+            # the metadata is only got once
+            n = len(requests)
+            locator.locate('foo (>= 1.0)')
+            self.assertEqual(len(requests), n)
+            finder = DependencyFinder(locator)
+            dists, problems = finder.find('foo')
+            self.assertFalse(problems)
+            self.assertEqual(sorted(d.name_and_version for d in dists),
+                             ['bar (1.0)', 'foo (1.0)'])
+        # If Range isn't supported, the metadata is left alone
+        server.handler.ranges = False
+        with SimpleScrapingLocator(url, timeout=5.0, scheme='legacy',
+                                   fetch_metadata=True) as locator:
+            dist = locator.locate('foo')
+            self.assertEqual(dist.run_requires, set())
+            self.assertTrue(dist.source_url.endswith('.whl'))
+
+    def test_sdist_metadata(self):
+        pkg_info = ('Metadata-Version: 1.2\nName: foo\nVersion: 1.0\n'
+                    'Requires-Dist: bar (>= 1.0)\n').encode('utf-8')
+        padding = os.urandom(2000000)
+        buf = BytesIO()
+        tf = tarfile.open(fileobj=buf, mode='w:gz')
+        for name, data in (('foo-1.0/PKG-INFO', pkg_info),
+                           ('foo-1.0/data.bin', padding),
+                           ('foo-1.0/foo.egg-info/PKG-INFO', b'')):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, BytesIO(data))
+        tf.close()
+        tarball = buf.getvalue()
+        buf = BytesIO()
+        with zipfile.ZipFile(buf, 'w') as zf:
+            zf.writestr('foo-1.1/data.bin', padding)
+            zf.writestr('foo-1.1/PKG-INFO', pkg_info.replace(b'1.0\n',
+                                                             b'1.1\n', 1))
+        pages = {'/packages/foo-1.0.tar.gz': ('application/x-tar', tarball),
+                 '/packages/foo-1.1.zip': ('application/zip',
+                                           buf.getvalue()),
+                 '/packages/foo-1.2.tar.gz': ('application/x-tar',
+                                              tarball[:100])}
+        server, requests = self.make_index_server(pages)
+        base = 'http://localhost:%d/packages/' % server.port
+
+        class CountingOpener(object):
+            # records the number of bytes of responses read
+            count = 0
+
+            def __init__(self, opener):
+                self.opener = opener
+
+            def open(self, *args, **kwargs):
+                resp = self.opener.open(*args, **kwargs)
+                read = resp.read
+                def counting_read(*args):
+                    result = read(*args)
+                    self.count += len(result)
+                    return result
+                resp.read = counting_read
+                return resp
+
+        with PyPIJSONLocator(base) as locator:
+            opener = CountingOpener(locator.opener)
+            fetcher = MetadataFetcher(opener, timeout=5.0)
+            md = fetcher.get_metadata(base + 'foo-1.0.tar.gz')
+            self.assertEqual(md.version, '1.0')
+            self.assertEqual(md.run_requires, ['bar (>= 1.0)'])
+            self.assertLess(opener.count, len(tarball) / 10)
+            md = fetcher.get_metadata(base + 'foo-1.1.zip')
+            self.assertEqual(md.version, '1.1')
+            self.assertEqual(md.run_requires, ['bar (>= 1.0)'])
+            # truncated or missing archives
+            self.assertIsNone(fetcher.get_metadata(base + 'foo-1.2.tar.gz'))
+            self.assertIsNone(fetcher.get_metadata(base + 'foo-1.3.tar.gz'))
+            self.assertIsNone(fetcher.get_metadata(base + 'foo-1.0.exe'))
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        fn = os.path.join(d, 'foo-1.0.tar.gz')
+        with open(fn, 'wb') as f:
+            f.write(tarball)
+        with DirectoryLocator(d, fetch_metadata=True) as locator:
+            dist = locator.locate('foo')
+            self.assertEqual(dist.run_requires, set(['bar (>= 1.0)']))
+
+    def test_parallel_aggregation(self):
+        pages = {}
+        for name in ('proj0', 'proj1'):
+            pages['/simple/%s/' % name] = ('text/html',
+                                           SIMPLE_PAGE.replace('foo', name))
+        pages['/pypi/proj0/json'] = ('application/json', json.dumps({
+            'info': {'name': 'proj0', 'version': '1.1', 'summary': 'proj0'},
+            'urls': [{'url': 'http://example.com/proj0-1.1.tar.gz',
+                      'md5_digest': '1' * 32}],
+        }))
+        server, requests = self.make_index_server(pages, delay=0.2)
+        base = 'http://localhost:%d/' % server.port
+
+        def make_locator(**kwargs):
+            return AggregatingLocator(PyPIJSONLocator(base + 'pypi/'),
+                                      SimpleScrapingLocator(base + 'simple/',
+                                                            timeout=5.0),
+                                      scheme='legacy', **kwargs)
+
+        with make_locator() as locator:
+            # The first locator's result is used, though both were asked
+            result = locator.get_project('proj0')
+            self.assertEqual(list(result), ['1.1'])
+            self.assertEqual(result['1.1'].source_url,
+                             'http://example.com/proj0-1.1.tar.gz')
+            self.assertEqual(server.handler.max_in_progress, 2)
+            # The second locator's result is used when the first misses
+            result = locator.get_project('proj1')
+            self.assertEqual(sorted(result), ['1.0', '1.1'])
+            locator.clear_cache()
+            dist = locator.locate('proj0 (< 1.1)')
+            self.assertEqual(dist.source_url,
+                             base + 'packages/proj0-1.0.tar.gz')
+        with make_locator(merge=True) as locator:
+            result = locator.get_project('proj0')
+            self.assertEqual(sorted(result), ['1.0', '1.1'])
+            # as when asking in turn, later locators take precedence
+            self.assertEqual(result['1.1'].source_url,
+                             base + 'packages/proj0-1.1.tar.gz')
+        server.handler.max_in_progress = 0
+        with make_locator(parallel=False) as locator:
+            result = locator.get_project('proj0')
+            self.assertEqual(list(result), ['1.1'])
+            self.assertEqual(server.handler.max_in_progress, 1)
+
+    def make_rpc_server(self, versions, multicall=True):
+        """
+        Start a local XML-RPC server with the PyPI methods used by
+        PyPIRPCLocator, for a project 'foo' with the specified versions.
+        Return the server, whose ``requests`` attribute counts the HTTP
+        requests it handles and ``max_in_progress`` the most it handled at
+        once.
+        """
+        class Server(ThreadingMixIn, SimpleXMLRPCServer):
+            daemon_threads = True
+            requests = in_progress = max_in_progress = 0
+            lock = threading.Lock()
+
+            def _marshaled_dispatch(self, *args, **kwargs):
+                with self.lock:
+                    self.requests += 1
+                    self.in_progress += 1
+                    self.max_in_progress = max(self.max_in_progress,
+                                               self.in_progress)
+                try:
+                    time.sleep(0.01)
+                    return SimpleXMLRPCServer._marshaled_dispatch(self, *args,
+                                                                  **kwargs)
+                finally:
+                    with self.lock:
+                        self.in_progress -= 1
+
+        def package_releases(name, show_hidden):
+            return versions if name == 'foo' else []
+
+        def release_urls(name, version):
+            return [{'url': 'http://example.com/foo-%s.tar.gz' % version,
+                     'md5_digest': '%032d' % len(version)}]
+
+        def release_data(name, version):
+            return {'name': name, 'version': version,
+                    'summary': 'Foo %s' % version}
+
+        server = Server(('localhost', 0), logRequests=False)
+        for f in (package_releases, release_urls, release_data):
+            server.register_function(f)
+        if multicall:
+            server.register_multicall_functions()
+        t = threading.Thread(target=server.serve_forever, args=(0.05,))
+        t.daemon = True
+        t.start()
+        def cleanup():
+            server.shutdown()
+            t.join()
+            server.server_close()
+        self.addCleanup(cleanup)
+        return server
+
+    def test_xmlrpc_multicall(self):
+        versions = ['1.%d' % i for i in range(50)]
+        server = self.make_rpc_server(versions)
+        url = 'http://localhost:%d/' % server.server_address[1]
+        with PyPIRPCLocator(url, batch_size=40) as locator:
+            result = locator.get_project('foo')
+            self.assertEqual(sorted(result), sorted(versions))
+            dist = result['1.10']
+            self.assertEqual(dist.name_and_version, 'foo (1.10)')
+            self.assertEqual(dist.metadata.summary, 'Foo 1.10')
+            self.assertEqual(dist.source_url,
+                             'http://example.com/foo-1.10.tar.gz')
+            self.assertEqual(dist.digest, ('md5', '%032d' % 4))
+            # one call for the versions, then three multicalls
+            self.assertEqual(server.requests, 4)
+            self.assertEqual(locator.get_project('bar'), {})
+        # Without multicall, calls are made concurrently
+        server = self.make_rpc_server(versions, multicall=False)
+        url = 'http://localhost:%d/' % server.server_address[1]
+        with PyPIRPCLocator(url, num_workers=4) as locator:
+            result = locator.get_project('foo')
+            self.assertFalse(locator.use_multicall)
+            self.assertEqual(sorted(result), sorted(versions))
+            self.assertEqual(result['1.10'].source_url,
+                             'http://example.com/foo-1.10.tar.gz')
+            # the failed multicall, then the calls themselves
+            self.assertEqual(server.requests, 2 + 2 * len(versions))
+            self.assertGreater(server.max_in_progress, 1)
+            self.assertLessEqual(server.max_in_progress, 4)
 
     @unittest.skipIf('SKIP_SLOW' in os.environ, 'Skipping slow test')
     def test_xmlrpc(self):
@@ -117,6 +1052,84 @@ class LocatorTestCase(unittest.TestCase):
             expected.add('config')
         self.assertEqual(names, expected)
 
+    def test_dir_index(self):
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        sub = os.path.join(d, 'sub')
+        os.mkdir(sub)
+        for fn in ('foo-1.0.tar.gz', 'bar-baz-2.0.zip',
+                   os.path.join('sub', 'Bar_Baz-2.1.tar.gz')):
+            with open(os.path.join(d, fn), 'wb') as f:
+                pass
+        # the index can be saved in the tree it indexes
+        index_path = os.path.join(d, 'index.json')
+        builds = []
+
+        class Locator(DirectoryLocator):
+            def _build_index(self):
+                builds.append(self)
+                return super(Locator, self)._build_index()
+
+        locator = Locator(d, index_path=index_path)
+        self.assertEqual(set(locator.get_project('foo')), set(['1.0']))
+        self.assertEqual(set(locator.get_project('bar-baz')),
+                         set(['2.0', '2.1']))
+        self.assertEqual(locator.get_distribution_names(),
+                         set(['foo', 'bar-baz', 'Bar_Baz']))
+        self.assertEqual(len(builds), 1)
+        self.assertTrue(os.path.exists(index_path))
+        # Another instance uses the saved index
+        locator = Locator(d, index_path=index_path)
+        self.assertEqual(set(locator.get_project('bar_baz')),
+                         set(['2.0', '2.1']))
+        self.assertEqual(len(builds), 1)
+        # Adding a file invalidates the index. Make sure the directory's
+        # modification time changes, whatever the filesystem's resolution.
+        fn = os.path.join(sub, 'foo-1.1.tar.gz')
+        with open(fn, 'wb') as f:
+            pass
+        mtime = os.stat(sub).st_mtime + 10
+        os.utime(sub, (mtime, mtime))
+        # by default, the tree is checked on every lookup
+        self.assertEqual(set(locator.get_project('foo')), set(['1.0', '1.1']))
+        self.assertEqual(len(builds), 2)
+        # with no interval, it's checked once
+        locator = Locator(d, index_path=index_path, check_interval=None)
+        checks = []
+        is_valid = locator._is_valid
+        def counting_is_valid(index):
+            checks.append(index)
+            return is_valid(index)
+        locator._is_valid = counting_is_valid
+        for name in ('foo', 'bar-baz', 'quux'):
+            locator.get_project(name)
+        self.assertEqual(len(checks), 1)
+        self.assertEqual(len(builds), 2)
+        # with a short interval, changes are noticed once it's passed
+        locator = Locator(d, check_interval=0.2)
+        names = set(['foo', 'bar-baz', 'Bar_Baz'])
+        self.assertEqual(locator.get_distribution_names(), names)
+        self.assertEqual(len(builds), 3)
+        with open(os.path.join(sub, 'qux-1.0.tar.gz'), 'wb') as f:
+            pass
+        mtime += 10
+        os.utime(sub, (mtime, mtime))
+        self.assertEqual(locator.get_distribution_names(), names)
+        time.sleep(0.25)
+        self.assertEqual(locator.get_distribution_names(),
+                         names | set(['qux']))
+        self.assertEqual(len(builds), 4)
+        # or until the cache is cleared
+        with open(os.path.join(sub, 'quux-1.0.tar.gz'), 'wb') as f:
+            pass
+        mtime += 10
+        os.utime(sub, (mtime, mtime))
+        locator.check_interval = 60
+        self.assertEqual(set(locator.get_project('quux')), set())
+        locator.clear_cache()
+        self.assertEqual(set(locator.get_project('quux')), set(['1.0']))
+        self.assertEqual(len(builds), 5)
+
     def test_dir_nonrecursive(self):
         d = os.path.join(HERE, 'fake_archives')
         locator = DirectoryLocator(d, recursive=False)
@@ -191,6 +1204,388 @@ class LocatorTestCase(unittest.TestCase):
         n2 = loc2.get_distribution_names()
         self.assertEqual(locator.get_distribution_names(), n1 | n2)
 
+    def test_dependency_prefetch(self):
+        tree = {
+            'a': ['b', 'c'],
+            'b': ['d', 'e'],
+            'c': ['f', 'g'],
+            'd': [], 'e': ['f'], 'f': [],
+        }
+        versions = {'g': '1.0a1'}
+
+        class TreeLocator(Locator):
+            batch_workers = 4
+
+            def __init__(self):
+                super(TreeLocator, self).__init__()
+                self.batches = []
+                self.lock = threading.Lock()
+
+            def _get_projects(self, matchers):
+                with self.lock:
+                    self.batches.append(sorted(matchers))
+                return super(TreeLocator, self)._get_projects(matchers)
+
+            def _get_project(self, name):
+                version = versions.get(name, '1.0')
+                dist = make_dist(name, version)
+                dist.metadata.source_url = ('http://example.com/%s-%s.tar.gz'
+                                            % (name, version))
+                reqts = tree.get(name, [])
+                if reqts:
+                    dist.metadata.dependencies = {
+                        'run_requires': [{'requires': reqts}],
+                    }
+                dist.locator = self
+                return {version: dist}
+
+        results = []
+        for prefetch in (False, True):
+            locator = TreeLocator()
+            finder = DependencyFinder(locator, prefetch=prefetch)
+            dists, problems = finder.find('a')
+            self.assertEqual(problems, set())
+            results.append(sorted(d.name_and_version for d in dists))
+            if prefetch:
+                # each level of the tree is got in one batch
+                self.assertEqual(locator.batches,
+                                 [['b', 'c'], ['d', 'e', 'f', 'g']])
+            else:
+                # projects are got one at a time by locate()
+                self.assertEqual(locator.batches, [])
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[1], ['a (1.0)', 'b (1.0)', 'c (1.0)',
+                                      'd (1.0)', 'e (1.0)', 'f (1.0)',
+                                      'g (1.0a1)'])
+
+    def make_tree_locator(self, tree):
+        """
+        Return a locator for a tree of projects, given as a dictionary
+        mapping each project name to a dictionary mapping its versions to
+        their requirements.
+        """
+        class TreeLocator(Locator):
+            def _get_project(self, name):
+                result = {}
+                for version, reqts in tree.get(name, {}).items():
+                    dist = make_dist(name, version)
+                    dist.metadata.source_url = (
+                        'http://example.com/%s-%s.tar.gz' % (name, version))
+                    if reqts:
+                        dist.metadata.dependencies = {
+                            'run_requires': [{'requires': reqts}],
+                        }
+                    dist.locator = self
+                    result[version] = dist
+                return result
+
+        return TreeLocator()
+
+    def test_resolve(self):
+        tree = {
+            'a': {'1.0': ['b', 'c (< 2.0)', 'd']},
+            'b': {'1.0': ['c'], '2.0': ['c (>= 2.0)']},
+            'c': {'1.0': [], '2.0': [], '3.0b1': []},
+        }
+        finder = DependencyFinder(self.make_tree_locator(tree))
+        dists, problems = finder.resolve('a')
+        self.assertEqual(problems, set([('unsatisfied', 'd')]))
+        self.assertEqual(sorted(d.name_and_version for d in dists),
+                         ['a (1.0)', 'b (1.0)', 'c (1.0)'])
+        for dist in dists:
+            self.assertEqual(dist.requested, dist.name == 'a')
+            self.assertFalse(dist.build_time_dependency)
+        self.assertEqual(finder.reqts[finder.dists_by_name['c']],
+                         set(['c', 'c (< 2.0)']))
+        dists, problems = finder.resolve('c (> 2.0)', prereleases=True)
+        self.assertEqual([d.name_and_version for d in dists], ['c (3.0b1)'])
+        # pre-releases are tried once the releases have been
+        dists, problems = finder.resolve('c (> 2.0)')
+        self.assertEqual([d.name_and_version for d in dists], ['c (3.0b1)'])
+
+        # choices which don't cause a conflict aren't revisited
+        tree = {
+            'a': {'1.0': ['p%d' % i for i in range(10)] + ['q', 'r (< 2.0)']},
+            'q': {'1.0': ['r (>= 2.0)'], '2.0': ['r (>= 2.0)']},
+            'r': {'1.0': [], '2.0': []},
+        }
+        for i in range(10):
+            tree['p%d' % i] = {'1.0': [], '2.0': []}
+        finder = DependencyFinder(self.make_tree_locator(tree))
+        dists, problems = finder.resolve('a', max_steps=100)
+        self.assertEqual(dists, set())
+        self.assertEqual(len(problems), 1)
+        kind, reasons = problems.pop()
+        self.assertEqual(kind, 'conflict')
+        self.assertEqual(reasons, set([
+            ('a (1.0)', 'r (< 2.0)'),
+            ('q (1.0)', 'r (>= 2.0)'),
+            ('q (2.0)', 'r (>= 2.0)'),
+        ]))
+        dists, problems = finder.resolve('a', max_steps=10)
+        self.assertEqual(dists, set())
+        self.assertEqual(problems, set([('toomanysteps', 10)]))
+
+        # a Distribution can be passed, as for find()
+        dist = make_dist('x', '1.0')
+        dist.metadata.dependencies = {
+            'run_requires': [{'requires': ['q', 'r (< 2.0)']}],
+        }
+        dists, problems = finder.resolve(dist)
+        self.assertEqual(dists, set())
+        self.assertEqual(problems, set([('conflict', frozenset([
+            ('x (1.0)', 'r (< 2.0)'),
+            ('q (1.0)', 'r (>= 2.0)'),
+            ('q (2.0)', 'r (>= 2.0)'),
+        ]))]))
+        self.assertRaises(DistlibException, finder.resolve, 'nonexistent')
+
+    def test_resolve_backjump(self):
+        # k rules out the version of c chosen, but isn't needed if an
+        # earlier version of a is chosen, so the search mustn't jump back
+        # past a
+        tree = {
+            'r': {'1.0': ['a', 'c']},
+            'a': {'1.0': [], '2.0': ['k']},
+            'c': {'1.0': []},
+            'k': {'1.0': ['c (< 1.0)']},
+        }
+        finder = DependencyFinder(self.make_tree_locator(tree))
+        dists, problems = finder.resolve('r')
+        self.assertEqual(problems, set())
+        self.assertEqual(sorted(d.name_and_version for d in dists),
+                         ['a (1.0)', 'c (1.0)', 'r (1.0)'])
+
+    def test_find_providers(self):
+        finder = DependencyFinder(self.make_tree_locator({'y': {'1.0': []}}))
+        dists = {}
+        for version in ('2.0', '1.0', '3.0b1', '1.5', '1.0.0'):
+            dists[version] = make_dist('X', version)
+            finder.add_distribution(dists[version])
+        tests = (
+            ('x', ['3.0b1']),
+            ('x (< 2.0)', ['1.5']),
+            ('x (<= 2.0, != 2.0)', ['1.5']),
+            ('x (>= 1.0, < 1.5)', ['1.0.0']),
+            ('x (== 1.0)', ['1.0.0']),
+            ('x (== 1.*)', ['1.5']),
+            ('x (> 3.0)', []),
+            ('y', []),
+        )
+        for reqt, expected in tests:
+            result = finder.find_providers(reqt)
+            self.assertEqual([d.version for d in result], expected)
+        finder.remove_distribution(dists['1.5'])
+        result = finder.find_providers('x (< 2.0)')
+        self.assertEqual([d.version for d in result], ['1.0.0'])
+        # matchers and versions are only parsed once
+        matcher = finder.get_matcher('x (< 2.0)')
+        self.assertIs(finder.get_matcher('x (< 2.0)'), matcher)
+        self.assertIs(finder.get_version('1.0'), finder.get_version('1.0'))
+        self.assertTrue(finder.match(matcher, '1.0'))
+        self.assertFalse(finder.match(matcher, '2.0'))
+        self.assertFalse(finder.match(matcher, 'not a version'))
+        # but not across finds, so that they don't accumulate
+        finder.find('y')
+        self.assertIsNot(finder.get_matcher('x (< 2.0)'), matcher)
+
+    def test_find_all(self):
+        tree = {
+            'a': {'1.0': ['c (< 2.0)']},
+            'b': {'1.0': ['c']},
+            'c': {'1.0': [], '2.0': []},
+            'd': {'1.0': ['e (>= 2.0)']},
+            'e': {'1.0': [], '2.0': []},
+        }
+        requirements = ['b', 'a', 'e (< 2.0)', 'd', 'x']
+        for prefetch in (False, True):
+            finder = DependencyFinder(self.make_tree_locator(tree),
+                                      prefetch=prefetch)
+            dists, problems = finder.find_all(requirements)
+            self.assertEqual(sorted(d.name_and_version for d in dists),
+                             ['a (1.0)', 'b (1.0)', 'c (1.0)', 'd (1.0)',
+                              'e (1.0)'])
+            by_name = finder.dists_by_name
+            for dist in dists:
+                self.assertEqual(dist.requested, dist.name != 'c')
+            # the roots share the providers they find
+            self.assertEqual(finder.reqts[by_name['c']],
+                             set(['c', 'c (< 2.0)']))
+            # a requirement which conflicts with a root is reported
+            self.assertEqual(len(problems), 2)
+            self.assertIn(('unsatisfied', 'x'), problems)
+            problems.remove(('unsatisfied', 'x'))
+            kind, provider, other, unmatched = problems.pop()
+            self.assertEqual(kind, 'cantreplace')
+            self.assertEqual(provider.name_and_version, 'e (2.0)')
+            self.assertIs(other, by_name['e'])
+            self.assertEqual(unmatched, set(['e (< 2.0)']))
+            self.assertEqual(finder.provenance, {
+                by_name['a']: set(['a']),
+                by_name['b']: set(['b']),
+                by_name['c']: set(['a', 'b']),
+                by_name['d']: set(['d']),
+                by_name['e']: set(['e (< 2.0)']),
+            })
+
+        # a Distribution can be passed as a root
+        dist = make_dist('y', '1.0')
+        dist.metadata.dependencies = {
+            'run_requires': [{'requires': ['c']}],
+        }
+        dists, problems = finder.find_all([dist, 'c (>= 2.0)'])
+        self.assertEqual(problems, set())
+        self.assertEqual(sorted(d.name_and_version for d in dists),
+                         ['c (2.0)', 'y (1.0)'])
+        self.assertEqual(finder.provenance, {
+            dist: set([dist]),
+            finder.dists_by_name['c']: set([dist, 'c (>= 2.0)']),
+        })
+
+        # results are cached as for find(), with the provenance worked out
+        # again from the cached distributions
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        locator = self.make_tree_locator(tree)
+        locator.fingerprint = 'tree'
+        finder = DependencyFinder(locator, cache=ResolutionCache(d))
+        finder.find_all(requirements)
+        self.assertEqual(len(os.listdir(d)), 0)     # conflicts aren't cached
+        requirements = ['b', 'a']
+        expected = finder.find_all(requirements)
+        provenance = finder.provenance
+        self.assertEqual(len(os.listdir(d)), 1)
+        locator._get_project = None
+        locator.clear_cache()
+        self.assertEqual(finder.find_all(requirements), expected)
+        self.assertEqual(finder.provenance, provenance)
+        self.assertNotEqual(finder.get_cache_key(requirements, mode='find_all'),
+                            finder.get_cache_key(['a', 'b'], mode='find_all'))
+
+    def test_resolution_cache(self):
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        tree = {
+            'a': {'1.0': ['b (< 2.0)', 'c']},
+            'b': {'1.0': [], '2.0': []},
+        }
+        calls = []
+        locator = self.make_tree_locator(tree)
+        get_project = locator._get_project
+        def counting_get_project(name):
+            calls.append(name)
+            return get_project(name)
+        locator._get_project = counting_get_project
+        cache = ResolutionCache(os.path.join(d, 'cache'))
+        # without a fingerprint, results can't be cached
+        self.assertRaises(DistlibException, DependencyFinder, locator,
+                          cache=cache)
+        locator.fingerprint = 'snapshot-1'
+        finder = DependencyFinder(locator, cache=cache)
+        key = finder.get_cache_key('a')
+        self.assertNotEqual(key, finder.get_cache_key('a', [':test:']))
+        self.assertNotEqual(key, finder.get_cache_key('a', prereleases=True))
+        self.assertNotEqual(key, finder.get_cache_key('a', mode='resolve'))
+        expected = finder.find('a')
+        expected_reqts = finder.reqts
+        self.assertIsNotNone(cache.get(key))
+        locator.clear_cache()
+        del calls[:]
+        finder = DependencyFinder(locator, cache=cache)
+        dists, problems = finder.find('a')
+        self.assertEqual(calls, [])
+        # the finder is left as it would be without the cache
+        self.assertEqual(finder.reqts, expected_reqts)
+        self.assertEqual(finder.reqts[finder.dists_by_name['b']],
+                         set(['b (< 2.0)']))
+        self.assertEqual(problems, set([('unsatisfied', 'c')]))
+        self.assertEqual(problems, expected[1])
+        self.assertEqual(sorted(d.name_and_version for d in dists),
+                         ['a (1.0)', 'b (1.0)'])
+        for dist in dists:
+            self.assertEqual(dist.requested, dist.name == 'a')
+            self.assertFalse(dist.build_time_dependency)
+            self.assertEqual(dist.source_url,
+                             'http://example.com/%s-1.0.tar.gz' % dist.name)
+        # a changed fingerprint means the locator is asked again
+        locator.fingerprint = 'snapshot-2'
+        DependencyFinder(locator, cache=cache).resolve('a')
+        self.assertEqual(sorted(set(calls)), ['a', 'b', 'c'])
+        # conflicts aren't cached
+        tree['a']['1.0'] = ['b (> 2.0)']
+        locator.clear_cache()
+        locator.fingerprint = 'snapshot-3'
+        finder = DependencyFinder(locator, cache=cache)
+        self.assertEqual(finder.resolve('a')[1],
+                         set([('conflict', frozenset([('a (1.0)',
+                                                       'b (> 2.0)')]))]))
+        self.assertIsNone(cache.get(finder.get_cache_key('a',
+                                                         mode='resolve')))
+        self.assertEqual(cache.clear(), [])
+        self.assertIsNone(cache.get(key))
+
+        # locks
+        path = os.path.join(d, 'lock.json')
+        save_lock(path, *expected)
+        dists, problems = load_lock(path)
+        self.assertEqual(problems, expected[1])
+        self.assertEqual(sorted(d.name_and_version for d in dists),
+                         ['a (1.0)', 'b (1.0)'])
+        self.assertEqual(verify_lock(dists, locator), set())
+        del tree['b']['1.0']
+        locator.clear_cache()
+        missing = verify_lock(dists, locator)
+        self.assertEqual([dist.name_and_version for dist in missing],
+                         ['b (1.0)'])
+        self.assertRaises(DistlibException, save_lock, path, dists,
+                          set([('cantreplace', None, None, frozenset())]))
+
+        # fingerprints of local data
+        archives = os.path.join(HERE, 'fake_archives')
+        loc1 = DirectoryLocator(archives)
+        self.assertEqual(loc1.get_fingerprint(),
+                         DirectoryLocator(archives).get_fingerprint())
+        self.assertNotEqual(loc1.get_fingerprint(),
+                            DirectoryLocator(archives, recursive=False)
+                            .get_fingerprint())
+        loc2 = DirectoryLocator(os.path.join(archives, 'subdir'))
+        self.assertIsNotNone(AggregatingLocator(loc1,
+                                                loc2).get_fingerprint())
+        self.assertIsNone(AggregatingLocator(loc1, Locator()).get_fingerprint())
+        path = os.path.join(d, 'snapshot')
+        build_snapshot(loc1, path)
+        with SnapshotLocator(path) as snapshot:
+            self.assertTrue(snapshot.get_fingerprint())
+            loc1.fingerprint = 'fixed'
+            self.assertEqual(loc1.get_fingerprint(), 'fixed')
+
+        # With a page cache, an index's pages are revalidated to check that
+        # a cached result is still current
+        pages = {'/simple/foo/': ('text/html', SIMPLE_PAGE)}
+        server, requests = self.make_index_server(pages)
+        url = 'http://localhost:%d/simple/' % server.port
+        self.assertRaises(DistlibException, DependencyFinder,
+                          SimpleScrapingLocator(url), cache=cache)
+        page_cache = PageCache(os.path.join(d, 'pages'))
+
+        def find(requirement):
+            locator = SimpleScrapingLocator(url, timeout=5.0,
+                                            page_cache=page_cache)
+            finder = DependencyFinder(locator, cache=cache)
+            dists, problems = finder.find(requirement)
+            return sorted(dist.name_and_version for dist in dists)
+
+        self.assertEqual(find('foo'), ['foo (1.1)'])
+        self.assertEqual(len(os.listdir(cache.base)), 1)
+        del requests[:]
+        self.assertEqual(find('foo'), ['foo (1.1)'])
+        self.assertEqual(requests, [('/simple/foo/', 304)])
+        pages['/simple/foo/'] = ('text/html',
+                                 SIMPLE_PAGE.replace('1.1', '1.2'))
+        del requests[:]
+        self.assertEqual(find('foo'), ['foo (1.2)'])
+        self.assertEqual(requests[0], ('/simple/foo/', 200))
+
     def test_dependency_finder(self):
         locator = AggregatingLocator(
             JSONLocator(),
@@ -9,24 +9,30 @@ from itertools import islice
 import os
 import re
 import shutil
+import socket
 import sys
 import tempfile
 import textwrap
+import threading
 import time
+import zlib
 
-from compat import unittest
+from compat import unittest, SimpleHTTPRequestHandler
 
-from support import TempdirManager
+from support import TempdirManager, HTTPServerThread
 
 from distlib import DistlibException
-from distlib.compat import cache_from_source,  Container
+from distlib.compat import (cache_from_source,  Container, build_opener,
+                            HTTPError, URLError, Request)
 from distlib.util import (get_export_entry, ExportEntry, resolve,
                           get_cache_base, path_to_cache_dir, zip_dir,
                           parse_credentials, ensure_slash, split_filename,
                           EventMixin, Sequencer, unarchive, Progress,
                           iglob, RICH_GLOB, parse_requirement, get_extras,
                           Configurator, read_exports, write_exports,
-                          FileOperator, is_string_sequence, get_package_data)
+                          FileOperator, is_string_sequence, get_package_data,
+                          WorkerPool, Future, ConnectionPool,
+                          PooledHTTPHandler, HostScheduler, LRUCache)
 
 
 HERE = os.path.dirname(os.path.abspath(__file__))
@@ -516,6 +522,255 @@ class UtilTestCase(unittest.TestCase):
         self.assertEqual(cfg['d'], {'foo': 'bar', 'bar': 'baz'})
         self.assertEqual(cfg['e'], {'foo': 'bar', 'bar': 'baz'})
 
+    def test_worker_pool(self):
+        def fail():
+            raise ValueError('oops')
+
+        before = threading.active_count()
+        with WorkerPool(3) as pool:
+            # threads are started lazily
+            self.assertEqual(threading.active_count(), before)
+            futures = [pool.submit(pow, i, 2) for i in range(20)]
+            self.assertEqual([f.result() for f in futures],
+                             [i * i for i in range(20)])
+            self.assertEqual(threading.active_count(), before + 3)
+            f = pool.submit(fail)
+            self.assertRaises(ValueError, f.result)
+            self.assertIsInstance(f.exception(), ValueError)
+            called = []
+            f.add_done_callback(called.append)
+            self.assertEqual(called, [f])
+        self.assertEqual(threading.active_count(), before)
+        self.assertRaises(DistlibException, pool.submit, pow, 2, 2)
+        f = Future()
+        self.assertFalse(f.done())
+        self.assertRaises(DistlibException, f.result, 0.01)
+        self.assertTrue(f.cancel())
+        f.set_result(1)
+        self.assertTrue(f.cancelled())
+        self.assertRaises(DistlibException, f.result)
+        self.assertFalse(f.set_running())
+        # a call which has started can't be cancelled
+        f = Future()
+        self.assertTrue(f.set_running())
+        self.assertTrue(f.running())
+        self.assertFalse(f.cancel())
+        f.set_result(2)
+        self.assertFalse(f.running())
+        self.assertEqual(f.result(), 2)
+        self.assertTrue(f.wait(0.01))
+        self.assertFalse(Future().wait(0.01))
+
+        # callables are run in order of priority, then of submission
+        started = threading.Event()
+        release = threading.Event()
+        def block():
+            started.set()
+            release.wait(5.0)
+        order = []
+        with WorkerPool(1) as pool:
+            pool.submit(block)
+            started.wait(5.0)
+            for name, priority in (('a', 1), ('b', 0), ('c', 1), ('d', 0)):
+                pool.submit_priority(priority, order.append, name)
+            pool.submit(order.append, 'e')
+            release.set()
+        self.assertEqual(order, ['b', 'd', 'e', 'a', 'c'])
+
+    def test_connection_pool(self):
+        class Handler(SimpleHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            clients = set()
+
+            def do_GET(self):
+                self.clients.add(self.client_address)
+                if self.path == '/slow':
+                    self.requests.append(self.path)
+                    time.sleep(0.5)
+                if self.path == '/missing':
+                    code, data = 404, b'not found'
+                else:
+                    code, data = 200, self.path.encode('ascii')
+                self.send_response(code)
+                self.send_header('Content-Type', 'text/plain')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                # the body is read, then the connection is dropped
+                length = int(self.headers['Content-Length'])
+                self.rfile.read(length)
+                self.requests.append(self.path)
+                self.close_connection = True
+
+            def log_message(self, *args):
+                pass
+
+        Handler.requests = []
+        sthread = HTTPServerThread(Handler, threaded=True)
+        sthread.start()
+        pool = ConnectionPool()
+        try:
+            opener = build_opener(PooledHTTPHandler(pool))
+            base = 'http://localhost:%d' % sthread.port
+            for path in ('/a', '/b', '/missing', '/c'):
+                try:
+                    resp = opener.open(base + path)
+                except HTTPError as e:
+                    self.assertEqual(e.code, 404)
+                    self.assertEqual(e.read(), b'not found')
+                    e.close()
+                else:
+                    self.assertEqual(resp.getcode(), 200)
+                    self.assertEqual(resp.geturl(), base + path)
+                    self.assertEqual(resp.read(), path.encode('ascii'))
+                    resp.close()
+            # all the requests were made over a single connection
+            self.assertEqual(len(Handler.clients), 1)
+            # a response which isn't read in full isn't reused
+            opener.open(base + '/d').close()
+            self.assertEqual(opener.open(base + '/e').read(), b'/e')
+            self.assertEqual(len(Handler.clients), 2)
+            # idle connections which have timed out aren't reused
+            pool.idle_timeout = -1
+            self.assertEqual(opener.open(base + '/f').read(), b'/f')
+            self.assertEqual(len(Handler.clients), 3)
+            # a request which isn't idempotent isn't sent again if a reused
+            # connection is closed, as the server may have acted on it
+            pool.idle_timeout = 60
+            self.assertEqual(opener.open(base + '/g').read(), b'/g')
+            self.assertRaises(URLError, opener.open,
+                              Request(base + '/upload', data=b'data'))
+            self.assertEqual(Handler.requests, ['/upload'])
+            # and a request which times out isn't retried
+            self.assertEqual(opener.open(base + '/h').read(), b'/h')
+            self.assertRaises(URLError, opener.open, base + '/slow',
+                              timeout=0.2)
+            self.assertEqual(Handler.requests, ['/upload', '/slow'])
+        finally:
+            pool.close()
+            sthread.stop()
+
+    def test_host_scheduler(self):
+        # rate limiting
+        scheduler = HostScheduler(rate=100, burst=2)
+        self.assertEqual(scheduler.reserve('a'), 0)
+        self.assertEqual(scheduler.reserve('a'), 0)
+        delay = scheduler.reserve('a')
+        self.assertTrue(0 < delay <= 0.01)
+        self.assertTrue(scheduler.reserve('a') > delay)
+        self.assertEqual(scheduler.reserve('b'), 0)  # limits are per host
+
+        # retries
+        scheduler = HostScheduler(backoff=0.01, max_retries=2,
+                                  failure_threshold=2, cooldown=0.2)
+        calls = []
+        def flaky(exc, failures):
+            calls.append(exc)
+            if len(calls) <= failures:
+                raise exc
+            return len(calls)
+
+        body = BytesIO(b'unavailable')
+        transient = HTTPError('http://a/', 503, 'unavailable', {}, body)
+        self.assertEqual(scheduler.call('a', flaky, transient, 2), 3)
+        # errors which are retried are closed, so their connections can be
+        # reused
+        self.assertTrue(body.closed)
+        del calls[:]
+        self.assertRaises(HTTPError, scheduler.call, 'a', flaky, transient, 3)
+        self.assertEqual(len(calls), 3)
+        self.assertTrue(scheduler.is_available('a'))
+        # errors which aren't transient aren't retried
+        del calls[:]
+        not_found = HTTPError('http://a/', 404, 'not found', {}, None)
+        self.assertRaises(HTTPError, scheduler.call, 'a', flaky, not_found, 1)
+        self.assertEqual(len(calls), 1)
+        del calls[:]
+        self.assertRaises(ValueError, scheduler.call, 'a', flaky,
+                          ValueError('oops'), 1)
+        self.assertEqual(len(calls), 1)
+
+        # circuit breaker
+        refused = URLError(socket.error('refused'))
+        for i in range(2):
+            del calls[:]
+            self.assertRaises(URLError, scheduler.call, 'b', flaky, refused,
+                              10)
+        self.assertFalse(scheduler.is_available('b'))
+        self.assertTrue(scheduler.is_available('a'))
+        time.sleep(0.25)
+        # half-open: one trial call is allowed through
+        self.assertTrue(scheduler.is_available('b'))
+        self.assertFalse(scheduler.is_available('b'))
+        del calls[:]
+        self.assertEqual(scheduler.call('b', flaky, refused, 0), 1)
+        self.assertTrue(scheduler.is_available('b'))
+
+        # a trial call which fails for a reason which has nothing to do with
+        # the host doesn't leave the circuit stuck open
+        for i in range(2):
+            del calls[:]
+            self.assertRaises(URLError, scheduler.call, 'c', flaky, refused,
+                              10)
+        time.sleep(0.25)
+        self.assertTrue(scheduler.is_available('c'))
+        del calls[:]
+        self.assertRaises(zlib.error, scheduler.call, 'c', flaky,
+                          zlib.error('bad data'), 1)
+        self.assertTrue(scheduler.is_available('c'))
+
+        # Retry-After is honoured
+        busy = HTTPError('http://a/', 429, 'busy', {'Retry-After': '5'}, None)
+        self.assertEqual(scheduler.retry_delay(0, busy), 5)
+        self.assertIsNone(scheduler.retry_delay(2, busy))
+
+    def test_lru_cache(self):
+        cache = LRUCache(max_entries=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(cache['a'], 1)    # 'a' is now the most recent
+        cache['c'] = 3
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.get('b', 'missing'), 'missing')
+        self.assertRaises(KeyError, lambda: cache['b'])
+        self.assertEqual(sorted(['a', 'c']), sorted(cache._entries))
+        self.assertEqual(cache.stats, {'hits': 1, 'misses': 2,
+                                       'evictions': 1, 'expirations': 0,
+                                       'entries': 2, 'bytes': 0})
+        del cache['a']
+        self.assertEqual(len(cache), 1)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+        # size limit
+        cache = LRUCache(max_bytes=10, sizeof=lambda k, v: len(v))
+        cache['a'] = 'x' * 4
+        cache['b'] = 'x' * 4
+        cache['a'] = 'x' * 5   # replacing an entry updates the size
+        self.assertEqual(cache.stats['bytes'], 9)
+        cache['c'] = 'x' * 2
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.stats['bytes'], 7)
+        cache['d'] = 'x' * 11  # too big to keep at all
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.stats['evictions'], 4)
+
+        # expiry, with a shorter time-to-live for negative results
+        cache = LRUCache(ttl=0.5, negative_ttl=0.1)
+        cache['found'] = {'1.0': 'dist'}
+        cache['not found'] = {}
+        cache['failed'] = None
+        self.assertIn('failed', cache)
+        time.sleep(0.2)
+        self.assertNotIn('not found', cache)
+        self.assertEqual(cache.get('failed', 'missing'), 'missing')
+        self.assertEqual(cache['found'], {'1.0': 'dist'})
+        self.assertEqual(cache.stats['expirations'], 1)
+        time.sleep(0.4)
+        self.assertNotIn('found', cache)
+
 
 def _speed_range(min_speed, max_speed):
     return tuple(['%d KB/s' % v for v in range(min_speed,
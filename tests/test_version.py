@@ -251,6 +251,11 @@ class VersionTestCase(unittest.TestCase):
             m = NM(s)
             self.assertEqual(m.exact_version is not None, b)
 
+        # Test constraints
+        self.assertEqual(NM('Dummy').constraints, ())
+        self.assertEqual(NM('Dummy (>= 1.0, != 1.1.*)').constraints,
+                         (('>=', NV('1.0'), False), ('!=', '1.1', True)))
+
     def test_matcher_name(self):
         # Test that names are parsed the right way
 